@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from toolkit.admin import BaseAdmin, AuthorMixin
 from core.models import (
@@ -10,12 +10,17 @@ from core.models import (
     DeviceInstance,
     CustomerOrder,
     OrderDevice,
+    OrderRoom,
     DeviceMetric,
+    DeviceStat,
+    DeviceDailyStat,
     Investment,
     Payment,
     PaymentCard,
-    InvestmentStatSnapshot
+    InvestmentStatSnapshot,
+    OutboxEvent
 )
+from core.utils.order_transitions import transition_orders
 
 
 @admin.register(Company)
@@ -89,10 +94,10 @@ class DeviceInstanceAdmin(AuthorMixin, BaseAdmin):
     )
     fields = (
         'device_type', 'room', 'customer', 'status', 'serial_number', 'internal_code',
-        'is_power_on', 'installation_date', 'last_service_date',
+        'is_power_on', 'installation_date', 'last_service_date', 'funded_usd',
         'created_at', 'updated_at', 'created_by', 'updated_by'
     )
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('funded_usd', 'created_at', 'updated_at')
     raw_id_fields = ('device_type', 'room', 'customer')
 
 
@@ -102,15 +107,47 @@ class OrderDeviceInline(admin.TabularInline):
     raw_id_fields = ('device',)
 
 
+class OrderRoomInline(admin.TabularInline):
+    model = OrderRoom
+    extra = 0
+    fields = ('room', 'cost_usd')
+    readonly_fields = ('room', 'cost_usd')
+    can_delete = False
+
+
 @admin.register(CustomerOrder)
 class CustomerOrderAdmin(AuthorMixin, BaseAdmin):
-    list_display = ('id', 'customer', 'room', 'status', 'comment', 'created_at', 'updated_at')
+    list_display = ('id', 'customer', 'room', 'status', 'total_cost', 'comment', 'created_at', 'updated_at')
     list_filter = ('status', 'created_at', 'updated_at')
     search_fields = ('customer__email', 'customer__username', 'room__name', 'comment')
-    fields = ('customer', 'room', 'status', 'comment', 'created_at', 'updated_at', 'created_by', 'updated_by')
-    readonly_fields = ('created_at', 'updated_at')
+    fields = ('customer', 'room', 'status', 'total_cost', 'comment', 'created_at', 'updated_at', 'created_by', 'updated_by')
+    readonly_fields = ('total_cost', 'created_at', 'updated_at')
     raw_id_fields = ('customer', 'room')
-    inlines = [OrderDeviceInline]
+    inlines = [OrderRoomInline, OrderDeviceInline]
+    actions = ('mark_approved', 'mark_installed', 'mark_active', 'mark_cancelled')
+
+    def transition(self, request, queryset, status):
+        result = transition_orders(queryset.values_list('id', flat=True), status, request.user)
+        self.message_user(request, f"Статус {status} установлен для заказов: {len(result['updated'])}")
+        if result['rejected']:
+            rejected = ', '.join(f'#{pk} ({current})' for pk, current in sorted(result['rejected'].items()))
+            self.message_user(request, f'Недопустимый переход для заказов: {rejected}', messages.WARNING)
+
+    @admin.action(description='Перевести в APPROVED', permissions=['change'])
+    def mark_approved(self, request, queryset):
+        self.transition(request, queryset, CustomerOrder.STATUS_APPROVED)
+
+    @admin.action(description='Перевести в INSTALLED', permissions=['change'])
+    def mark_installed(self, request, queryset):
+        self.transition(request, queryset, CustomerOrder.STATUS_INSTALLED)
+
+    @admin.action(description='Перевести в ACTIVE', permissions=['change'])
+    def mark_active(self, request, queryset):
+        self.transition(request, queryset, CustomerOrder.STATUS_ACTIVE)
+
+    @admin.action(description='Перевести в CANCELLED', permissions=['change'])
+    def mark_cancelled(self, request, queryset):
+        self.transition(request, queryset, CustomerOrder.STATUS_CANCELLED)
 
 
 @admin.register(OrderDevice)
@@ -141,6 +178,23 @@ class DeviceMetricAdmin(AuthorMixin, BaseAdmin):
     date_hierarchy = 'timestamp'
 
 
+@admin.register(DeviceStat)
+class DeviceStatAdmin(AuthorMixin, BaseAdmin):
+    list_display = ('id', 'device', 'cleaned_air_volume_m3', 'humidity_hours', 'metrics_count', 'updated_at')
+    search_fields = ('device__serial_number', 'device__internal_code')
+    fields = ('device', 'cleaned_air_volume_m3', 'humidity_hours', 'metrics_count', 'created_at', 'updated_at')
+    readonly_fields = ('device', 'cleaned_air_volume_m3', 'humidity_hours', 'metrics_count', 'created_at', 'updated_at')
+
+
+@admin.register(DeviceDailyStat)
+class DeviceDailyStatAdmin(AuthorMixin, BaseAdmin):
+    list_display = ('id', 'device', 'date', 'cleaned_air_volume_m3', 'humidity_hours', 'metrics_count', 'updated_at')
+    list_filter = ('date',)
+    search_fields = ('device__serial_number', 'device__internal_code')
+    fields = ('device', 'date', 'cleaned_air_volume_m3', 'humidity_hours', 'metrics_count', 'created_at', 'updated_at')
+    readonly_fields = fields
+
+
 @admin.register(Investment)
 class InvestmentAdmin(AuthorMixin, BaseAdmin):
     list_display = ('id', 'investor', 'device', 'amount_usd', 'status', 'paid_at', 'created_at', 'updated_at')
@@ -194,3 +248,11 @@ class InvestmentStatSnapshotAdmin(AuthorMixin, BaseAdmin):
     raw_id_fields = ('investment', 'device')
     date_hierarchy = 'timestamp'
 
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(BaseAdmin):
+    list_display = ('id', 'topic', 'status', 'attempts', 'available_at', 'processed_at', 'created_at')
+    list_filter = ('topic', 'status', 'created_at')
+    search_fields = ('topic', 'last_error')
+    fields = ('topic', 'payload', 'status', 'attempts', 'available_at', 'processed_at', 'last_error', 'created_at')
+    readonly_fields = ('topic', 'payload', 'attempts', 'processed_at', 'last_error', 'created_at')
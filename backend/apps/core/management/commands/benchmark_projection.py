@@ -0,0 +1,36 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import DeviceType
+from core.utils import projection
+
+
+class Command(BaseCommand):
+    help = 'Measures Monte Carlo projection time for a synthetic portfolio'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--positions', type=int, default=50, help='Investments in the portfolio')
+        parser.add_argument('--paths', type=int, default=projection.PATHS, help='Simulated paths')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs')
+
+    def handle(self, *args, **options):
+        device_type_ids = list(DeviceType.objects.values_list('id', flat=True)[:5]) or [0]
+        positions = [{
+            'amount_usd': 100 + index, 'profit_percentage': 25, 'period_months': 6,
+            'device_type_id': device_type_ids[index % len(device_type_ids)], 'start_date': timezone.localdate(),
+        } for index in range(options['positions'])]
+        projection.simulate(positions, paths=options['paths'])  # калибровка попадает в кэш
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = perf_counter()
+            projection.simulate(positions, paths=options['paths'])
+            timings.append((perf_counter() - started) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f"{options['positions']} positions x {options['paths']} paths: "
+            f"min {timings[0]:.1f} ms, median {timings[len(timings) // 2]:.1f} ms, max {timings[-1]:.1f} ms"
+        )
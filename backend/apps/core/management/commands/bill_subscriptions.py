@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.utils import billing
+
+
+class Command(BaseCommand):
+    help = 'Bills due ACTIVE subscriptions in this process (the beat task spreads the same work over workers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=billing.CHUNK_SIZE)
+        parser.add_argument('--no-collect', action='store_true', help='Only create PENDING payments')
+
+    def handle(self, *args, **options):
+        until = timezone.now() + billing.BILLING_WINDOW
+        on_chunk = None if options['no_collect'] else billing.collect
+        billed = sum(
+            billing.bill_range(start_id, end_id, until, options['chunk_size'], on_chunk)
+            for start_id, end_id in billing.plan_partitions(until)
+        )
+        self.stdout.write(self.style.SUCCESS(f'Billed {billed} subscriptions'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.utils import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Computes InvestmentStatSnapshot rows for all paid investments and prunes old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=snapshots.CHUNK_SIZE, help='Investments per query')
+        parser.add_argument(
+            '--retention-days', type=int, default=snapshots.SNAPSHOT_RETENTION_DAYS, help='Keep snapshots for N days'
+        )
+
+    def handle(self, *args, **options):
+        created = snapshots.compute_snapshots(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} investment snapshots'))
+        deleted = snapshots.prune_snapshots(retention_days=options['retention_days'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} old investment snapshots'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.utils import device_stats
+
+
+class Command(BaseCommand):
+    help = 'Checks DeviceStat counters against device metrics and rebuilds them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift, do not rebuild')
+        parser.add_argument('--tolerance', type=float, default=0.01, help='Allowed cleaned air drift, m3')
+
+    def handle(self, *args, **options):
+        drift = device_stats.find_drift(tolerance=options['tolerance'])
+        for row in drift:
+            self.stdout.write(
+                f"Device {row['device_id']}: "
+                f"cleaned air {row['stored_cleaned_air_volume_m3']} != {row['actual_cleaned_air_volume_m3']}, "
+                f"humidity hours {row['stored_humidity_hours']} != {row['actual_humidity_hours']}, "
+                f"metrics {row['stored_metrics_count']} != {row['actual_metrics_count']}"
+            )
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Device stats are consistent'))
+            return
+
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} devices have drifted counters'))
+            return
+
+        with transaction.atomic():
+            rows = device_stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters of {rows} devices'))
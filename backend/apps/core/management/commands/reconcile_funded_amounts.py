@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.utils import funding
+
+
+class Command(BaseCommand):
+    help = 'Checks DeviceInstance.funded_usd against pending and paid investments and fixes drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift, do not fix')
+
+    def handle(self, *args, **options):
+        drift = funding.find_drift()
+        for row in drift:
+            self.stdout.write(f"Device {row['device_id']}: funded {row['stored_funded_usd']} != {row['actual_funded_usd']}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Funded amounts are consistent'))
+            return
+
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} devices have drifted funded amounts'))
+            return
+
+        with transaction.atomic():
+            rows = funding.reconcile()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled funded amounts of {rows} devices'))
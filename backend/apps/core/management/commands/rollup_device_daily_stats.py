@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.utils import device_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes DeviceDailyStat rows for the last N days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='Number of days to recompute, including today')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        rows = device_stats.rollup_days(today - timedelta(days=options['days'] - 1), today)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rows} device days'))
@@ -0,0 +1,75 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from core.utils.payment_gateway import DECLINED_CARD_LAST4
+
+
+def make_handler(latency, fail_rate):
+    responses = {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, как у настоящего процессора
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path != '/charges':
+                return self.respond(404, {'error': 'Not found'})
+
+            if latency:
+                time.sleep(latency)
+            if random.random() < fail_rate:
+                return self.respond(503, {'error': 'Temporarily unavailable'})
+
+            # Повтор с тем же Idempotency-Key получает тот же ответ
+            key = self.headers.get('Idempotency-Key')
+            with lock:
+                if key not in responses:
+                    payload = json.loads(body or b'{}')
+                    if payload.get('card_last4') == DECLINED_CARD_LAST4:
+                        responses[key] = {'id': None, 'status': 'declined', 'error': 'Card declined'}
+                    else:
+                        responses[key] = {'id': f'TXN-{uuid.uuid4().hex}', 'status': 'succeeded'}
+                response = responses[key]
+            self.respond(200, response)
+
+        def respond(self, status, data):
+            content = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = 'Runs a local payment gateway stub for PAYMENT_GATEWAY_BACKEND=http (tests and benchmarks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency', type=float, default=0.2, help='Response delay in seconds')
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(
+            (options['host'], options['port']), make_handler(options['latency'], options['fail_rate'])
+        )
+        self.stdout.write(self.style.SUCCESS(f'Payment gateway stub on http://{options["host"]}:{options["port"]}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
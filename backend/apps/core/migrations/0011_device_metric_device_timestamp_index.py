@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_alter_subscription_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='devicemetric',
+            index=models.Index(fields=['device', '-timestamp'], name='core_metric_device_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_device_metric_device_timestamp_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True)),
+                ('cleaned_air_volume_m3', models.FloatField(default=0.0)),
+                ('humidity_hours', models.FloatField(default=0.0)),
+                ('metrics_count', models.IntegerField(default=0)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_%(model_name)ss', to=settings.AUTH_USER_MODEL)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stat', to='core.deviceinstance')),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='updated_%(model_name)ss', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'core_device_stats',
+            },
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO core_device_stats (device_id, cleaned_air_volume_m3, humidity_hours, metrics_count, created_at, updated_at)
+            SELECT device_id, COALESCE(SUM(cleaned_air_volume_m3), 0), COUNT(humidity), COUNT(*), NOW(), NOW()
+            FROM core_device_metrics
+            GROUP BY device_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
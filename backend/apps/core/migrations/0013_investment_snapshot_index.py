@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_device_stat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='investmentstatsnapshot',
+            index=models.Index(fields=['investment', '-timestamp'], name='core_snapshot_inv_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_investment_snapshot_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviceinstance',
+            index=models.Index(fields=['status'], name='core_device_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devicetype',
+            index=models.Index(fields=['min_investment_usd'], name='core_type_min_investment_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:24
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_device_status_and_min_investment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deviceinstance',
+            name='funded_usd',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Сумма PENDING и PAID инвестиций, меняется только через core.utils.funding', max_digits=12),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE core_device_instances d
+            SET funded_usd = funded.total
+            FROM (
+                SELECT device_id, SUM(amount_usd) AS total
+                FROM core_investments
+                WHERE status IN ('PENDING', 'PAID')
+                GROUP BY device_id
+            ) funded
+            WHERE d.id = funded.device_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:29
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_device_daily_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderroom',
+            name='cost_usd',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Стоимость комнаты, рассчитанная при создании заказа', max_digits=12),
+        ),
+        migrations.RunSQL(
+            """
+            WITH flags AS (
+                SELECT
+                    o.id,
+                    COALESCE(r.volume_m3, 0)::numeric AS volume,
+                    BOOL_OR(COALESCE(t.supports_cleaning, FALSE)) AS cleaning,
+                    BOOL_OR(COALESCE(t.supports_humidifying, FALSE)) AS humidifying,
+                    BOOL_OR(COALESCE(t.supports_aroma, FALSE)) AS aroma
+                FROM core_order_rooms o
+                JOIN core_rooms r ON r.id = o.room_id
+                LEFT JOIN core_order_room_device_types ot ON ot.order_room_id = o.id
+                LEFT JOIN core_device_types t ON t.id = ot.device_type_id
+                GROUP BY o.id, r.volume_m3
+            )
+            UPDATE core_order_rooms o
+            SET cost_usd = ROUND(flags.volume * (
+                CASE WHEN flags.cleaning THEN 0.10 ELSE 0 END
+                + CASE WHEN flags.humidifying THEN 0.10 ELSE 0 END
+                + CASE WHEN flags.aroma AND NOT (flags.cleaning AND flags.humidifying) THEN 0.05 ELSE 0 END
+            ), 2)
+            FROM flags
+            WHERE flags.id = o.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE core_customer_orders c
+            SET total_cost = rooms.total
+            FROM (SELECT order_id, SUM(cost_usd) AS total FROM core_order_rooms GROUP BY order_id) rooms
+            WHERE rooms.order_id = c.id AND c.total_cost IS NULL
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_order_room_cost'),
+    ]
+
+    operations = [
+        # Внутренние коды устройств выдаются пачками (core.utils.provisioning)
+        migrations.RunSQL(
+            'CREATE SEQUENCE IF NOT EXISTS core_device_internal_code_seq',
+            'DROP SEQUENCE IF EXISTS core_device_internal_code_seq',
+        ),
+    ]
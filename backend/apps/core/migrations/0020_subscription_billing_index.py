@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_outbox_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['status', 'next_payment_date'], name='core_sub_status_next_pay_idx'),
+        ),
+    ]
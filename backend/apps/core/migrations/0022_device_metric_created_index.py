@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_payment_refund_required'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='devicemetric',
+            index=models.Index(fields=['device', 'created_at'], name='core_metric_device_created_idx'),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.db.models import CASCADE
 from decimal import Decimal
 
 from core.querysets.company import CompanyQuerySet
+from core.querysets.device import DeviceInstanceQuerySet
+from core.querysets.investment import InvestmentQuerySet
 from toolkit.models import BaseModel
 
 
@@ -72,9 +74,13 @@ class Room(BaseModel):
     city = models.CharField(max_length=255, null=True, blank=True)
     notes = models.TextField(null=True, blank=True)
 
-    def save(self, *args, **kwargs):
+    def fill_volume(self):
+        # Вызывается и для комнат, создаваемых через bulk_create, где save() не выполняется
         if self.ceiling_height_m and not self.volume_m3:
             self.volume_m3 = self.area_m2 * self.ceiling_height_m
+
+    def save(self, *args, **kwargs):
+        self.fill_volume()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -138,6 +144,11 @@ class DeviceType(BaseModel):
 
     class Meta:
         db_table = "core_device_types"
+        indexes = [
+            models.Index(
+                fields=["min_investment_usd"], name="core_type_min_investment_idx"
+            ),
+        ]
 
 
 class DeviceInstance(BaseModel):
@@ -171,12 +182,36 @@ class DeviceInstance(BaseModel):
     is_power_on = models.BooleanField(default=True)
     installation_date = models.DateTimeField(null=True, blank=True)
     last_service_date = models.DateTimeField(null=True, blank=True)
+    funded_usd = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        help_text="Сумма PENDING и PAID инвестиций, меняется только через core.utils.funding",
+    )
+
+    objects = DeviceInstanceQuerySet.as_manager()
+
+    tracked_fields = ("status", "is_power_on", "room", "device_type", "customer")
+
+    def save(self, *args, **kwargs):
+        # Счётчик funded_usd меняется атомарными UPDATE, обычное сохранение
+        # загруженного устройства не должно перезаписывать его устаревшим значением
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "funded_usd"
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.device_type.name} - {self.serial_number or self.internal_code}"
 
     class Meta:
         db_table = "core_device_instances"
+        indexes = [
+            models.Index(fields=["status"], name="core_device_status_idx"),
+        ]
 
 
 class CustomerOrder(BaseModel):
@@ -215,25 +250,27 @@ class CustomerOrder(BaseModel):
         Room, through="OrderRoom", related_name="order_rooms"
     )
 
+    tracked_fields = ("status",)
+
     def save(self, *args, **kwargs):
         """
         Переопределяем save для автоматической активации подписки при изменении статуса заказа на ACTIVE.
+        Исходный статус запоминается при загрузке заказа (BaseModel.tracked_fields), без запроса перед сохранением.
         """
-        # Сохраняем старый статус для проверки
-        old_status = None
-        if self.pk:
-            try:
-                old_order = CustomerOrder.objects.get(pk=self.pk)
-                old_status = old_order.status
-            except CustomerOrder.DoesNotExist:
-                pass
-
-        # Сохраняем заказ
+        update_fields = kwargs.get("update_fields")
+        status_changed = self.has_changed("status") and (
+            update_fields is None or "status" in update_fields
+        )
+
         super().save(*args, **kwargs)
 
         # Если статус изменился на ACTIVE, активируем подписку
-        if old_status != self.status and self.status == self.STATUS_ACTIVE:
+        if status_changed and self.status == self.STATUS_ACTIVE:
+            from core.utils import outbox
+            from core.utils.order_events import ORDER_ACTIVATED
+
             self._activate_subscription()
+            outbox.publish(ORDER_ACTIVATED, {"order_id": self.id})
 
     def _activate_subscription(self):
         """
@@ -256,44 +293,16 @@ class CustomerOrder(BaseModel):
 
     def calculate_total_cost(self):
         """
-        Рассчитывает общую стоимость заказа на основе комнат и услуг.
-        Логика: 0.10 USD за м³ для очистки/увлажнения, 0.05 USD за м³ для арома.
+        Рассчитывает общую стоимость заказа на основе комнат и услуг одним запросом.
+        Логика: 0.10 USD за м³ для очистки/увлажнения, 0.05 USD за м³ для арома (core.utils.pricing).
+        При создании заказа стоимость сохраняется в total_cost и OrderRoom.cost_usd,
+        пересчёт нужен только для заказов без сохранённой стоимости.
         """
-        from decimal import Decimal
-
-        total = Decimal("0.00")
-
-        for order_room in self.order_rooms.all():
-            room = order_room.room
-            volume_m3 = Decimal(str(room.volume_m3 or 0))
-
-            # Получаем услуги из OrderRoomDeviceType (определяем по типам устройств)
-            has_cleaning = False
-            has_humidifying = False
-            has_aroma = False
-
-            for order_room_device_type in order_room.order_room_device_types.all():
-                device_type = order_room_device_type.device_type
-                if device_type.supports_cleaning:
-                    has_cleaning = True
-                if device_type.supports_humidifying:
-                    has_humidifying = True
-                if device_type.supports_aroma:
-                    has_aroma = True
-
-            # Если есть и cleaning, и humidifying, арома добавляется автоматически
-            if has_cleaning and has_humidifying:
-                has_aroma = True
-
-            # Расчет стоимости
-            if has_cleaning:
-                total += volume_m3 * Decimal("0.10")
-            if has_humidifying:
-                total += volume_m3 * Decimal("0.10")
-            if has_aroma and not (has_cleaning and has_humidifying):
-                # Арома отдельно только если не в подарок
-                total += volume_m3 * Decimal("0.05")
+        from core.utils.pricing import room_cost_expression
 
+        total = OrderRoom.objects.filter(order=self).aggregate(
+            total=models.Sum(room_cost_expression())
+        )["total"] or Decimal("0.00")
         return total
 
     def __str__(self):
@@ -323,6 +332,12 @@ class OrderRoom(BaseModel):
         through="OrderRoomDeviceType",
         related_name="order_room_device_types",
     )
+    cost_usd = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        help_text="Стоимость комнаты, рассчитанная при создании заказа",
+    )
 
     def __str__(self):
         return f"{self.order} - {self.room}"
@@ -363,6 +378,55 @@ class DeviceMetric(BaseModel):
     class Meta:
         db_table = "core_device_metrics"
         ordering = ["-timestamp"]
+        indexes = [
+            models.Index(
+                fields=["device", "-timestamp"], name="core_metric_device_ts_idx"
+            ),
+            # Дельта-режим списка устройств: метрики, записанные сервером после курсора
+            models.Index(
+                fields=["device", "created_at"], name="core_metric_device_created_idx"
+            ),
+        ]
+
+
+class DeviceStat(BaseModel):
+    """
+    Накопительные счётчики устройства по всем его метрикам.
+    Обновляются в той же транзакции, что и приём метрики (core.utils.device_stats.record_metric),
+    сверяются командой rebuild_device_stats.
+    """
+
+    device = models.OneToOneField(DeviceInstance, CASCADE, related_name="stat")
+    cleaned_air_volume_m3 = models.FloatField(default=0.0)
+    # Количество метрик с влажностью (одна метрика - один час увлажнения)
+    humidity_hours = models.FloatField(default=0.0)
+    metrics_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Stat - {self.device_id}"
+
+    class Meta:
+        db_table = "core_device_stats"
+
+
+class DeviceDailyStat(BaseModel):
+    """
+    Дневные итоги метрик устройства (дата в TIME_ZONE проекта).
+    Пересчитываются задачей core.tasks.rollup_device_daily_stats, источник для временных рядов портфеля.
+    """
+
+    device = models.ForeignKey(DeviceInstance, CASCADE, related_name="daily_stats")
+    date = models.DateField()
+    cleaned_air_volume_m3 = models.FloatField(default=0.0)
+    humidity_hours = models.FloatField(default=0.0)
+    metrics_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Daily stat - {self.device_id} - {self.date}"
+
+    class Meta:
+        db_table = "core_device_daily_stats"
+        unique_together = [["device", "date"]]
 
 
 class Investment(BaseModel):
@@ -385,6 +449,8 @@ class Investment(BaseModel):
     )
     paid_at = models.DateTimeField(null=True, blank=True)
 
+    objects = InvestmentQuerySet.as_manager()
+
     def __str__(self):
         return f"Investment #{self.id} - {self.investor.email} - {self.amount_usd} USD"
 
@@ -424,10 +490,13 @@ class Payment(BaseModel):
     STATUS_PENDING = "PENDING"
     STATUS_PAID = "PAID"
     STATUS_FAILED = "FAILED"
+    # Деньги списаны, но заказ изменился во время оплаты (отменён администратором) - нужен возврат
+    STATUS_REFUND_REQUIRED = "REFUND_REQUIRED"
     STATUS_CHOICES = [
         (STATUS_PENDING, "Pending"),
         (STATUS_PAID, "Paid"),
         (STATUS_FAILED, "Failed"),
+        (STATUS_REFUND_REQUIRED, "Refund required"),
     ]
 
     # Связь с инвестицией (для инвесторов)
@@ -483,6 +552,12 @@ class InvestmentStatSnapshot(BaseModel):
     class Meta:
         db_table = "core_investment_stat_snapshots"
         ordering = ["-timestamp"]
+        indexes = [
+            models.Index(
+                fields=["investment", "-timestamp"],
+                name="core_snapshot_inv_ts_idx",
+            ),
+        ]
 
 
 class Subscription(BaseModel):
@@ -516,6 +591,8 @@ class Subscription(BaseModel):
         null=True, blank=True, help_text="Дата отмены подписки"
     )
 
+    tracked_fields = ("status", "cancelled_at")
+
     def __str__(self):
         return (
             f"Subscription #{self.id} - Order #{self.order.id} - {self.customer.email}"
@@ -524,3 +601,50 @@ class Subscription(BaseModel):
     class Meta:
         db_table = "core_subscriptions"
         ordering = ["-created_at"]
+        indexes = [
+            # Поиск подписок к списанию (core.utils.billing)
+            models.Index(
+                fields=["status", "next_payment_date"],
+                name="core_sub_status_next_pay_idx",
+            ),
+        ]
+
+
+class OutboxEvent(BaseModel):
+    """
+    Событие для асинхронной обработки (transactional outbox).
+    Пишется в той же транзакции, что и изменение, которое его порождает,
+    и обрабатывается задачей core.tasks.relay_outbox (core.utils.outbox).
+    """
+
+    STATUS_PENDING = "PENDING"
+    STATUS_DONE = "DONE"
+    STATUS_FAILED = "FAILED"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(help_text="Не обрабатывать раньше (отложенный повтор)")
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
+
+    class Meta:
+        db_table = "core_outbox_events"
+        indexes = [
+            models.Index(
+                fields=["available_at", "id"],
+                condition=models.Q(status="PENDING"),
+                name="core_outbox_pending_idx",
+            ),
+        ]
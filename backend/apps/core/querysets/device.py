@@ -0,0 +1,19 @@
+from django.db.models import Prefetch
+
+from toolkit.querysets.base_queryset import BaseQuerySet
+
+
+def latest_metric_prefetch(lookup='metrics'):
+    """
+    Prefetch только последней метрики каждого устройства (DISTINCT ON device_id).
+    Результат доступен в атрибуте latest_metrics (список из 0 или 1 элемента).
+    """
+    from core.models import DeviceMetric
+
+    queryset = DeviceMetric.objects.order_by('device_id', '-timestamp').distinct('device_id')
+    return Prefetch(lookup, queryset=queryset, to_attr='latest_metrics')
+
+
+class DeviceInstanceQuerySet(BaseQuerySet):
+    def with_last_metric(self):
+        return self.prefetch_related(latest_metric_prefetch())
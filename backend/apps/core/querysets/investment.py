@@ -0,0 +1,47 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from toolkit.querysets.base_queryset import BaseQuerySet
+
+
+class InvestmentQuerySet(BaseQuerySet):
+    def paid(self):
+        return self.filter(status=self.model.STATUS_PAID)
+
+    def with_stats(self):
+        """
+        Аннотирует накопительные показатели устройства и поля последнего снимка статистики,
+        чтобы InvestmentSerializer не делал запросов на каждую инвестицию.
+        """
+        from core.models import InvestmentStatSnapshot
+
+        latest_snapshot = InvestmentStatSnapshot.objects.filter(investment=OuterRef('pk')).order_by('-timestamp')
+        return self.annotate(
+            stat_cleaned_air_m3=Coalesce(F('device__stat__cleaned_air_volume_m3'), Value(0.0)),
+            stat_humidified_hours=Coalesce(F('device__stat__humidity_hours'), Value(0.0)),
+            snapshot_return_amount=Subquery(latest_snapshot.values('projected_return_amount')[:1]),
+            snapshot_return_date=Subquery(latest_snapshot.values('projected_return_date')[:1]),
+        )
+
+    def portfolio_totals(self):
+        """
+        Итоги портфеля по инвестициям из queryset.
+        Объём воздуха и часы увлажнения берутся из накопительных счётчиков DeviceStat,
+        поэтому стоимость не зависит от количества метрик.
+        """
+        from core.models import DeviceStat
+
+        totals = self.aggregate(
+            total_invested=Sum('amount_usd'),
+            devices_count=Count('device', distinct=True),
+        )
+        stats = DeviceStat.objects.filter(device_id__in=self.values('device_id')).aggregate(
+            cleaned_air_volume_m3=Sum('cleaned_air_volume_m3'),
+            humidity_hours=Sum('humidity_hours'),
+        )
+        return {
+            'total_invested': totals['total_invested'] or 0,
+            'devices_count': totals['devices_count'],
+            'cleaned_air_volume_m3': stats['cleaned_air_volume_m3'] or 0,
+            'humidity_hours': stats['humidity_hours'] or 0,
+        }
@@ -1,9 +1,43 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from django.db import models
-from toolkit.utils.serializers import BaseModelSerializer
+from toolkit.utils.serializers import BaseModelSerializer, BaseSerializer
 from core.models import CustomerOrder, Room, OrderRoom, OrderRoomDeviceType, DeviceType
 from core.serializers.room import RoomSerializer
 from core.serializers.device import DeviceTypeSerializer, DeviceInstanceSerializer
+from core.signals import CACHE_DEVICES
+from core.utils.catalog import get_catalog
+from core.utils.pricing import room_cost
+from toolkit.utils.cache import bump_version
+
+
+def validate_order_rooms(rooms_data):
+    """
+    Проверяет все комнаты заказа до записи в БД и подбирает типы устройств.
+    Возвращает список (данные комнаты, id типов устройств).
+    """
+    room_attrs = [
+        {key: value for key, value in room_data.items() if key not in ('services', 'device_type_ids')}
+        for room_data in rooms_data
+    ]
+    room_serializer = RoomSerializer(data=room_attrs, many=True)
+    room_serializer.is_valid(raise_exception=True)
+
+    # Каталог типов устройств из памяти: подбор и проверка id без запросов к БД
+    catalog = get_catalog()
+    result = []
+    for room_data, room in zip(rooms_data, room_serializer.validated_data):
+        # Услуги (новый формат) или device_type_ids (старый формат для обратной совместимости)
+        services = room_data.get('services') or []
+        if services:
+            device_type_ids = catalog.select_for_services(services, room['area_m2'])
+        else:
+            device_type_ids = room_data.get('device_type_ids') or []
+        for device_type_id in device_type_ids:
+            if device_type_id not in catalog.by_id:
+                raise serializers.ValidationError(f'DeviceType with id {device_type_id} does not exist')
+        result.append((room, list(dict.fromkeys(device_type_ids))))
+    return result
 
 
 class OrderRoomDeviceTypeSerializer(BaseModelSerializer):
@@ -18,7 +52,7 @@ class OrderRoomDeviceTypeSerializer(BaseModelSerializer):
 
 class OrderRoomSerializer(BaseModelSerializer):
     room = RoomSerializer(read_only=True)
-    device_types = serializers.SerializerMethodField()
+    device_types = DeviceTypeSerializer(many=True, read_only=True)
     # Для записи: принимаем данные комнаты и список услуг
     name = serializers.CharField(write_only=True, required=False)
     room_type = serializers.CharField(write_only=True, required=False)
@@ -48,19 +82,15 @@ class OrderRoomSerializer(BaseModelSerializer):
         allow_null=True
     )
 
-    def get_device_types(self, obj):
-        # obj - это OrderRoom, получаем типы устройств через ManyToMany связь
-        device_types = obj.device_types.all()
-        return DeviceTypeSerializer(device_types, many=True).data
-
     class Meta:
         model = OrderRoom
         fields = (
-            'id', 'room', 'room_id', 'device_types', 'device_type_ids', 'services',
+            'id', 'room', 'room_id', 'device_types', 'device_type_ids', 'services', 'cost_usd',
             'name', 'room_type', 'area_m2', 'ceiling_height_m',
             'address', 'city', 'notes'
         )
-        read_only_fields = ('id',)
+        read_only_fields = ('id', 'cost_usd')
+        expandable_fields = ('room', 'device_types')
 
 
 class CustomerOrderSerializer(BaseModelSerializer):
@@ -72,7 +102,8 @@ class CustomerOrderSerializer(BaseModelSerializer):
         required=False,
         allow_null=True
     )
-    rooms = serializers.SerializerMethodField()
+    # OrderRoom объекты заказа, а не Room
+    rooms = OrderRoomSerializer(source='order_rooms', many=True, read_only=True)
     devices = DeviceInstanceSerializer(many=True, read_only=True)
     comment = serializers.CharField(required=False, allow_blank=True)
     # Для создания заказа с несколькими комнатами
@@ -82,10 +113,8 @@ class CustomerOrderSerializer(BaseModelSerializer):
         required=False
     )
 
-    def get_rooms(self, obj):
-        # Получаем OrderRoom объекты, а не Room
-        order_rooms = obj.order_rooms.all()
-        return OrderRoomSerializer(order_rooms, many=True).data
+    def validate_rooms_data(self, rooms_data):
+        return validate_order_rooms(rooms_data)
 
     def create(self, validated_data):
         from django.db import transaction
@@ -94,176 +123,84 @@ class CustomerOrderSerializer(BaseModelSerializer):
         logger = logging.getLogger(__name__)
         
         # Убираем rooms_data из validated_data, так как это не поле модели
-        rooms_data = validated_data.pop('rooms_data', None)
+        rooms_data = validated_data.pop('rooms_data', None) or []
+        customer = validated_data['customer']
         
-        logger.info(f'Creating order with {len(rooms_data) if rooms_data else 0} rooms')
-        
-        # ВСЕ операции в одной транзакции, чтобы гарантировать атомарность
+        # ВСЕ операции в одной транзакции, чтобы гарантировать атомарность.
+        # Комнаты и связи вставляются пачками, число запросов не зависит от количества комнат
         with transaction.atomic():
-            # Создаем ОДИН заказ
+            # Стоимость комнат считается в памяти по каталогу и сохраняется вместе с заказом
+            catalog = get_catalog()
+            rooms = [Room(customer=customer, **room_data) for room_data, _ in rooms_data]
+            costs = []
+            for room, (_, device_type_ids) in zip(rooms, rooms_data):
+                room.fill_volume()
+                costs.append(room_cost(room.volume_m3, [catalog.by_id[pk] for pk in device_type_ids]))
+            if rooms:
+                validated_data['total_cost'] = sum(costs, Decimal('0.00'))
+            
             order = CustomerOrder.objects.create(**validated_data)
-            logger.info(f'Order {order.id} created')
+            Room.objects.bulk_create(rooms)
             
-            # Обработка нового формата с несколькими комнатами
-            if rooms_data:
-                logger.info(f'Processing {len(rooms_data)} rooms for order {order.id}')
-                for idx, room_data in enumerate(rooms_data):
-                    # Создаем копию, чтобы не изменять исходные данные
-                    room_data_copy = room_data.copy()
-                    
-                    # Получаем услуги (новый формат) или device_type_ids (старый формат для обратной совместимости)
-                    services = room_data_copy.pop('services', [])
-                    device_type_ids = room_data_copy.pop('device_type_ids', [])
-                    
-                    logger.info(f'Processing room {idx + 1}/{len(rooms_data)}: {room_data_copy.get("name", "unnamed")}')
-                    logger.info(f'Services: {services}, Device type IDs: {device_type_ids}')
-                    
-                    # Создаем комнату
-                    room_serializer = RoomSerializer(data=room_data_copy)
-                    room_serializer.is_valid(raise_exception=True)
-                    room = room_serializer.save(customer=validated_data['customer'])
-                    logger.info(f'Room {room.id} created for order {order.id}')
-                    
-                    # Создаем OrderRoom - связь между заказом и комнатой
-                    order_room = OrderRoom.objects.create(order=order, room=room)
-                    logger.info(f'OrderRoom {order_room.id} created linking order {order.id} to room {room.id}')
-                    
-                    # Если указаны услуги, автоматически подбираем девайсы
-                    if services:
-                        device_type_ids = self._select_devices_by_services(services, room.area_m2, logger)
-                        logger.info(f'Selected device types for services {services}: {device_type_ids}')
-                    
-                    # Создаем связи с типами устройств
-                    for device_type_id in device_type_ids:
-                        try:
-                            device_type = DeviceType.objects.get(pk=device_type_id)
-                            OrderRoomDeviceType.objects.create(
-                                order_room=order_room,
-                                device_type=device_type
-                            )
-                            logger.info(f'DeviceType {device_type_id} linked to OrderRoom {order_room.id}')
-                        except DeviceType.DoesNotExist:
-                            from rest_framework.exceptions import ValidationError
-                            raise ValidationError(f'DeviceType with id {device_type_id} does not exist')
+            order_rooms = OrderRoom.objects.bulk_create([
+                OrderRoom(order=order, room=room, cost_usd=cost) for room, cost in zip(rooms, costs)
+            ])
+            OrderRoomDeviceType.objects.bulk_create([
+                OrderRoomDeviceType(order_room=order_room, device_type_id=device_type_id)
+                for order_room, (_, device_type_ids) in zip(order_rooms, rooms_data)
+                for device_type_id in device_type_ids
+            ])
             
-            logger.info(f'Order {order.id} creation completed with {order.order_rooms.count()} rooms')
+            if rooms:
+                # bulk_create не отправляет сигналы комнат
+                bump_version(CACHE_DEVICES, customer.pk)
+            
+            logger.info(
+                'Order %s created with %s rooms and %s device types',
+                order.id, len(rooms), sum(len(device_type_ids) for _, device_type_ids in rooms_data)
+            )
             return order
     
-    def _select_devices_by_services(self, services, area_m2, logger):
-        """
-        Автоматически подбирает девайсы на основе выбранных услуг и площади.
-        
-        Логика:
-        - cleaning (очистка) -> нужен PURIFIER (отдельные девайсы, не COMBO)
-        - humidifying (увлажнение) -> нужен HUMIDIFIER (отдельные девайсы, не COMBO)
-        - aroma (арома) -> нужен AROMA (отдельные девайсы, не COMBO)
-        - Если выбраны cleaning + humidifying -> арома добавляется автоматически (в подарок)
-        - Всегда создаем отдельные девайсы, подбираем несколько для покрытия большой площади
-        """
-        from core.models import DeviceType
-        
-        selected_device_ids = []
-        needs_cleaning = 'cleaning' in services
-        needs_humidifying = 'humidifying' in services
-        needs_aroma = 'aroma' in services
-        
-        # Если выбраны cleaning + humidifying, арома добавляется автоматически
-        if needs_cleaning and needs_humidifying:
-            needs_aroma = True
-            logger.info('Cleaning + Humidifying selected, aroma added as gift')
-        
-        # Всегда подбираем отдельные девайсы (не COMBO)
-        if needs_cleaning:
-            # Сначала пытаемся найти один большой PURIFIER
-            purifier_devices = DeviceType.objects.filter(
-                device_category=DeviceType.DEVICE_PURIFIER,
-                supports_cleaning=True,
-                coverage_area_m2__isnull=False
-            ).filter(
-                models.Q(coverage_area_m2__gte=area_m2) | models.Q(coverage_area_m2__isnull=True)
-            ).order_by('coverage_area_m2')
-            
-            if purifier_devices.exists() and purifier_devices.first().coverage_area_m2 >= area_m2:
-                selected_device_ids.append(purifier_devices.first().id)
-                logger.info(f'Selected PURIFIER device {purifier_devices.first().id} for area {area_m2} m²')
-            else:
-                # Если один не покрывает, подбираем несколько
-                all_purifiers = DeviceType.objects.filter(
-                    device_category=DeviceType.DEVICE_PURIFIER,
-                    supports_cleaning=True,
-                    coverage_area_m2__isnull=False
-                ).order_by('-coverage_area_m2')
-                
-                total_coverage = 0
-                for device in all_purifiers:
-                    if total_coverage < area_m2:
-                        selected_device_ids.append(device.id)
-                        total_coverage += device.coverage_area_m2
-                        logger.info(f'Selected PURIFIER device {device.id} (coverage: {device.coverage_area_m2} m²) for area {area_m2} m²')
-        
-        if needs_humidifying:
-            # Сначала пытаемся найти один большой HUMIDIFIER
-            humidifier_devices = DeviceType.objects.filter(
-                device_category=DeviceType.DEVICE_HUMIDIFIER,
-                supports_humidifying=True,
-                coverage_area_m2__isnull=False
-            ).filter(
-                models.Q(coverage_area_m2__gte=area_m2) | models.Q(coverage_area_m2__isnull=True)
-            ).order_by('coverage_area_m2')
-            
-            if humidifier_devices.exists() and humidifier_devices.first().coverage_area_m2 >= area_m2:
-                selected_device_ids.append(humidifier_devices.first().id)
-                logger.info(f'Selected HUMIDIFIER device {humidifier_devices.first().id} for area {area_m2} m²')
-            else:
-                # Если один не покрывает, подбираем несколько
-                all_humidifiers = DeviceType.objects.filter(
-                    device_category=DeviceType.DEVICE_HUMIDIFIER,
-                    supports_humidifying=True,
-                    coverage_area_m2__isnull=False
-                ).order_by('-coverage_area_m2')
-                
-                total_coverage = 0
-                for device in all_humidifiers:
-                    if total_coverage < area_m2:
-                        selected_device_ids.append(device.id)
-                        total_coverage += device.coverage_area_m2
-                        logger.info(f'Selected HUMIDIFIER device {device.id} (coverage: {device.coverage_area_m2} m²) for area {area_m2} m²')
-        
-        if needs_aroma:
-            # Сначала пытаемся найти один большой AROMA
-            aroma_devices = DeviceType.objects.filter(
-                device_category=DeviceType.DEVICE_AROMA,
-                supports_aroma=True,
-                coverage_area_m2__isnull=False
-            ).filter(
-                models.Q(coverage_area_m2__gte=area_m2) | models.Q(coverage_area_m2__isnull=True)
-            ).order_by('coverage_area_m2')
-            
-            if aroma_devices.exists() and aroma_devices.first().coverage_area_m2 >= area_m2:
-                selected_device_ids.append(aroma_devices.first().id)
-                logger.info(f'Selected AROMA device {aroma_devices.first().id} for area {area_m2} m²')
-            else:
-                # Если один не покрывает, подбираем несколько
-                all_aromas = DeviceType.objects.filter(
-                    device_category=DeviceType.DEVICE_AROMA,
-                    supports_aroma=True,
-                    coverage_area_m2__isnull=False
-                ).order_by('-coverage_area_m2')
-                
-                total_coverage = 0
-                for device in all_aromas:
-                    if total_coverage < area_m2:
-                        selected_device_ids.append(device.id)
-                        total_coverage += device.coverage_area_m2
-                        logger.info(f'Selected AROMA device {device.id} (coverage: {device.coverage_area_m2} m²) for area {area_m2} m²')
-        
-        return selected_device_ids
-
     class Meta:
         model = CustomerOrder
         fields = (
             'id', 'room', 'room_id', 'rooms', 'rooms_data',
-            'status', 'comment', 'created_at', 'devices'
+            'status', 'comment', 'total_cost', 'created_at', 'devices'
         )
-        read_only_fields = ('id', 'status', 'created_at', 'devices')
+        read_only_fields = ('id', 'status', 'total_cost', 'created_at', 'devices')
+        expandable_fields = ('room', 'rooms', 'devices')
+
+
+class OrderQuoteSerializer(BaseSerializer):
+    rooms_data = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_rooms_data(self, rooms_data):
+        return validate_order_rooms(rooms_data)
+
+    def quote(self):
+        """
+        Расчёт по проверенным комнатам целиком в памяти: объём комнаты,
+        типы устройств из каталога и стоимость по core.utils.pricing.
+        """
+        catalog = get_catalog()
+        rooms = []
+        total = Decimal('0.00')
+        for room_data, device_type_ids in self.validated_data['rooms_data']:
+            room = Room(**room_data)
+            room.fill_volume()
+            device_types = [catalog.by_id[device_type_id] for device_type_id in device_type_ids]
+            cost = room_cost(room.volume_m3, device_types)
+            total += cost
+            rooms.append({
+                'name': room.name,
+                'area_m2': room.area_m2,
+                'volume_m3': room.volume_m3,
+                'device_types': DeviceTypeSerializer(device_types, many=True).data,
+                'cost_usd': str(cost),
+            })
+        return {'rooms': rooms, 'total_cost': str(total)}
+
 
+class OrderTransitionSerializer(BaseSerializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+    status = serializers.ChoiceField(choices=CustomerOrder.STATUS_CHOICES)
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from toolkit.utils.serializers import BaseModelSerializer
 from core.models import DeviceInstance, DeviceType, DeviceMetric
+from core.querysets.device import latest_metric_prefetch
+from core.serializers.room import RoomSerializer
 
 
 class DeviceTypeSerializer(BaseModelSerializer):
@@ -19,21 +21,22 @@ class DeviceMetricSerializer(BaseModelSerializer):
 
 class DeviceInstanceSerializer(BaseModelSerializer):
     device_type = DeviceTypeSerializer(read_only=True)
-    room = serializers.SerializerMethodField()
+    room = RoomSerializer(read_only=True)
     is_power_on = serializers.BooleanField(default=True)
     last_metric = serializers.SerializerMethodField()
-
-    def get_room(self, obj):
-        if obj.room:
-            from core.serializers.room import RoomSerializer
-            return RoomSerializer(obj.room).data
-        return None
+    # Догенерировать устаревшую метрику при чтении (демо-данные для дашборда клиента)
+    refresh_metrics = True
 
     def get_last_metric(self, obj):
-        from core.utils.metrics_generator import ensure_device_has_recent_metrics
+        from core.utils.metrics_generator import refresh_stale_metric
+        # Последняя метрика берётся из prefetch (DeviceInstanceQuerySet.with_last_metric), если он есть
+        if hasattr(obj, 'latest_metrics'):
+            last_metric = obj.latest_metrics[0] if obj.latest_metrics else None
+        else:
+            last_metric = obj.metrics.order_by('-timestamp').first()
         # Убеждаемся, что есть свежая метрика
-        ensure_device_has_recent_metrics(obj, hours_back=1)
-        last_metric = obj.metrics.order_by('-timestamp').first()
+        if self.refresh_metrics:
+            last_metric = refresh_stale_metric(obj, last_metric, hours_back=1)
         if last_metric:
             return DeviceMetricSerializer(last_metric).data
         return None
@@ -42,4 +45,6 @@ class DeviceInstanceSerializer(BaseModelSerializer):
         model = DeviceInstance
         fields = ('id', 'device_type', 'room', 'status', 'serial_number', 'internal_code', 'is_power_on', 'last_metric', 'installation_date', 'last_service_date')
         read_only_fields = ('id', 'installation_date', 'last_service_date')
+        expandable_fields = ('device_type', 'room')
+        prefetch_fields = {'last_metric': lambda prefix: [latest_metric_prefetch(f'{prefix}metrics')]}
 
@@ -1,11 +1,16 @@
 from rest_framework import serializers
 from toolkit.utils.serializers import BaseModelSerializer
-from core.models import Investment, DeviceInstance, DeviceMetric
+from core.models import Investment, DeviceInstance, DeviceStat
 from core.serializers.device import DeviceInstanceSerializer
 
 
+class InvestmentDeviceSerializer(DeviceInstanceSerializer):
+    """Устройство внутри инвестиции: последняя метрика только читается, без генерации."""
+    refresh_metrics = False
+
+
 class InvestmentSerializer(BaseModelSerializer):
-    device = DeviceInstanceSerializer(read_only=True)
+    device = InvestmentDeviceSerializer(read_only=True)
     device_id = serializers.IntegerField(write_only=True, required=True)
     cleaned_air_m3 = serializers.SerializerMethodField()
     humidified_hours = serializers.SerializerMethodField()
@@ -20,23 +25,29 @@ class InvestmentSerializer(BaseModelSerializer):
             raise serializers.ValidationError("Устройство не найдено или не активно")
         return value
 
+    # Показатели берутся из аннотаций InvestmentQuerySet.with_stats(),
+    # для одиночных объектов без аннотаций - отдельными запросами
     def get_cleaned_air_m3(self, obj):
-        from django.db.models import Sum
-        total = DeviceMetric.objects.filter(device=obj.device).aggregate(
-            total=Sum('cleaned_air_volume_m3')
-        )['total'] or 0
-        return total
+        if hasattr(obj, 'stat_cleaned_air_m3'):
+            return obj.stat_cleaned_air_m3
+        stat = DeviceStat.objects.filter(device_id=obj.device_id).first()
+        return stat.cleaned_air_volume_m3 if stat else 0
 
     def get_humidified_hours(self, obj):
-        from django.db.models import Count
-        count = DeviceMetric.objects.filter(device=obj.device, humidity__isnull=False).count()
-        return count
+        if hasattr(obj, 'stat_humidified_hours'):
+            return obj.stat_humidified_hours
+        stat = DeviceStat.objects.filter(device_id=obj.device_id).first()
+        return stat.humidity_hours if stat else 0
 
     def get_projected_return_usd(self, obj):
+        if hasattr(obj, 'snapshot_return_amount'):
+            return obj.snapshot_return_amount
         snapshot = obj.stat_snapshots.order_by('-timestamp').first()
         return snapshot.projected_return_amount if snapshot else None
 
     def get_projected_return_date(self, obj):
+        if hasattr(obj, 'snapshot_return_date'):
+            return obj.snapshot_return_date
         snapshot = obj.stat_snapshots.order_by('-timestamp').first()
         return snapshot.projected_return_date if snapshot else None
 
@@ -50,9 +61,11 @@ class InvestmentSerializer(BaseModelSerializer):
         model = Investment
         fields = ('id', 'device', 'device_id', 'amount_usd', 'status', 'paid_at', 'cleaned_air_m3', 'humidified_hours', 'projected_return_usd', 'projected_return_date', 'created_at')
         read_only_fields = ('id', 'device', 'status', 'paid_at', 'created_at', 'cleaned_air_m3', 'humidified_hours', 'projected_return_usd', 'projected_return_date')
+        expandable_fields = ('device',)
 
 
 class AvailableDeviceSerializer(DeviceInstanceSerializer):
+    refresh_metrics = False
     min_investment_usd = serializers.SerializerMethodField()
     max_investment_usd = serializers.SerializerMethodField()
     short_projection = serializers.SerializerMethodField()
@@ -78,5 +91,5 @@ class AvailableDeviceSerializer(DeviceInstanceSerializer):
         }
 
     class Meta(DeviceInstanceSerializer.Meta):
-        fields = DeviceInstanceSerializer.Meta.fields + ('min_investment_usd', 'max_investment_usd', 'short_projection')
+        fields = DeviceInstanceSerializer.Meta.fields + ('min_investment_usd', 'max_investment_usd', 'funded_usd', 'short_projection')
 
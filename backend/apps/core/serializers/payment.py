@@ -124,8 +124,8 @@ class PaymentSerializer(BaseModelSerializer):
     Сериализатор для платежей.
     """
     payment_card = PaymentCardSerializer(read_only=True)
-    order_id = serializers.IntegerField(source='order.id', read_only=True)
-    investment_id = serializers.IntegerField(source='investment.id', read_only=True)
+    order_id = serializers.IntegerField(read_only=True)
+    investment_id = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Payment
@@ -135,4 +135,5 @@ class PaymentSerializer(BaseModelSerializer):
             'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'status', 'paid_at', 'created_at', 'updated_at')
+        expandable_fields = ('payment_card',)
 
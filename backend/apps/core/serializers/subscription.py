@@ -31,4 +31,5 @@ class SubscriptionSerializer(BaseModelSerializer):
             'created_at',
             'updated_at',
         )
+        expandable_fields = ('order',)
 
@@ -0,0 +1,98 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import CustomerOrder, DeviceInstance, DeviceMetric, DeviceType, Investment, Payment, PaymentCard, Room, Subscription
+from core.utils.device_stats import record_metric
+from core.utils.telemetry import publish_device_state, publish_metric
+from toolkit.utils.cache import bump_version
+
+# Области кэша клиентских списков (см. CachedListMixin).
+# Заказы и подписки содержат устройства с последней метрикой, поэтому зависят и от "devices".
+CACHE_DEVICES = 'devices'
+CACHE_ORDERS = 'orders'
+CACHE_SUBSCRIPTIONS = 'subscriptions'
+CACHE_PAYMENTS = 'payments'
+# Общий для всех инвесторов список доступных устройств
+CACHE_AVAILABLE_DEVICES = 'available-devices'
+# Данные портфеля инвестора (временной ряд)
+CACHE_INVESTMENTS = 'investments'
+# Каталог типов устройств в памяти процессов (core.utils.catalog)
+CACHE_CATALOG = 'device-catalog'
+
+
+@receiver(post_save, sender=DeviceMetric)
+def invalidate_device_metric(sender, instance, created=False, **kwargs):
+    customer_id = instance.device.customer_id
+    bump_version(CACHE_DEVICES, customer_id)
+    if created:
+        publish_metric(instance, customer_id)
+
+
+@receiver(post_save, sender=DeviceMetric)
+def record_device_stat(sender, instance, created=False, **kwargs):
+    if created:
+        record_metric(instance)
+
+
+# Поля устройства, от которых зависит общий список доступных устройств (кроме funded_usd - см. core.utils.funding)
+AVAILABLE_DEVICE_FIELDS = ('status', 'room', 'device_type')
+
+
+@receiver(post_save, sender=DeviceInstance)
+def invalidate_device(sender, instance, created=False, **kwargs):
+    # При передаче устройства другому клиенту сбрасываются и списки прежнего владельца
+    # (исходное значение ещё не перезаписано: BaseModel.save запоминает его после сигнала)
+    previous_customer_id = instance.__dict__.get('_tracked_original', {}).get('customer')
+    bump_version(CACHE_DEVICES, instance.customer_id, previous_customer_id)
+    # Переключение питания и сервисные поля не меняют список доступных устройств
+    if created or any(instance.has_changed(name) for name in AVAILABLE_DEVICE_FIELDS):
+        bump_version(CACHE_AVAILABLE_DEVICES)
+
+
+@receiver(post_delete, sender=DeviceInstance)
+def invalidate_deleted_device(sender, instance, **kwargs):
+    bump_version(CACHE_DEVICES, instance.customer_id)
+    bump_version(CACHE_AVAILABLE_DEVICES)
+
+
+@receiver([post_save, post_delete], sender=DeviceType)
+def invalidate_device_type(sender, instance, **kwargs):
+    bump_version(CACHE_AVAILABLE_DEVICES)
+    bump_version(CACHE_CATALOG)
+
+
+@receiver(post_save, sender=DeviceInstance)
+def publish_device(sender, instance, **kwargs):
+    publish_device_state(instance)
+
+
+@receiver([post_save, post_delete], sender=Room)
+def invalidate_room(sender, instance, **kwargs):
+    bump_version(CACHE_DEVICES, instance.customer_id)
+    bump_version(CACHE_ORDERS, instance.customer_id)
+
+
+@receiver([post_save, post_delete], sender=CustomerOrder)
+def invalidate_order(sender, instance, **kwargs):
+    bump_version(CACHE_ORDERS, instance.customer_id)
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_subscription(sender, instance, **kwargs):
+    bump_version(CACHE_SUBSCRIPTIONS, instance.customer_id)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_payment(sender, instance, **kwargs):
+    if instance.order_id:
+        bump_version(CACHE_PAYMENTS, instance.order.customer_id)
+
+
+@receiver([post_save, post_delete], sender=PaymentCard)
+def invalidate_payment_card(sender, instance, **kwargs):
+    bump_version(CACHE_PAYMENTS, instance.customer_id)
+
+
+@receiver([post_save, post_delete], sender=Investment)
+def invalidate_investment(sender, instance, **kwargs):
+    bump_version(CACHE_INVESTMENTS, instance.investor_id)
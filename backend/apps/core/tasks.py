@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.utils import billing, device_stats, funding, order_payments, outbox, snapshots
+
+
+@shared_task
+def compute_investment_snapshots():
+    created = snapshots.compute_snapshots()
+    snapshots.prune_snapshots()
+    return created
+
+
+@shared_task
+def rollup_device_daily_stats():
+    # Вчерашний день пересчитывается, чтобы учесть метрики, пришедшие с опозданием
+    today = timezone.localdate()
+    return device_stats.rollup_days(today - timedelta(days=1), today)
+
+
+@shared_task
+def expire_pending_investments():
+    return funding.expire_pending()
+
+
+@shared_task
+def reconcile_order_payments():
+    return order_payments.reconcile()
+
+
+@shared_task
+def relay_outbox():
+    return outbox.relay()
+
+
+@shared_task
+def bill_due_subscriptions():
+    """Делит подписки к списанию на диапазоны id и запускает по задаче на диапазон."""
+    until = timezone.now() + billing.BILLING_WINDOW
+    partitions = billing.plan_partitions(until)
+    for start_id, end_id in partitions:
+        bill_subscription_range.delay(start_id, end_id, until.isoformat())
+    return len(partitions)
+
+
+@shared_task
+def bill_subscription_range(start_id, end_id, until):
+    return billing.bill_range(start_id, end_id, parse_datetime(until), on_chunk=collect_subscription_payments.delay)
+
+
+@shared_task
+def collect_subscription_payments(payment_ids):
+    return billing.collect(payment_ids)
+
+
+@shared_task
+def retry_subscription_payments():
+    return billing.dunning()
@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.models import CustomerOrder, Payment, PaymentCard, Subscription
+from core.tasks import bill_due_subscriptions
+from core.utils import billing
+from core.utils.payment_gateway import DECLINED_CARD_LAST4, UNAVAILABLE_CARD_LAST4
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class BillingTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.due = []
+        for index in range(12):
+            customer = User.objects.create(
+                email=f'customer{index}@freshair.com', username=f'customer{index}@freshair.com', role=User.ROLE_CUSTOMER
+            )
+            PaymentCard.objects.create(
+                customer=customer, card_number_last4=DECLINED_CARD_LAST4 if index == 0 else '4242',
+                cardholder_name='Customer', expiry_month=12, expiry_year=2030, is_default=True
+            )
+            order = CustomerOrder.objects.create(customer=customer, status=CustomerOrder.STATUS_ACTIVE)
+            # Каждая третья подписка ещё не к оплате
+            next_payment_date = now + timedelta(days=10) if index % 3 == 2 else now - timedelta(hours=index)
+            subscription = Subscription.objects.create(
+                customer=customer, order=order, status=Subscription.STATUS_ACTIVE, monthly_amount_usd=15,
+                start_date=now - timedelta(days=30), next_payment_date=next_payment_date
+            )
+            if index % 3 != 2:
+                self.due.append(subscription)
+
+    def test_partitions_cover_due_subscriptions(self):
+        partitions = billing.plan_partitions(timezone.now(), partitions=3)
+        self.assertEqual(3, len(partitions))
+        ids = [subscription.id for subscription in self.due]
+        for subscription_id in ids:
+            self.assertEqual(1, sum(start < subscription_id <= end for start, end in partitions))
+
+    def test_chunk_bills_in_constant_queries(self):
+        until = timezone.now()
+        # SAVEPOINT + SELECT FOR UPDATE + INSERT платежей + UPDATE подписок + RELEASE
+        with self.assertNumQueries(5):
+            last_id, payment_ids = billing.bill_chunk(0, 10 ** 9, until, chunk_size=100)
+
+        self.assertEqual(self.due[-1].id, last_id)
+        self.assertEqual(len(self.due), len(payment_ids))
+        for subscription in self.due:
+            previous = subscription.next_payment_date
+            subscription.refresh_from_db()
+            self.assertEqual(previous + timedelta(days=30), subscription.next_payment_date)
+
+        # Повторный запуск не выставляет период второй раз
+        self.assertEqual((None, []), billing.bill_chunk(0, 10 ** 9, until, chunk_size=100))
+
+    def test_beat_task_bills_and_collects(self):
+        bill_due_subscriptions()
+
+        self.assertEqual(len(self.due), Payment.objects.count())
+        self.assertEqual(len(self.due) - 1, Payment.objects.filter(status=Payment.STATUS_PAID).count())
+        self.assertEqual(1, Payment.objects.filter(status=Payment.STATUS_FAILED).count())
+
+    def age_payments(self, **filters):
+        before = timezone.now() - billing.RETRY_INTERVAL - timedelta(minutes=1)
+        Payment.objects.filter(**filters).update(created_at=before, updated_at=before)
+
+    def test_failed_period_is_retried_then_suspended(self):
+        bill_due_subscriptions()
+        failed = Payment.objects.get(status=Payment.STATUS_FAILED)
+        subscription = Subscription.objects.get(order=failed.order)
+
+        # Повтор не раньше RETRY_INTERVAL
+        self.assertEqual(0, billing.dunning())
+        self.assertEqual(len(self.due), Payment.objects.count())
+
+        for attempt in range(2, billing.MAX_ATTEMPTS + 1):
+            self.age_payments(order=failed.order)
+            self.assertEqual(0, billing.dunning())
+            self.assertEqual(
+                Payment.STATUS_FAILED, Payment.objects.get(external_id=f'{failed.external_id}-{attempt}').status
+            )
+
+        self.age_payments(order=failed.order)
+        billing.dunning()
+        subscription.refresh_from_db()
+        self.assertEqual(Subscription.STATUS_SUSPENDED, subscription.status)
+        self.assertEqual(billing.MAX_ATTEMPTS, Payment.objects.filter(order=failed.order).count())
+
+    def test_retry_charges_new_default_card(self):
+        bill_due_subscriptions()
+        failed = Payment.objects.get(status=Payment.STATUS_FAILED)
+        PaymentCard.objects.filter(customer=failed.order.customer).update(card_number_last4='4242')
+        self.age_payments(order=failed.order)
+
+        self.assertEqual(1, billing.dunning())
+        self.assertEqual(Payment.STATUS_PAID, Payment.objects.get(external_id=f'{failed.external_id}-2').status)
+
+        # Оплаченный период больше не повторяется
+        self.age_payments(order=failed.order)
+        self.assertEqual(0, billing.dunning())
+        self.assertEqual(2, Payment.objects.filter(order=failed.order).count())
+
+    def test_stale_pending_is_resent_with_same_key(self):
+        card = PaymentCard.objects.get(customer=self.due[1].customer)
+        card.card_number_last4 = UNAVAILABLE_CARD_LAST4
+        card.save()
+        bill_due_subscriptions()
+        pending = Payment.objects.get(status=Payment.STATUS_PENDING)
+
+        # Исход неизвестен - платёж не повторяется, пока не зависнет
+        self.assertEqual(0, billing.dunning())
+        card.card_number_last4 = '4242'
+        card.save()
+        self.age_payments(pk=pending.pk)
+
+        self.assertEqual(1, billing.dunning())
+        pending.refresh_from_db()
+        self.assertEqual(Payment.STATUS_PAID, pending.status)
+        self.assertEqual(len(self.due), Payment.objects.count())
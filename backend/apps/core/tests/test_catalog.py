@@ -0,0 +1,151 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import CustomerOrder, DeviceType, OrderRoomDeviceType, Room
+from core.utils.catalog import get_catalog, solve_cover
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class CatalogTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.client.force_authenticate(self.customer)
+        self.small = self.purifier('Small', coverage=20, price=100)
+        self.medium = self.purifier('Medium', coverage=35, price=150)
+        self.large = self.purifier('Large', coverage=60, price=400)
+        self.humidifier = DeviceType.objects.create(
+            name='Humidifier', device_category=DeviceType.DEVICE_HUMIDIFIER, supports_humidifying=True,
+            coverage_area_m2=50, price_usd=80
+        )
+
+    def purifier(self, name, coverage, price):
+        return DeviceType.objects.create(
+            name=name, device_category=DeviceType.DEVICE_PURIFIER, supports_cleaning=True,
+            coverage_area_m2=coverage, price_usd=price
+        )
+
+    def test_solver_picks_cheapest_cover(self):
+        catalog = get_catalog()
+        candidates = catalog.candidates['cleaning']
+
+        # Жадный подбор по убыванию покрытия взял бы Large (400), здесь Small + Medium (250)
+        self.assertEqual({self.small.id, self.medium.id}, set(solve_cover(candidates, 50)))
+        self.assertEqual((self.small.id,), solve_cover(candidates, 15))
+        # Непокрываемая площадь - все типы
+        self.assertEqual(3, len(solve_cover(candidates, 500)))
+
+    def test_catalog_reloads_after_device_type_change(self):
+        catalog = get_catalog()
+        self.assertIs(catalog, get_catalog())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.large.price_usd = 200
+            self.large.save()
+        self.assertEqual((self.large.id,), get_catalog().cover('cleaning', 50))
+
+    def test_order_selects_devices_without_catalog_queries(self):
+        get_catalog()
+        rooms = [
+            {'name': f'Room {i}', 'room_type': 'HOME', 'area_m2': 50, 'services': ['cleaning', 'humidifying']}
+            for i in range(30)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('core:customer-orders'), {'rooms_data': rooms}, format='json')
+
+        self.assertEqual(201, response.status_code, response.data)
+        # Типы устройств в ответе читаются через связи комнат заказа, сам подбор запросов не делает
+        catalog_queries = [
+            q for q in queries.captured_queries
+            if 'FROM "core_device_types"' in q['sql'] and 'core_order_room_device_types' not in q['sql']
+        ]
+        self.assertFalse(catalog_queries)
+        self.assertEqual(90, OrderRoomDeviceType.objects.count())
+
+    def test_order_creation_query_count_does_not_depend_on_rooms(self):
+        from core.serializers.customer_order import CustomerOrderSerializer
+
+        get_catalog()
+
+        def create(rooms_count):
+            rooms = [
+                {'name': f'Room {i}', 'room_type': 'HOME', 'area_m2': 50, 'ceiling_height_m': 3,
+                 'services': ['cleaning'], 'device_type_ids': [self.humidifier.id]}
+                for i in range(rooms_count)
+            ]
+            serializer = CustomerOrderSerializer(data={'rooms_data': rooms})
+            serializer.is_valid(raise_exception=True)
+            with CaptureQueriesContext(connection) as queries:
+                serializer.save(customer=self.customer)
+            return len(queries)
+
+        self.assertEqual(create(1), create(100))
+        self.assertEqual(101, Room.objects.filter(volume_m3=150).count())
+        self.assertEqual(202, OrderRoomDeviceType.objects.count())
+
+    def test_order_validates_rooms_before_writing(self):
+        rooms = [
+            {'name': 'Valid', 'room_type': 'HOME', 'area_m2': 20},
+            {'name': 'Invalid', 'room_type': 'HOME'},
+        ]
+        response = self.client.post(reverse('core:customer-orders'), {'rooms_data': rooms}, format='json')
+        self.assertEqual(400, response.status_code, response.data)
+
+        rooms = [{'name': 'Room', 'room_type': 'HOME', 'area_m2': 20, 'device_type_ids': [0]}]
+        response = self.client.post(reverse('core:customer-orders'), {'rooms_data': rooms}, format='json')
+        self.assertEqual(400, response.status_code, response.data)
+        self.assertFalse(CustomerOrder.objects.exists())
+        self.assertFalse(Room.objects.exists())
+
+    def test_quote_is_computed_in_memory_and_memoized(self):
+        get_catalog()
+        rooms = [
+            {'name': 'Office', 'room_type': 'COMMERCIAL', 'area_m2': 50, 'ceiling_height_m': 3,
+             'services': ['cleaning', 'humidifying']},
+            {'name': 'Hall', 'room_type': 'HOME', 'area_m2': 10, 'ceiling_height_m': 2, 'device_type_ids': [self.small.id]},
+        ]
+        url = reverse('core:customer-order-quote')
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'rooms_data': rooms}, format='json')
+            self.client.post(url, {'rooms_data': rooms}, format='json')
+
+        self.assertEqual(200, response.status_code, response.data)
+        office, hall = response.data['rooms']
+        # 150 м³ × (0.10 очистка + 0.10 увлажнение), арома в подарок без отдельного типа
+        self.assertEqual('30.00', office['cost_usd'])
+        self.assertEqual({self.small.id, self.medium.id, self.humidifier.id}, {item['id'] for item in office['device_types']})
+        self.assertEqual('2.00', hall['cost_usd'])
+        self.assertEqual('32.00', response.data['total_cost'])
+        self.assertFalse(CustomerOrder.objects.exists())
+        self.assertFalse(Room.objects.exists())
+
+    def test_quote_rejects_non_object_body(self):
+        url = reverse('core:customer-order-quote')
+        for body in ([{'name': 'Office'}], 'rooms'):
+            response = self.client.post(url, body, format='json')
+            self.assertEqual(400, response.status_code, response.data)
+
+    def test_order_cost_is_stored_and_matches_sql(self):
+        rooms = [
+            {'name': 'Office', 'room_type': 'COMMERCIAL', 'area_m2': 50, 'ceiling_height_m': 3,
+             'services': ['cleaning', 'humidifying']},
+            {'name': 'Hall', 'room_type': 'HOME', 'area_m2': 10.5, 'ceiling_height_m': 2.1, 'services': ['cleaning']},
+        ]
+        response = self.client.post(reverse('core:customer-orders'), {'rooms_data': rooms}, format='json')
+        self.assertEqual(201, response.status_code, response.data)
+
+        order = CustomerOrder.objects.get()
+        # 150 × 0.20 + 22.05 × 0.10
+        self.assertEqual(Decimal('32.21'), order.total_cost)
+        self.assertEqual(
+            [Decimal('30.00'), Decimal('2.21')], list(order.order_rooms.order_by('id').values_list('cost_usd', flat=True))
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(order.total_cost, order.calculate_total_cost())
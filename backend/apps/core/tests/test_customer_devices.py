@@ -0,0 +1,160 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import DeviceDailyStat, DeviceInstance, DeviceMetric, DeviceType, Room
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class CustomerDevicesTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.client.force_authenticate(self.customer)
+        self.device_type = DeviceType.objects.create(
+            name='Purifier S', device_category=DeviceType.DEVICE_PURIFIER, supports_cleaning=True
+        )
+        self.room = Room.objects.create(customer=self.customer, name='Office', room_type=Room.ROOM_COMMERCIAL, area_m2=40)
+        now = timezone.now()
+        for _ in range(5):
+            device = DeviceInstance.objects.create(
+                device_type=self.device_type, room=self.room, customer=self.customer,
+                status=DeviceInstance.STATUS_ACTIVE
+            )
+            for minutes in (50, 30, 10):
+                DeviceMetric.objects.create(device=device, timestamp=now - timedelta(minutes=minutes), pm25=minutes)
+        DeviceInstance.objects.update(updated_at=now - timedelta(hours=1))
+        DeviceMetric.objects.update(created_at=now - timedelta(hours=1))
+
+    def test_list_uses_constant_number_of_queries(self):
+        # count + devices (с типом и комнатой) + последние метрики
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:customer-devices'))
+
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual(5, response.data['count'], response.data)
+        for device in response.data['results']:
+            self.assertEqual(10, device['last_metric']['pm25'], device)
+            self.assertEqual(self.room.id, device['room']['id'], device)
+
+    def test_sparse_fields_skip_unused_relations(self):
+        # count + devices, без JOIN типа и комнаты и без запроса метрик
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('core:customer-devices') + '?fields=id,status,room')
+
+        self.assertEqual(200, response.status_code, response.data)
+        for device in response.data['results']:
+            self.assertEqual({'id', 'status', 'room'}, set(device), device)
+            self.assertEqual(self.room.id, device['room'], device)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('core:customer-devices') + '?fields=id,room.name&expand=room')
+        for device in response.data['results']:
+            self.assertEqual({'id': device['id'], 'room': {'name': 'Office'}}, device)
+
+    def test_list_is_cached_until_new_metric(self):
+        url = reverse('core:customer-devices')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(5, response.data['count'], response.data)
+
+        device = DeviceInstance.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            DeviceMetric.objects.create(device=device, timestamp=timezone.now(), pm25=1)
+
+        response = self.client.get(url)
+        metrics = {item['id']: item['last_metric']['pm25'] for item in response.data['results']}
+        self.assertEqual(1, metrics[device.id], response.data)
+
+    def test_reassigned_device_leaves_previous_owner_list(self):
+        url = reverse('core:customer-devices')
+        self.assertEqual(5, self.client.get(url).data['count'])
+
+        other = User.objects.create(email='other@freshair.com', username='other@freshair.com', role=User.ROLE_CUSTOMER)
+        device = DeviceInstance.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            device.customer = other
+            device.room = None
+            device.save()
+
+        self.assertEqual(4, self.client.get(url).data['count'])
+
+    def test_since_returns_only_changed_devices(self):
+        url = reverse('core:customer-devices')
+        cursor = self.client.get(url).data['cursor']
+
+        device = DeviceInstance.objects.first()
+        DeviceMetric.objects.create(device=device, timestamp=timezone.now(), pm25=1)
+
+        response = self.client.get(url, {'since': cursor})
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual([device.id], [item['id'] for item in response.data['results']], response.data)
+        self.assertIn('cursor', response.data)
+
+    def test_since_returns_hidden_status_changes(self):
+        url = reverse('core:customer-devices')
+        cursor = self.client.get(url).data['cursor']
+
+        device = DeviceInstance.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            device.status = DeviceInstance.STATUS_MAINTENANCE
+            device.save()
+
+        response = self.client.get(url, {'since': cursor})
+        self.assertEqual(
+            [(device.id, DeviceInstance.STATUS_MAINTENANCE)],
+            [(item['id'], item['status']) for item in response.data['results']], response.data
+        )
+        self.assertEqual(4, self.client.get(url).data['count'])
+
+    def test_since_counts_late_metrics(self):
+        url = reverse('core:customer-devices')
+        cursor = self.client.get(url).data['cursor']
+
+        # Буферизованное показание с timestamp до курсора
+        device = DeviceInstance.objects.first()
+        DeviceMetric.objects.create(device=device, timestamp=timezone.now() - timedelta(hours=2), pm25=1)
+
+        response = self.client.get(url, {'since': cursor})
+        self.assertEqual([device.id], [item['id'] for item in response.data['results']], response.data)
+
+    def test_metrics_since_is_a_single_range_scan(self):
+        device = DeviceInstance.objects.first()
+        DeviceMetric.objects.create(device=device, timestamp=timezone.now() - timedelta(days=10), pm25=99)
+        url = reverse('core:device-metrics', args=[device.id])
+
+        # устройство + точки, без генерации метрик; since ограничен окном range
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'since': '1970-01-01T00:00:00+00:00'})
+
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual([50, 30, 10], [point['pm25'] for point in response.data['points']], response.data)
+
+    def test_summary(self):
+        device = DeviceInstance.objects.first()
+        DeviceMetric.objects.create(
+            device=device, timestamp=timezone.now(), pm25=40,
+            cleaned_air_volume_m3=100, filter_wear_percent=90
+        )
+        # 7 дней: дневные итоги прошедших дней + сегодняшние сырые метрики
+        today = timezone.localdate()
+        DeviceDailyStat.objects.create(device=device, date=today - timedelta(days=1), cleaned_air_volume_m3=20)
+        DeviceDailyStat.objects.create(device=device, date=today - timedelta(days=7), cleaned_air_volume_m3=500)
+        DeviceDailyStat.objects.create(device=device, date=today, cleaned_air_volume_m3=1000)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('core:customer-devices-summary'))
+
+        self.assertEqual(200, response.status_code, response.data)
+        overall = response.data['overall']
+        self.assertEqual(5, overall['devices_count'], overall)
+        self.assertEqual(40, overall['max_pm25'], overall)
+        self.assertEqual(1, overall['filter_replacement_needed'], overall)
+        self.assertEqual(100, overall['cleaned_air_24h_m3'], overall)
+        self.assertEqual(120, overall['cleaned_air_7d_m3'], overall)
+        self.assertEqual([self.room.id], [room['room_id'] for room in response.data['rooms']])
@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import CustomerOrder, DeviceType, Payment, PaymentCard
+from core.views.customer import CustomerOrderListView
+from toolkit.models import IdempotencyKey
+from toolkit.tests.base_test import BaseTestCase
+from toolkit.utils import idempotency
+from users.models import User
+
+
+class IdempotencyTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.client.force_authenticate(self.customer)
+        self.card = PaymentCard.objects.create(
+            customer=self.customer, card_number_last4='4242', cardholder_name='Customer',
+            expiry_month=12, expiry_year=2030
+        )
+        device_type = DeviceType.objects.create(
+            name='Purifier', device_category=DeviceType.DEVICE_PURIFIER,
+            supports_cleaning=True, coverage_area_m2=50, price_usd=100
+        )
+        self.order_data = {'rooms_data': [
+            {'name': 'Office', 'room_type': 'HOME', 'area_m2': 20, 'device_type_ids': [device_type.id]}
+        ]}
+
+    def test_retried_order_creation_returns_stored_response(self):
+        url = reverse('core:customer-orders')
+        first = self.client.post(url, self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(201, first.status_code, first.data)
+
+        with self.assertNumQueries(0):
+            retry = self.client.post(url, self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(201, retry.status_code, retry.data)
+        self.assertEqual('true', retry['Idempotent-Replayed'])
+        self.assertEqual(first.data['id'], retry.data['id'])
+        self.assertEqual(1, CustomerOrder.objects.count())
+
+        reused = self.client.post(
+            url, {**self.order_data, 'comment': 'other'}, format='json', HTTP_IDEMPOTENCY_KEY='order-1'
+        )
+        self.assertEqual(400, reused.status_code, reused.data)
+
+    def test_retried_payment_falls_back_to_database(self):
+        order_id = self.client.post(reverse('core:customer-orders'), self.order_data, format='json').data['id']
+        url = reverse('core:customer-order-pay', args=[order_id])
+        first = self.client.post(url, {'payment_card_id': self.card.id}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual(200, first.status_code, first.data)
+
+        cache.clear()
+        retry = self.client.post(url, {'payment_card_id': self.card.id}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+        self.assertEqual(200, retry.status_code, retry.data)
+        self.assertEqual(first.data['payment']['id'], retry.data['payment']['id'])
+        self.assertEqual(1, Payment.objects.count())
+        self.assertEqual(1, IdempotencyKey.objects.count())
+
+    def key_and_hash(self, header):
+        url = reverse('core:customer-orders')
+        request = Request(APIRequestFactory().post(url, self.order_data, format='json'), parsers=[JSONParser()])
+        return f'CustomerOrderListView:{self.customer.pk}:{header}', idempotency.request_hash(request)
+
+    @mock.patch.object(CustomerOrderListView, 'idempotency_wait', 0.3)
+    def test_concurrent_duplicate_gets_conflict(self):
+        key, _ = self.key_and_hash('order-2')
+        self.assertTrue(idempotency.acquire_lock(key, 30))
+
+        response = self.client.post(
+            reverse('core:customer-orders'), self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='order-2'
+        )
+        self.assertEqual(409, response.status_code, response.data)
+        self.assertEqual(0, CustomerOrder.objects.count())
+
+    def test_concurrent_duplicate_waits_for_first_response(self):
+        key, request_hash = self.key_and_hash('order-3')
+        self.assertTrue(idempotency.acquire_lock(key, 30))
+
+        def first_request_finishes(seconds):
+            # Первый запрос сохраняет ответ, пока дубликат ждёт блокировку
+            idempotency.store(key, request_hash, 201, {'id': 42}, 60)
+
+        with mock.patch('toolkit.views.sleep', side_effect=first_request_finishes):
+            response = self.client.post(
+                reverse('core:customer-orders'), self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='order-3'
+            )
+        self.assertEqual(201, response.status_code, response.data)
+        self.assertEqual('true', response['Idempotent-Replayed'])
+        self.assertEqual({'id': 42}, response.data)
+        self.assertEqual(0, CustomerOrder.objects.count())
+
+    def test_response_stored_before_lock_is_replayed(self):
+        key, request_hash = self.key_and_hash('order-4')
+        acquire_lock = idempotency.acquire_lock
+
+        def first_request_finishes(*args):
+            # Первый запрос сохранил ответ и снял блокировку между get_stored() и acquire_lock()
+            idempotency.store(key, request_hash, 201, {'id': 42}, 60)
+            return acquire_lock(*args)
+
+        with mock.patch('toolkit.utils.idempotency.acquire_lock', side_effect=first_request_finishes):
+            response = self.client.post(
+                reverse('core:customer-orders'), self.order_data, format='json', HTTP_IDEMPOTENCY_KEY='order-4'
+            )
+        self.assertEqual(201, response.status_code, response.data)
+        self.assertEqual({'id': 42}, response.data)
+        self.assertEqual(0, CustomerOrder.objects.count())
+        self.assertTrue(idempotency.acquire_lock(key, 30))  # блокировка снята
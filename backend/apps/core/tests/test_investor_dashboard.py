@@ -0,0 +1,285 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    DeviceDailyStat, DeviceInstance, DeviceMetric, DeviceStat, DeviceType, Investment, InvestmentStatSnapshot, Room
+)
+from core.utils import device_stats, snapshots
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class InvestorDashboardTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.investor = User.objects.create(
+            email='investor@freshair.com', username='investor@freshair.com', role=User.ROLE_INVESTOR
+        )
+        self.client.force_authenticate(self.investor)
+        device_type = DeviceType.objects.create(
+            name='Combo', device_category=DeviceType.DEVICE_COMBO, supports_cleaning=True, supports_humidifying=True
+        )
+        self.devices = [
+            DeviceInstance.objects.create(device_type=device_type, status=DeviceInstance.STATUS_ACTIVE)
+            for _ in range(2)
+        ]
+        for device in self.devices:
+            Investment.objects.create(investor=self.investor, device=device, amount_usd=100, status=Investment.STATUS_PAID)
+            for humidity in (40, None, 50):
+                DeviceMetric.objects.create(
+                    device=device, timestamp=timezone.now(), cleaned_air_volume_m3=10, humidity=humidity
+                )
+
+    def test_dashboard_reads_counters(self):
+        response = self.client.get(reverse('core:investor-dashboard'))
+
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual('200.00', response.data['total_invested_usd'], response.data)
+        self.assertEqual(2, response.data['active_devices_count'], response.data)
+        self.assertEqual(60, response.data['total_cleaned_air_m3'], response.data)
+        self.assertEqual(4, response.data['total_humidified_hours'], response.data)
+
+    def test_rebuild_fixes_drift(self):
+        DeviceStat.objects.filter(device=self.devices[0]).update(metrics_count=0)
+
+        out = StringIO()
+        call_command('rebuild_device_stats', '--check', stdout=out)
+        self.assertIn(f'Device {self.devices[0].id}', out.getvalue())
+
+        call_command('rebuild_device_stats', stdout=StringIO())
+        self.assertEqual(3, DeviceStat.objects.get(device=self.devices[0]).metrics_count)
+
+    def test_rebuild_resets_stats_without_metrics(self):
+        DeviceMetric.objects.filter(device=self.devices[1]).delete()
+
+        out = StringIO()
+        call_command('rebuild_device_stats', '--check', stdout=out)
+        self.assertIn(f'Device {self.devices[1].id}', out.getvalue())
+
+        call_command('rebuild_device_stats', stdout=StringIO())
+        stat = DeviceStat.objects.get(device=self.devices[1])
+        self.assertEqual((0, 0), (stat.metrics_count, stat.cleaned_air_volume_m3))
+        self.assertEqual([], device_stats.find_drift())
+
+    def test_investments_list_uses_annotations(self):
+        investment = Investment.objects.filter(device=self.devices[0]).get()
+        InvestmentStatSnapshot.objects.create(
+            investment=investment, timestamp=timezone.now(), projected_return_amount=15
+        )
+
+        # count + инвестиции с аннотациями + последние метрики устройств
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:investor-investments'))
+
+        self.assertEqual(200, response.status_code, response.data)
+        items = {item['device']['id']: item for item in response.data['results']}
+        self.assertEqual(30, items[self.devices[0].id]['cleaned_air_m3'], response.data)
+        self.assertEqual(2, items[self.devices[0].id]['humidified_hours'], response.data)
+        self.assertEqual(15, items[self.devices[0].id]['projected_return_usd'], response.data)
+        self.assertIsNone(items[self.devices[1].id]['projected_return_usd'], response.data)
+
+    def test_compute_snapshots(self):
+        Investment.objects.create(
+            investor=self.investor, device=self.devices[0], amount_usd=500, status=Investment.STATUS_PENDING
+        )
+        call_command('compute_investment_snapshots', '--chunk-size', '1', stdout=StringIO())
+
+        created = InvestmentStatSnapshot.objects.order_by('investment_id')
+        self.assertEqual(2, created.count())
+        for snapshot in created:
+            self.assertEqual(25, snapshot.projected_return_amount)
+            self.assertEqual(30, snapshot.cumulative_cleaned_air_volume_m3)
+            self.assertEqual(2, snapshot.cumulative_humidity_hours)
+            self.assertIsNotNone(snapshot.projected_return_date)
+
+        response = self.client.get(reverse('core:investor-dashboard'))
+        self.assertEqual('50.00', response.data['projected_return_total_usd'], response.data)
+
+    def test_prune_keeps_latest_snapshot(self):
+        investments = list(Investment.objects.order_by('id'))
+        old = timezone.now() - timedelta(days=snapshots.SNAPSHOT_RETENTION_DAYS + 1)
+        for investment in investments:
+            InvestmentStatSnapshot.objects.create(investment=investment, timestamp=old - timedelta(days=1))
+            InvestmentStatSnapshot.objects.create(investment=investment, timestamp=old)
+        InvestmentStatSnapshot.objects.create(investment=investments[0], timestamp=timezone.now())
+
+        self.assertEqual(3, snapshots.prune_snapshots())
+        self.assertEqual(
+            [(investments[0].id, False), (investments[1].id, True)],
+            [(s.investment_id, s.timestamp == old) for s in InvestmentStatSnapshot.objects.order_by('investment_id')]
+        )
+
+    def test_projection_bands(self):
+        response = self.client.get(reverse('core:investor-portfolio-projection'))
+
+        self.assertEqual(200, response.status_code, response.data)
+        bands = response.data['return_usd']
+        self.assertEqual(50, response.data['nominal_return_usd'], response.data)
+        self.assertTrue(bands['p5'] <= bands['p50'] <= bands['p95'], bands)
+        dates = response.data['payback_date']
+        self.assertTrue(dates['p5'] <= dates['p50'] <= dates['p95'], dates)
+
+    def test_projection_of_large_portfolio_is_one_matrix(self):
+        # Время считается командой benchmark_projection, здесь - только запросы и форма результата
+        from core.utils.projection import PERCENTILES, simulate
+
+        positions = [{
+            'amount_usd': 100, 'profit_percentage': 25, 'period_months': 6,
+            'device_type_id': self.devices[0].device_type_id, 'start_date': timezone.localdate(),
+        }] * 50
+        simulate(positions)  # калибровка попадает в кэш
+
+        with self.assertNumQueries(0):
+            result = simulate(positions, seed=1)
+        self.assertEqual(5000, result['paths'])
+        self.assertEqual(1250, result['nominal_return_usd'])
+        self.assertEqual([f'p{p}' for p in PERCENTILES], list(result['return_usd']))
+        self.assertEqual([f'p{p}' for p in PERCENTILES], list(result['payback_date']))
+
+    def test_available_devices(self):
+        customer = User.objects.create(email='customer@freshair.com', username='customer@freshair.com')
+        room = Room.objects.create(customer=customer, name='Lobby', city='Tashkent', area_m2=20)
+        DeviceInstance.objects.filter(pk=self.devices[0].pk).update(room=room)
+        url = reverse('core:investor-devices-available')
+
+        # count + устройства (с типом и комнатой) + последние метрики, без генерации метрик
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'city': 'tashkent', 'category': DeviceType.DEVICE_COMBO, 'budget': 100})
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual([self.devices[0].id], [item['id'] for item in response.data['results']], response.data)
+        self.assertEqual(50, response.data['results'][0]['last_metric']['humidity'], response.data)
+
+        with self.assertNumQueries(0):
+            self.client.get(url, {'city': 'tashkent', 'category': DeviceType.DEVICE_COMBO, 'budget': 100})
+
+        self.assertEqual(0, self.client.get(url, {'budget': 50}).data['count'])
+        self.assertEqual(400, self.client.get(url, {'budget': 'abc'}).status_code)
+
+        # Переключение питания не сбрасывает общий список
+        device = DeviceInstance.objects.get(pk=self.devices[0].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            device.is_power_on = not device.is_power_on
+            device.save()
+        with self.assertNumQueries(0):
+            self.client.get(url, {'city': 'tashkent', 'category': DeviceType.DEVICE_COMBO, 'budget': 100})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device.status = DeviceInstance.STATUS_MAINTENANCE
+            device.save()
+        response = self.client.get(url, {'city': 'tashkent', 'category': DeviceType.DEVICE_COMBO, 'budget': 100})
+        self.assertEqual(0, response.data['count'], response.data)
+
+    def test_investment_reserves_device_limit(self):
+        device = self.devices[0]
+        DeviceInstance.objects.filter(pk=device.pk).update(funded_usd=100)
+        url = reverse('core:investor-investments')
+
+        response = self.client.post(url, {'device_id': self.devices[1].id, 'amount_usd': '50'})
+        self.assertEqual(400, response.status_code, response.data)  # меньше min_investment_usd
+        response = self.client.post(url, {'device_id': device.id, 'amount_usd': '900'})
+        self.assertEqual(201, response.status_code, response.data)
+        response = self.client.post(url, {'device_id': device.id, 'amount_usd': '100'})
+        self.assertEqual(400, response.status_code, response.data)
+        device.refresh_from_db()
+        self.assertEqual(1000, device.funded_usd)
+
+        # Обычное сохранение устройства не перезаписывает счётчик
+        stale = DeviceInstance.objects.get(pk=device.pk)
+        DeviceInstance.objects.filter(pk=device.pk).update(funded_usd=500)
+        stale.is_power_on = False
+        stale.save()
+        DeviceInstance.objects.filter(pk=device.pk).update(funded_usd=1000)
+
+        pending = Investment.objects.get(device=device, status=Investment.STATUS_PENDING)
+        response = self.client.post(reverse('core:investment-cancel', args=[pending.id]))
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual(400, self.client.post(reverse('core:investment-cancel', args=[pending.id])).status_code)
+        device.refresh_from_db()
+        self.assertEqual(100, device.funded_usd)
+
+        out = StringIO()
+        call_command('reconcile_funded_amounts', stdout=out)
+        self.assertIn(f'Device {self.devices[1].id}: funded 0.00 != 100.00', out.getvalue())
+        self.assertEqual(100, DeviceInstance.objects.get(pk=self.devices[1].pk).funded_usd)
+
+    def test_expired_pending_investment_releases_reservation(self):
+        from core.utils import funding
+
+        device = self.devices[0]
+        DeviceInstance.objects.filter(pk=device.pk).update(funded_usd=300)
+        stale = Investment.objects.create(investor=self.investor, device=device, amount_usd=200, status=Investment.STATUS_PENDING)
+        fresh = Investment.objects.create(investor=self.investor, device=device, amount_usd=100, status=Investment.STATUS_PENDING)
+        Investment.objects.filter(pk=stale.pk).update(created_at=timezone.now() - funding.PENDING_TTL - timedelta(minutes=1))
+
+        self.assertEqual(1, funding.expire_pending())
+        self.assertEqual(0, funding.expire_pending())
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((Investment.STATUS_FAILED, Investment.STATUS_PENDING), (stale.status, fresh.status))
+        self.assertEqual(100, DeviceInstance.objects.get(pk=device.pk).funded_usd)
+
+    def test_confirm_payment_is_conditional(self):
+        investment = Investment.objects.create(
+            investor=self.investor, device=self.devices[0], amount_usd=100, status=Investment.STATUS_PENDING
+        )
+        url = reverse('core:confirm-payment', args=[investment.id])
+        response = self.client.post(url)
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual(Investment.STATUS_PAID, response.data['status'])
+        self.assertEqual(400, self.client.post(url).status_code)
+        self.assertEqual(404, self.client.post(reverse('core:confirm-payment', args=[0])).status_code)
+
+    def test_portfolio_series(self):
+        # Второй инвестор владеет половиной второго устройства
+        other = User.objects.create(email='other@freshair.com', username='other@freshair.com', role=User.ROLE_INVESTOR)
+        Investment.objects.create(investor=other, device=self.devices[1], amount_usd=100, status=Investment.STATUS_PAID)
+        DeviceInstance.objects.filter(pk=self.devices[0].pk).update(funded_usd=100)
+        DeviceInstance.objects.filter(pk=self.devices[1].pk).update(funded_usd=200)
+        call_command('rollup_device_daily_stats', '--days', '1', stdout=StringIO())
+        self.assertEqual(2, DeviceDailyStat.objects.count())
+
+        url = reverse('core:investor-portfolio-series')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'days': 7})
+        self.assertEqual(200, response.status_code, response.data)
+        series = response.data['series']
+        self.assertEqual(7, len(series))
+        self.assertEqual(0, series[0]['cleaned_air_m3'])
+        self.assertEqual(45, series[-1]['cleaned_air_m3'])
+        self.assertEqual(3, series[-1]['humidity_hours'])
+        self.assertTrue(0 < series[-1]['accrued_return_usd'] < 50, series[-1])
+
+        with self.assertNumQueries(0):
+            self.client.get(url, {'days': 7})
+
+        today = timezone.localdate().isoformat()
+        response = self.client.get(url, {'start': today, 'end': today})
+        self.assertEqual(1, len(response.data['series']))
+        self.assertEqual(400, self.client.get(url, {'days': 0}).status_code)
+        self.assertEqual(400, self.client.get(url, {'start': today, 'end': '2000-01-01'}).status_code)
+
+    def test_portfolio_series_ignores_pending_reservations(self):
+        call_command('rollup_device_daily_stats', '--days', '1', stdout=StringIO())
+        url = reverse('core:investor-portfolio-series')
+        before = self.client.get(url, {'days': 7}).data['series']
+        self.assertEqual(60, before[-1]['cleaned_air_m3'])
+
+        # Неоплаченный резерв второго инвестора увеличивает funded_usd, но не долю первого
+        other = User.objects.create(email='other@freshair.com', username='other@freshair.com', role=User.ROLE_INVESTOR)
+        Investment.objects.create(investor=other, device=self.devices[1], amount_usd=100, status=Investment.STATUS_PENDING)
+        DeviceInstance.objects.filter(pk=self.devices[1].pk).update(funded_usd=200)
+        cache.clear()
+
+        self.assertEqual(before, self.client.get(url, {'days': 7}).data['series'])
+
+        # Инвестиция, оплаченная позже, не переписывает прошлые дни
+        Investment.objects.filter(investor=other).update(
+            status=Investment.STATUS_PAID, paid_at=timezone.now() + timedelta(days=1)
+        )
+        cache.clear()
+        self.assertEqual(before, self.client.get(url, {'days': 7}).data['series'])
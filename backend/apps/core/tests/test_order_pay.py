@@ -0,0 +1,240 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from core.management.commands.run_payment_gateway_stub import make_handler
+from core.models import CustomerOrder, DeviceInstance, DeviceType, OrderDevice, OutboxEvent, Payment, PaymentCard, Subscription
+from core.utils import order_payments
+from core.utils.order_events import CUSTOMER_EMAIL, ORDER_ACTIVATED, ORDER_PAID, handle_order_paid
+from core.utils.outbox import relay
+from core.utils.payment_gateway import DECLINED_CARD_LAST4, UNAVAILABLE_CARD_LAST4, ChargeResult, HttpGateway
+from core.utils.provisioning import provision_order_devices
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class OrderPayTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.client.force_authenticate(self.customer)
+        self.card = PaymentCard.objects.create(
+            customer=self.customer, card_number_last4='4242', cardholder_name='Customer',
+            expiry_month=12, expiry_year=2030
+        )
+        self.device_types = [
+            DeviceType.objects.create(
+                name=f'Purifier {index}', device_category=DeviceType.DEVICE_PURIFIER,
+                supports_cleaning=True, coverage_area_m2=50, price_usd=100
+            )
+            for index in range(3)
+        ]
+
+    def create_order(self, rooms):
+        rooms_data = [
+            {'name': f'Room {index}', 'room_type': 'HOME', 'area_m2': 20, 'ceiling_height_m': 2.5,
+             'device_type_ids': [device_type.id for device_type in self.device_types]}
+            for index in range(rooms)
+        ]
+        response = self.client.post(reverse('core:customer-orders'), {'rooms_data': rooms_data}, format='json')
+        self.assertEqual(201, response.status_code, response.data)
+        return response.data['id']
+
+    def test_provisioning_uses_constant_number_of_queries(self):
+        order = CustomerOrder.objects.prefetch_related('order_rooms__order_room_device_types').get(
+            pk=self.create_order(rooms=5)
+        )
+        # коды из последовательности + INSERT устройств + INSERT связей с заказом
+        with self.assertNumQueries(3):
+            devices = provision_order_devices(order)
+
+        self.assertEqual(15, len(devices))
+        self.assertEqual(15, OrderDevice.objects.filter(order=order).count())
+        codes = [device.internal_code for device in devices]
+        self.assertEqual(15, len(set(codes)))
+        self.assertTrue(all(code.startswith('FA-') for code in codes))
+
+    def test_pay_creates_devices_through_outbox(self):
+        order_id = self.create_order(rooms=2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse('core:customer-order-pay', args=[order_id]), {'payment_card_id': self.card.id}, format='json'
+            )
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertFalse(DeviceInstance.objects.exists())
+        event = OutboxEvent.objects.get(topic=ORDER_PAID)
+        self.assertEqual({'order_id': order_id, 'payment_id': response.data['payment']['id']}, event.payload)
+
+        # Задача relay_outbox (в тестах выполняется синхронно)
+        for callback in callbacks:
+            callback()
+        event.refresh_from_db()
+        self.assertEqual(OutboxEvent.STATUS_DONE, event.status)
+        self.assertEqual(6, DeviceInstance.objects.filter(customer=self.customer, orders=order_id).count())
+        self.assertEqual(Subscription.STATUS_SUSPENDED, Subscription.objects.get(order_id=order_id).status)
+        self.assertEqual(1, len(mail.outbox))
+
+        # Повторная обработка события не дублирует устройства, подписку и письмо
+        handle_order_paid(event.payload)
+        self.assertEqual(6, DeviceInstance.objects.count())
+        self.assertEqual(1, len(mail.outbox))
+
+    def test_failed_event_is_retried_later(self):
+        event = OutboxEvent.objects.create(topic=ORDER_PAID, payload={'order_id': 0}, available_at=timezone.now())
+        self.assertEqual(0, relay())
+
+        event.refresh_from_db()
+        self.assertEqual(OutboxEvent.STATUS_PENDING, event.status)
+        self.assertEqual(1, event.attempts)
+        self.assertGreater(event.available_at, timezone.now())
+
+    def test_failed_event_does_not_resend_processed_emails(self):
+        order = CustomerOrder.objects.create(customer=self.customer, status=CustomerOrder.STATUS_INSTALLED)
+        now = timezone.now()
+        activated = OutboxEvent.objects.create(topic=ORDER_ACTIVATED, payload={'order_id': order.id}, available_at=now)
+        broken = OutboxEvent.objects.create(topic=ORDER_PAID, payload={'order_id': 0}, available_at=now)
+
+        self.assertEqual(2, relay())  # order.activated и его customer.email
+        OutboxEvent.objects.filter(pk=broken.pk).update(available_at=timezone.now())
+        self.assertEqual(0, relay())
+
+        activated.refresh_from_db()
+        self.assertEqual(OutboxEvent.STATUS_DONE, activated.status)
+        self.assertEqual(1, OutboxEvent.objects.filter(topic=CUSTOMER_EMAIL, status=OutboxEvent.STATUS_DONE).count())
+        self.assertEqual(1, len(mail.outbox))
+
+    def test_paid_event_after_activation_creates_active_subscription(self):
+        order_id = self.create_order(rooms=1)
+        CustomerOrder.objects.filter(pk=order_id).update(status=CustomerOrder.STATUS_ACTIVE)
+
+        handle_order_paid({'order_id': order_id})
+        subscription = Subscription.objects.get(order_id=order_id)
+        self.assertEqual(Subscription.STATUS_ACTIVE, subscription.status)
+        self.assertGreater(subscription.next_payment_date, timezone.now())
+
+    def test_declined_payment_keeps_order_pending(self):
+        order_id = self.create_order(rooms=1)
+        self.card.card_number_last4 = DECLINED_CARD_LAST4
+        self.card.save()
+
+        response = self.client.post(
+            reverse('core:customer-order-pay', args=[order_id]), {'payment_card_id': self.card.id}, format='json'
+        )
+        self.assertEqual(402, response.status_code, response.data)
+        self.assertEqual(Payment.STATUS_FAILED, response.data['payment']['status'])
+        self.assertEqual(CustomerOrder.STATUS_PENDING, CustomerOrder.objects.get(pk=order_id).status)
+        self.assertFalse(DeviceInstance.objects.exists())
+
+
+    def pay(self, order_id):
+        return self.client.post(
+            reverse('core:customer-order-pay', args=[order_id]), {'payment_card_id': self.card.id}, format='json'
+        )
+
+    def test_unknown_result_keeps_payment_pending_and_retry_reuses_it(self):
+        order_id = self.create_order(rooms=1)
+        self.card.card_number_last4 = UNAVAILABLE_CARD_LAST4
+        self.card.save()
+
+        response = self.pay(order_id)
+        self.assertEqual(503, response.status_code, response.data)
+        self.assertEqual(Payment.STATUS_PENDING, response.data['payment']['status'])
+        external_id = Payment.objects.get().external_id
+
+        # Повтор отправляет тот же платёж с тем же ключом идемпотентности
+        self.card.card_number_last4 = '4242'
+        self.card.save()
+        response = self.pay(order_id)
+        self.assertEqual(200, response.status_code, response.data)
+        payment = Payment.objects.get()
+        self.assertEqual((external_id, Payment.STATUS_PAID), (payment.external_id, payment.status))
+        self.assertEqual(CustomerOrder.STATUS_APPROVED, CustomerOrder.objects.get(pk=order_id).status)
+
+    def test_order_changed_during_charge_flags_refund(self):
+        order_id = self.create_order(rooms=1)
+
+        def cancel_while_charging(payment, card):
+            CustomerOrder.objects.filter(pk=order_id).update(status=CustomerOrder.STATUS_CANCELLED)
+            return ChargeResult(success=True, transaction_id='TXN-1')
+
+        with mock.patch('core.utils.payment_gateway.StubGateway.charge', side_effect=cancel_while_charging):
+            response = self.pay(order_id)
+        self.assertEqual(409, response.status_code, response.data)
+        self.assertEqual(Payment.STATUS_REFUND_REQUIRED, Payment.objects.get().status)
+        self.assertEqual(CustomerOrder.STATUS_CANCELLED, CustomerOrder.objects.get(pk=order_id).status)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_reconcile_completes_stale_payment(self):
+        order_id = self.create_order(rooms=1)
+        payment = Payment.objects.create(
+            order_id=order_id, payment_card=self.card, amount=10, status=Payment.STATUS_PENDING,
+            external_id=f'{order_payments.ORDER_PAYMENT_PREFIX}{order_id}-crashed'
+        )
+        self.assertEqual(0, order_payments.reconcile())  # ещё не завис
+
+        Payment.objects.filter(pk=payment.pk).update(updated_at=timezone.now() - order_payments.STALE_AFTER - timedelta(seconds=1))
+        self.assertEqual(1, order_payments.reconcile())
+        payment.refresh_from_db()
+        self.assertEqual(Payment.STATUS_PAID, payment.status)
+        self.assertEqual(CustomerOrder.STATUS_APPROVED, CustomerOrder.objects.get(pk=order_id).status)
+        self.assertEqual(1, OutboxEvent.objects.filter(topic=ORDER_PAID).count())
+
+
+class HtmlErrorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.send_response(403)
+        self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+        self.wfile.write(b'<html>Forbidden</html>')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpGatewayTest(BaseTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(latency=0, fail_rate=0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.gateway = HttpGateway(f'http://127.0.0.1:{self.server.server_port}', read_timeout=2)
+        self.card = PaymentCard(card_number_last4='4242')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_charge_is_idempotent_per_payment(self):
+        payment = Payment(external_id='ORDER-1-test', amount=Decimal('10.00'))
+        first = self.gateway.charge(payment, self.card)
+        retry = self.gateway.charge(payment, self.card)
+
+        self.assertTrue(first.success)
+        self.assertEqual(first.transaction_id, retry.transaction_id)
+
+        self.card.card_number_last4 = DECLINED_CARD_LAST4
+        declined = self.gateway.charge(Payment(external_id='ORDER-2-test', amount=Decimal('10.00')), self.card)
+        self.assertFalse(declined.success)
+
+    def test_ambiguous_responses_are_unknown(self):
+        payment = Payment(external_id='ORDER-3-test', amount=Decimal('10.00'))
+        server = ThreadingHTTPServer(('127.0.0.1', 0), HtmlErrorHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            result = HttpGateway(f'http://127.0.0.1:{server.server_port}', retries=0).charge(payment, self.card)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertTrue(result.unknown)
+
+        port = server.server_port  # сервер остановлен - ошибка соединения
+        result = HttpGateway(f'http://127.0.0.1:{port}', connect_timeout=0.5, retries=0).charge(payment, self.card)
+        self.assertTrue(result.unknown)
+        self.assertFalse(result.success)
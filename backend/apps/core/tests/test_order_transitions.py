@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import CustomerOrder, OutboxEvent, Subscription
+from core.utils.order_events import ORDER_ACTIVATED
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class OrderTransitionsTest(BaseTestCase):
+    def setUp(self):
+        self.admin = User.objects.create(
+            email='admin@freshair.com', username='admin@freshair.com', is_staff=True, is_superuser=True
+        )
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.client.force_authenticate(self.admin)
+        now = timezone.now()
+        self.orders = []
+        for _ in range(20):
+            order = CustomerOrder.objects.create(customer=self.customer, status=CustomerOrder.STATUS_INSTALLED)
+            Subscription.objects.create(
+                customer=self.customer, order=order, monthly_amount_usd=10,
+                start_date=now, next_payment_date=now + timedelta(days=30)
+            )
+            self.orders.append(order)
+        self.pending = CustomerOrder.objects.create(customer=self.customer)
+
+    def test_activate_orders_in_constant_queries(self):
+        order_ids = [order.id for order in self.orders] + [self.pending.id, 999999]
+        # SELECT FOR UPDATE + UPDATE заказов + UPDATE подписок + INSERT событий (и SAVEPOINT/RELEASE транзакции теста)
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                reverse('core:admin-order-status'),
+                {'order_ids': order_ids, 'status': CustomerOrder.STATUS_ACTIVE},
+                format='json'
+            )
+
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual(sorted(order.id for order in self.orders), response.data['updated'])
+        self.assertEqual({self.pending.id: CustomerOrder.STATUS_PENDING}, response.data['rejected'])
+        self.assertEqual([999999], response.data['missing'])
+        self.assertEqual(20, CustomerOrder.objects.filter(status=CustomerOrder.STATUS_ACTIVE).count())
+        self.assertEqual(20, Subscription.objects.filter(status=Subscription.STATUS_ACTIVE).count())
+        self.assertEqual(20, OutboxEvent.objects.filter(topic=ORDER_ACTIVATED).count())
+
+    def test_requires_permission(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            reverse('core:admin-order-status'),
+            {'order_ids': [self.pending.id], 'status': CustomerOrder.STATUS_APPROVED},
+            format='json'
+        )
+        self.assertEqual(403, response.status_code, response.data)
@@ -0,0 +1,52 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import CustomerOrder, Payment
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class PaymentAnalyticsTest(BaseTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.client.force_authenticate(self.customer)
+        order = CustomerOrder.objects.create(customer=self.customer)
+        now = timezone.now()
+        for days, amount, status in ((1, '10', Payment.STATUS_PAID), (10, '20', Payment.STATUS_PAID),
+                                     (60, '40', Payment.STATUS_PAID), (2, '80', Payment.STATUS_FAILED)):
+            payment = Payment.objects.create(order=order, amount=Decimal(amount), status=status)
+            Payment.objects.filter(pk=payment.pk).update(created_at=now - timedelta(days=days))
+
+    def test_analytics_in_single_query(self):
+        # count + страница платежей + одна агрегация
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:customer-payments'))
+
+        self.assertEqual(200, response.status_code, response.data)
+        self.assertEqual({
+            'total_paid': 70.0,
+            'total_payments': 3,
+            'recent_30_days': {'total': 30.0, 'count': 2},
+            'recent_7_days': {'total': 10.0, 'count': 1},
+        }, response.data['analytics'])
+
+        # Аналитика общая для всех страниц клиента
+        with self.assertNumQueries(2):
+            self.client.get(reverse('core:customer-payments') + '?page=1')
+
+    def test_monthly_breakdown(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:customer-payments') + '?monthly=true')
+
+        analytics = response.data['analytics']
+        self.assertEqual(70.0, analytics['total_paid'])
+        self.assertEqual(30.0, analytics['recent_30_days']['total'])
+        self.assertEqual(70.0, sum(month['total'] for month in analytics['monthly']))
+        self.assertEqual(3, sum(month['count'] for month in analytics['monthly']))
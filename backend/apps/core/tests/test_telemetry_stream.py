@@ -0,0 +1,128 @@
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import DeviceInstance, DeviceMetric, DeviceType, Room
+from core.utils.telemetry import channel_name
+from toolkit.tests.base_test import BaseTestCase
+from users.models import Token, User
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+
+
+def fake_subscribe(*messages):
+    async def subscribe(customer_id, heartbeat=15):
+        for message in messages:
+            yield json.dumps(message) if message else None
+    return subscribe
+
+
+class TelemetryStreamTest(BaseTestCase):
+    def setUp(self):
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.other = User.objects.create(
+            email='other@freshair.com', username='other@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        self.token = Token.objects.create(user=self.customer)
+        device_type = DeviceType.objects.create(name='Purifier S', device_category=DeviceType.DEVICE_PURIFIER)
+        room = Room.objects.create(customer=self.customer, name='Office', room_type=Room.ROOM_COMMERCIAL, area_m2=40)
+        self.device = DeviceInstance.objects.create(device_type=device_type, room=room, customer=self.customer)
+        self.other_device = DeviceInstance.objects.create(device_type=device_type, customer=self.other)
+        self.url = reverse('core:customer-devices-stream')
+
+    def read(self, response):
+        async def consume():
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return async_to_sync(consume)()
+
+    def test_requires_token(self):
+        self.assertEqual(401, self.client.get(self.url).status_code)
+        self.assertEqual(401, self.client.get(self.url + '?token=wrong').status_code)
+
+    @mock.patch('core.views.stream.subscribe', fake_subscribe())
+    def test_token_in_header_or_query(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/event-stream', response['Content-Type'])
+
+        response = self.client.get(self.url + '?token=' + self.token.key)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('retry: 15000\n\n', self.read(response))
+
+    def test_foreign_device_is_forbidden(self):
+        response = self.client.get(f'{self.url}?token={self.token.key}&device={self.other_device.pk}')
+        self.assertEqual(403, response.status_code)
+
+        response = self.client.get(f'{self.url}?token={self.token.key}&device=0')
+        self.assertEqual(404, response.status_code)
+
+    def test_event_framing(self):
+        device = {'event': 'device', 'data': {'id': self.device.pk, 'status': 'ACTIVE', 'is_power_on': False}}
+        metric = {'event': 'metric', 'data': {'device': self.device.pk, 'pm25': 12}}
+        with mock.patch('core.views.stream.subscribe', fake_subscribe(device, None, metric)):
+            response = self.client.get(self.url + '?token=' + self.token.key)
+            content = self.read(response)
+
+        self.assertEqual(
+            'retry: 15000\n\n'
+            f'event: device\ndata: {json.dumps(device["data"])}\n\n'
+            ': keep-alive\n\n'
+            f'event: metric\ndata: {json.dumps(metric["data"])}\n\n',
+            content
+        )
+
+    def test_device_filter_skips_other_devices(self):
+        own = {'event': 'metric', 'data': {'device': self.device.pk, 'pm25': 12}}
+        other = {'event': 'device', 'data': {'id': self.device.pk + 1000, 'status': 'ACTIVE', 'is_power_on': True}}
+        with mock.patch('core.views.stream.subscribe', fake_subscribe(other, own)):
+            response = self.client.get(f'{self.url}?token={self.token.key}&device={self.device.pk}')
+            content = self.read(response)
+
+        self.assertEqual(f'retry: 15000\n\nevent: metric\ndata: {json.dumps(own["data"])}\n\n', content)
+
+
+class TelemetryPublishTest(BaseTestCase):
+    def setUp(self):
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        device_type = DeviceType.objects.create(name='Purifier S', device_category=DeviceType.DEVICE_PURIFIER)
+        self.device = DeviceInstance.objects.create(device_type=device_type, customer=self.customer)
+        self.redis = FakeRedis()
+        patcher = mock.patch('core.utils.telemetry.get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_device_state_published_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.device.is_power_on = False
+            self.device.save()
+            self.assertEqual([], self.redis.published)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual([(channel_name(self.customer.pk), {
+            'event': 'device',
+            'data': {'id': self.device.pk, 'status': self.device.status, 'is_power_on': False},
+        })], self.redis.published)
+
+    def test_metric_published_on_create(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            metric = DeviceMetric.objects.create(device=self.device, timestamp=timezone.now(), pm25=7)
+
+        channel, message = self.redis.published[-1]
+        self.assertEqual(channel_name(self.customer.pk), channel)
+        self.assertEqual('metric', message['event'])
+        self.assertEqual(metric.pk, message['data']['id'])
+        self.assertEqual(7, message['data']['pm25'])
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core.models import CustomerOrder, Room, Subscription
+from toolkit.tests.base_test import BaseTestCase
+from users.models import User
+
+
+class TrackedFieldsTest(BaseTestCase):
+    def setUp(self):
+        self.customer = User.objects.create(
+            email='customer@freshair.com', username='customer@freshair.com', role=User.ROLE_CUSTOMER
+        )
+        order = CustomerOrder.objects.create(customer=self.customer, status=CustomerOrder.STATUS_APPROVED)
+        now = timezone.now()
+        self.subscription = Subscription.objects.create(
+            customer=self.customer, order=order, monthly_amount_usd=10,
+            start_date=now, next_payment_date=now + timedelta(days=30)
+        )
+        self.order = CustomerOrder.objects.get(pk=order.pk)
+
+    def test_changed_fields(self):
+        self.assertEqual([], self.order.changed_fields)
+        self.order.status = CustomerOrder.STATUS_INSTALLED
+        self.assertTrue(self.order.has_changed('status'))
+        self.assertEqual(['status'], self.order.changed_fields)
+
+        self.order.save()
+        self.assertEqual([], self.order.changed_fields)
+        with self.assertNumQueries(0):
+            self.assertFalse(self.order.save_changed())
+
+    def test_refresh_with_positional_fields(self):
+        CustomerOrder.objects.filter(pk=self.order.pk).update(status=CustomerOrder.STATUS_ACTIVE)
+        self.order.refresh_from_db(None, ['status'])
+        self.assertEqual(CustomerOrder.STATUS_ACTIVE, self.order.status)
+        self.assertEqual([], self.order.changed_fields)
+
+    def test_untracked_models_skip_snapshot(self):
+        room = Room.objects.create(customer=self.customer, name='Office', room_type=Room.ROOM_COMMERCIAL, area_m2=40)
+        self.assertNotIn('_tracked_original', Room.objects.get(pk=room.pk).__dict__)
+
+    def test_activation_without_pre_save_select(self):
+        self.order.status = CustomerOrder.STATUS_ACTIVE
+        # UPDATE заказа + подписка заказа + UPDATE подписки + событие order.activated
+        with self.assertNumQueries(4):
+            self.order.save_changed()
+
+        self.subscription.refresh_from_db()
+        self.assertEqual(Subscription.STATUS_ACTIVE, self.subscription.status)
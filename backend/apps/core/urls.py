@@ -6,7 +6,9 @@ from core.views.general import GeneralView
 from core.views.customer import (
     RoomListView,
     CustomerOrderListView,
+    CustomerOrderQuoteView,
     CustomerDeviceListView,
+    CustomerFleetSummaryView,
     DeviceToggleView,
     DeviceMetricsView,
     DeviceTypeListView,
@@ -19,13 +21,18 @@ from core.views.customer import (
 )
 from core.views.investor import (
     InvestorDashboardView,
+    InvestorProjectionView,
+    InvestorPortfolioSeriesView,
     AvailableDevicesView,
     InvestmentListView,
-    ConfirmPaymentView
+    ConfirmPaymentView,
+    CancelInvestmentView
 )
+from core.views.stream import CustomerTelemetryStreamView
 from core.views.admin import (
     AdminDeviceView,
     AdminDeviceStatusView,
+    AdminOrderStatusView,
     InternalDeviceMetricsView
 )
 
@@ -36,8 +43,11 @@ urlpatterns = [
     path('customer/rooms', RoomListView.as_view(), name='customer-rooms'),
     path('customer/device-types', DeviceTypeListView.as_view(), name='customer-device-types'),
     path('customer/orders', CustomerOrderListView.as_view(), name='customer-orders'),
+    path('customer/orders/quote', CustomerOrderQuoteView.as_view(), name='customer-order-quote'),
     path('customer/orders/<int:pk>/pay', CustomerOrderPayView.as_view(), name='customer-order-pay'),
     path('customer/devices', CustomerDeviceListView.as_view(), name='customer-devices'),
+    path('customer/devices/summary', CustomerFleetSummaryView.as_view(), name='customer-devices-summary'),
+    path('customer/devices/stream', CustomerTelemetryStreamView.as_view(), name='customer-devices-stream'),
     path('customer/devices/<int:pk>/toggle', DeviceToggleView.as_view(), name='device-toggle'),
     path('customer/devices/<int:pk>/metrics', DeviceMetricsView.as_view(), name='device-metrics'),
     path('customer/payment-cards', PaymentCardListView.as_view(), name='customer-payment-cards'),
@@ -46,11 +56,15 @@ urlpatterns = [
     path('customer/subscriptions', CustomerSubscriptionListView.as_view(), name='customer-subscriptions'),
     path('customer/subscriptions/<int:pk>/cancel', CustomerSubscriptionCancelView.as_view(), name='customer-subscription-cancel'),
     path('investor/dashboard', InvestorDashboardView.as_view(), name='investor-dashboard'),
+    path('investor/portfolio/series', InvestorPortfolioSeriesView.as_view(), name='investor-portfolio-series'),
+    path('investor/portfolio/projection', InvestorProjectionView.as_view(), name='investor-portfolio-projection'),
     path('investor/devices/available', AvailableDevicesView.as_view(), name='investor-devices-available'),
     path('investor/investments', InvestmentListView.as_view(), name='investor-investments'),
     path('investor/investments/<int:pk>/confirm-payment', ConfirmPaymentView.as_view(), name='confirm-payment'),
+    path('investor/investments/<int:pk>/cancel', CancelInvestmentView.as_view(), name='investment-cancel'),
     path('admin/devices', AdminDeviceView.as_view(), name='admin-devices'),
     path('admin/devices/<int:pk>', AdminDeviceView.as_view(), name='admin-device-detail'),
     path('admin/devices/<int:pk>/status', AdminDeviceStatusView.as_view(), name='admin-device-status'),
+    path('admin/orders/status', AdminOrderStatusView.as_view(), name='admin-order-status'),
     path('internal/devices/<int:pk>/metrics', InternalDeviceMetricsView.as_view(), name='internal-device-metrics'),
 ]
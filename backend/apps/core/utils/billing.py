@@ -0,0 +1,241 @@
+"""
+Ежемесячное списание по подпискам.
+
+Подписки ACTIVE с next_payment_date до конца окна (индекс core_sub_status_next_pay_idx)
+делятся на диапазоны id, каждый диапазон обрабатывает отдельная задача Celery.
+Внутри диапазона подписки берутся пачками по id (keyset) с SELECT ... FOR UPDATE SKIP LOCKED:
+на пачку - одна вставка платежей (bulk_create) и один UPDATE, сдвигающий next_payment_date,
+в одной транзакции, поэтому повторный запуск не выставит период дважды.
+
+Платежи создаются в статусе PENDING с картой клиента по умолчанию и списываются
+через платёжный шлюз задачей collect_subscription_payments уже вне транзакции.
+
+Период считается выставленным сразу, поэтому неоплаченные периоды добирает dunning()
+(задача retry_subscription_payments):
+- PENDING платежи, зависшие дольше STALE_AFTER (неизвестный исход, упавший воркер), отправляются
+  повторно с тем же external_id - процессор не спишет их дважды
+- по периоду, все попытки которого FAILED, раз в RETRY_INTERVAL создаётся новая попытка
+  (external_id SUB-<подписка>-<дата>-<номер>) с текущей картой клиента по умолчанию
+- после MAX_ATTEMPTS неудачных попыток подписка приостанавливается (SUSPENDED)
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Min, OuterRef, Subquery
+from django.utils import timezone
+
+from core.models import Payment, PaymentCard, Subscription
+from core.signals import CACHE_PAYMENTS, CACHE_SUBSCRIPTIONS
+from core.utils.order_payments import STALE_AFTER
+from core.utils.order_transitions import BILLING_PERIOD
+from core.utils.payment_gateway import get_gateway
+from toolkit.utils.cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+# Списываются подписки с датой платежа до конца окна
+BILLING_WINDOW = timedelta(days=1)
+CHUNK_SIZE = 1000
+PARTITIONS = 8
+
+SUBSCRIPTION_PAYMENT_PREFIX = 'SUB-'
+RETRY_INTERVAL = timedelta(days=1)
+MAX_ATTEMPTS = 4
+# Попытки старше окна не рассматриваются (окно покрывает все попытки периода)
+DUNNING_WINDOW = RETRY_INTERVAL * MAX_ATTEMPTS * 3
+
+
+def due_subscriptions(until):
+    return Subscription.objects.filter(status=Subscription.STATUS_ACTIVE, next_payment_date__lte=until)
+
+
+def plan_partitions(until, partitions=PARTITIONS):
+    """
+    Делит id подписок к списанию на partitions непересекающихся диапазонов (start, end]
+    одним запросом MIN/MAX по индексу.
+    """
+    bounds = due_subscriptions(until).aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+    start = bounds['first'] - 1
+    step = max((bounds['last'] - start + partitions - 1) // partitions, 1)
+    return [(low, min(low + step, bounds['last'])) for low in range(start, bounds['last'], step)]
+
+
+def bill_chunk(start_id, end_id, until, chunk_size):
+    """
+    Выставляет платежи по следующей пачке подписок из диапазона (start_id, end_id].
+    Возвращает (id последней подписки пачки, id созданных платежей) или (None, []), если пачка пуста.
+    """
+    default_card = PaymentCard.objects.filter(
+        customer_id=OuterRef('customer_id'), is_default=True
+    ).order_by('-id').values('id')[:1]
+
+    with transaction.atomic():
+        rows = list(
+            due_subscriptions(until)
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(id__gt=start_id, id__lte=end_id)
+            .order_by('id')
+            .annotate(card_id=Subquery(default_card))
+            .values('id', 'order_id', 'customer_id', 'monthly_amount_usd', 'next_payment_date', 'card_id')[:chunk_size]
+        )
+        if not rows:
+            return None, []
+
+        payments = Payment.objects.bulk_create([
+            Payment(
+                order_id=row['order_id'],
+                payment_card_id=row['card_id'],
+                amount=row['monthly_amount_usd'],
+                status=Payment.STATUS_PENDING,
+                external_id=f"{SUBSCRIPTION_PAYMENT_PREFIX}{row['id']}-{row['next_payment_date']:%Y%m%d}",
+            )
+            for row in rows
+        ])
+        Subscription.objects.filter(pk__in=[row['id'] for row in rows]).update(
+            next_payment_date=F('next_payment_date') + BILLING_PERIOD,
+            updated_at=timezone.now(),
+        )
+
+        customers = {row['customer_id'] for row in rows}
+        bump_version(CACHE_PAYMENTS, *customers)
+        bump_version(CACHE_SUBSCRIPTIONS, *customers)
+        payment_ids = [payment.id for payment in payments]
+
+    return rows[-1]['id'], payment_ids
+
+
+def bill_range(start_id, end_id, until, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """
+    Выставляет платежи по всем подпискам диапазона. on_chunk(payment_ids) вызывается
+    после коммита каждой пачки. Возвращает количество выставленных платежей.
+    """
+    billed = 0
+    last_id = start_id
+    while True:
+        last_id, payment_ids = bill_chunk(last_id, end_id, until, chunk_size)
+        if last_id is None:
+            break
+        billed += len(payment_ids)
+        if on_chunk:
+            on_chunk(payment_ids)
+    logger.info('Billed %s subscriptions in (%s, %s]', billed, start_id, end_id)
+    return billed
+
+
+def collect(payment_ids):
+    """
+    Списывает PENDING платежи через шлюз (без открытой транзакции)
+    и сохраняет результаты тремя запросами: bulk_update оплаченных, UPDATE отклонённых
+    и UPDATE платежей с неизвестным исходом (остаются PENDING до следующей попытки dunning).
+    """
+    gateway = get_gateway()
+    payments = list(
+        Payment.objects.filter(pk__in=payment_ids, status=Payment.STATUS_PENDING)
+        .select_related('payment_card', 'order')
+    )
+    now = timezone.now()
+    paid, failed, unknown = [], [], []
+    for payment in payments:
+        result = gateway.charge(payment, payment.payment_card) if payment.payment_card else None
+        if result and result.success:
+            payment.status = Payment.STATUS_PAID
+            payment.paid_at = now
+            payment.transaction_id = result.transaction_id
+            payment.updated_at = now
+            paid.append(payment)
+        elif result and result.unknown:
+            unknown.append(payment.id)
+        else:
+            failed.append(payment.id)
+
+    Payment.objects.bulk_update(paid, ['status', 'paid_at', 'transaction_id', 'updated_at'])
+    Payment.objects.filter(pk__in=failed, status=Payment.STATUS_PENDING).update(
+        status=Payment.STATUS_FAILED, updated_at=now
+    )
+    Payment.objects.filter(pk__in=unknown, status=Payment.STATUS_PENDING).update(updated_at=now)
+    if payments:
+        bump_version(CACHE_PAYMENTS, *{payment.order.customer_id for payment in payments})
+    return len(paid)
+
+
+def parse_attempt(external_id):
+    """'SUB-12-20261019' -> ('SUB-12-20261019', 12, 1), 'SUB-12-20261019-3' -> ('SUB-12-20261019', 12, 3)"""
+    parts = external_id.split('-')
+    period = '-'.join(parts[:3])
+    return period, int(parts[1]), int(parts[3]) if len(parts) > 3 else 1
+
+
+def dunning():
+    """
+    Повторяет неоплаченные периоды подписок (см. описание модуля).
+    Возвращает количество оплаченных платежей.
+    """
+    now = timezone.now()
+    subscription_payments = Payment.objects.filter(external_id__startswith=SUBSCRIPTION_PAYMENT_PREFIX)
+
+    stale_ids = list(
+        subscription_payments.filter(status=Payment.STATUS_PENDING, updated_at__lt=now - STALE_AFTER)
+        .values_list('id', flat=True)
+    )
+
+    periods = defaultdict(list)
+    for row in subscription_payments.filter(created_at__gte=now - DUNNING_WINDOW).values(
+        'external_id', 'status', 'created_at', 'order_id', 'amount'
+    ):
+        period, subscription_id, attempt = parse_attempt(row['external_id'])
+        periods[period].append({**row, 'subscription_id': subscription_id, 'attempt': attempt})
+
+    retries, exhausted = [], []
+    for period, attempts in periods.items():
+        if any(attempt['status'] != Payment.STATUS_FAILED for attempt in attempts):
+            continue
+        last = max(attempts, key=lambda attempt: attempt['attempt'])
+        if last['attempt'] >= MAX_ATTEMPTS:
+            exhausted.append(last['subscription_id'])
+        elif last['created_at'] <= now - RETRY_INTERVAL:
+            retries.append((period, last))
+
+    with transaction.atomic():
+        suspended = dict(
+            Subscription.objects.select_for_update()
+            .filter(pk__in=exhausted, status=Subscription.STATUS_ACTIVE)
+            .values_list('id', 'customer_id')
+        )
+        if suspended:
+            Subscription.objects.filter(pk__in=suspended).update(status=Subscription.STATUS_SUSPENDED, updated_at=now)
+            bump_version(CACHE_SUBSCRIPTIONS, *set(suspended.values()))
+            logger.warning('Suspended %s subscriptions after %s failed payments', len(suspended), MAX_ATTEMPTS)
+
+    retry_ids = []
+    if retries:
+        cards = dict(
+            Subscription.objects.filter(
+                pk__in=[last['subscription_id'] for _, last in retries], status=Subscription.STATUS_ACTIVE
+            )
+            .annotate(card_id=Subquery(
+                PaymentCard.objects.filter(customer_id=OuterRef('customer_id'), is_default=True)
+                .order_by('-id').values('id')[:1]
+            ))
+            .values_list('id', 'card_id')
+        )
+        payments = Payment.objects.bulk_create([
+            Payment(
+                order_id=last['order_id'],
+                payment_card_id=cards[last['subscription_id']],
+                amount=last['amount'],
+                status=Payment.STATUS_PENDING,
+                external_id=f"{period}-{last['attempt'] + 1}",
+            )
+            for period, last in retries
+            if last['subscription_id'] in cards
+        ])
+        retry_ids = [payment.id for payment in payments]
+
+    if stale_ids or retry_ids:
+        logger.info('Retrying %s stale and %s failed subscription payments', len(stale_ids), len(retry_ids))
+        return collect(stale_ids + retry_ids)
+    return 0
@@ -0,0 +1,110 @@
+"""
+Каталог типов устройств в памяти процесса и подбор устройств для услуг помещения.
+
+Каталог загружается из БД одним запросом и живёт в процессе, пока не сменится общая
+версия в кэше (её меняет сигнал сохранения/удаления DeviceType), поэтому подбор
+устройств для заказа не обращается к БД.
+
+Подбор - точная задача 0/1 покрытия: набор разных типов устройства одной категории,
+суммарная площадь покрытия которого не меньше площади помещения, с минимальной стоимостью,
+затем с минимальным числом устройств. Если площадь не покрывается всеми типами,
+выбирается набор с максимальным покрытием.
+"""
+from decimal import Decimal
+
+from core.models import DeviceType
+from core.signals import CACHE_CATALOG
+from toolkit.utils.cache import get_versions
+
+# Услуга -> категория отдельного устройства и флаг поддержки (COMBO не подбираются)
+SERVICES = {
+    'cleaning': (DeviceType.DEVICE_PURIFIER, 'supports_cleaning'),
+    'humidifying': (DeviceType.DEVICE_HUMIDIFIER, 'supports_humidifying'),
+    'aroma': (DeviceType.DEVICE_AROMA, 'supports_aroma'),
+}
+
+# Сколько решений подбора хранить на одну версию каталога
+MAX_COVERS = 4096
+
+_catalog = None
+
+
+def solve_cover(candidates, area_m2):
+    """
+    Возвращает кортеж id типов из candidates, покрывающих area_m2 с минимальной стоимостью.
+
+    Динамика по покрытой площади (ограниченной сверху area_m2): для каждой площади
+    хранится лучший (стоимость, количество) набор, после каждого типа остаются только
+    недоминируемые состояния - не хуже по покрытию или по (стоимости, количеству).
+    """
+    if not candidates:
+        return ()
+    if area_m2 <= 0:
+        cheapest = min(candidates, key=lambda device_type: (device_type.price_usd, device_type.coverage_area_m2))
+        return (cheapest.id,)
+
+    states = [(0.0, Decimal('0'), 0, ())]
+    for device_type in candidates:
+        extended = [
+            (min(area_m2, covered + device_type.coverage_area_m2), cost + device_type.price_usd, count + 1, ids + (device_type.id,))
+            for covered, cost, count, ids in states
+        ]
+        frontier = []
+        for state in sorted(states + extended, key=lambda state: (-state[0], state[1], state[2])):
+            if not frontier or (state[1], state[2]) < (frontier[-1][1], frontier[-1][2]):
+                frontier.append(state)
+        states = frontier
+
+    # Первое состояние фронтира - с максимальным покрытием (полным, если оно достижимо)
+    return states[0][3]
+
+
+class Catalog:
+    def __init__(self, version, device_types):
+        self.version = version
+        self.by_id = {device_type.id: device_type for device_type in device_types}
+        self.candidates = {
+            service: [
+                device_type for device_type in device_types
+                if device_type.device_category == category
+                and getattr(device_type, flag)
+                and device_type.coverage_area_m2 is not None
+            ]
+            for service, (category, flag) in SERVICES.items()
+        }
+        self._covers = {}
+
+    def cover(self, service, area_m2):
+        key = (service, area_m2)
+        if key not in self._covers:
+            if len(self._covers) >= MAX_COVERS:
+                self._covers.clear()
+            self._covers[key] = solve_cover(self.candidates[service], area_m2)
+        return self._covers[key]
+
+    def select_for_services(self, services, area_m2):
+        """
+        Подбирает id типов устройств для услуг помещения.
+        Если выбраны cleaning + humidifying, арома добавляется автоматически (в подарок).
+        """
+        services = set(services)
+        if {'cleaning', 'humidifying'} <= services:
+            services.add('aroma')
+
+        selected = []
+        for service in SERVICES:
+            if service in services:
+                selected.extend(self.cover(service, area_m2))
+        return selected
+
+
+def get_catalog():
+    """
+    Возвращает каталог текущей версии: одно обращение к кэшу за версией,
+    запрос к БД - только после изменения типов устройств.
+    """
+    global _catalog
+    version = get_versions((CACHE_CATALOG,))[0]
+    if _catalog is None or _catalog.version != version:
+        _catalog = Catalog(version, list(DeviceType.objects.order_by('id')))
+    return _catalog
@@ -0,0 +1,135 @@
+"""
+Накопительные счётчики устройств (DeviceStat).
+Инкрементируются при приёме каждой метрики, пересчитываются командой rebuild_device_stats.
+
+Дневные итоги устройств (DeviceDailyStat) пересчитываются целиком за диапазон дат
+задачей core.tasks.rollup_device_daily_stats и командой rollup_device_daily_stats.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from toolkit.utils.db import raw_sql
+
+RECORD_METRIC_SQL = """
+INSERT INTO core_device_stats (device_id, cleaned_air_volume_m3, humidity_hours, metrics_count, created_at, updated_at)
+VALUES (%(device_id)s, %(cleaned)s, %(humidity)s, 1, NOW(), NOW())
+ON CONFLICT (device_id) DO UPDATE SET
+    cleaned_air_volume_m3 = core_device_stats.cleaned_air_volume_m3 + EXCLUDED.cleaned_air_volume_m3,
+    humidity_hours = core_device_stats.humidity_hours + EXCLUDED.humidity_hours,
+    metrics_count = core_device_stats.metrics_count + 1,
+    updated_at = NOW()
+"""
+
+ACTUAL_STATS_SQL = """
+SELECT
+    device_id,
+    COALESCE(SUM(cleaned_air_volume_m3), 0) AS cleaned_air_volume_m3,
+    COUNT(humidity) AS humidity_hours,
+    COUNT(*) AS metrics_count
+FROM core_device_metrics
+GROUP BY device_id
+"""
+
+REBUILD_SQL = f"""
+INSERT INTO core_device_stats (device_id, cleaned_air_volume_m3, humidity_hours, metrics_count, created_at, updated_at)
+SELECT actual.*, NOW(), NOW() FROM ({ACTUAL_STATS_SQL}) actual
+ON CONFLICT (device_id) DO UPDATE SET
+    cleaned_air_volume_m3 = EXCLUDED.cleaned_air_volume_m3,
+    humidity_hours = EXCLUDED.humidity_hours,
+    metrics_count = EXCLUDED.metrics_count,
+    updated_at = NOW()
+"""
+
+# Строки счётчиков устройств, у которых не осталось метрик, обнуляются
+RESET_ORPHANS_SQL = """
+UPDATE core_device_stats stat SET
+    cleaned_air_volume_m3 = 0,
+    humidity_hours = 0,
+    metrics_count = 0,
+    updated_at = NOW()
+WHERE stat.metrics_count <> 0
+    AND NOT EXISTS (SELECT 1 FROM core_device_metrics m WHERE m.device_id = stat.device_id)
+"""
+
+# FULL JOIN: расхождением считаются и устройства без счётчиков, и счётчики устройств без метрик
+DRIFT_SQL = f"""
+SELECT
+    COALESCE(actual.device_id, stat.device_id) AS device_id,
+    COALESCE(actual.cleaned_air_volume_m3, 0) AS actual_cleaned_air_volume_m3,
+    stat.cleaned_air_volume_m3 AS stored_cleaned_air_volume_m3,
+    COALESCE(actual.humidity_hours, 0) AS actual_humidity_hours,
+    stat.humidity_hours AS stored_humidity_hours,
+    COALESCE(actual.metrics_count, 0) AS actual_metrics_count,
+    stat.metrics_count AS stored_metrics_count
+FROM ({ACTUAL_STATS_SQL}) actual
+FULL OUTER JOIN core_device_stats stat ON stat.device_id = actual.device_id
+WHERE stat.id IS NULL
+    OR stat.metrics_count <> COALESCE(actual.metrics_count, 0)
+    OR stat.humidity_hours <> COALESCE(actual.humidity_hours, 0)
+    OR ABS(stat.cleaned_air_volume_m3 - COALESCE(actual.cleaned_air_volume_m3, 0)) > %(tolerance)s
+ORDER BY 1
+"""
+
+ROLLUP_SQL = """
+INSERT INTO core_device_daily_stats
+    (device_id, date, cleaned_air_volume_m3, humidity_hours, metrics_count, created_at, updated_at)
+SELECT
+    device_id,
+    (timestamp AT TIME ZONE %(tz)s)::date AS date,
+    COALESCE(SUM(cleaned_air_volume_m3), 0),
+    COUNT(humidity),
+    COUNT(*),
+    NOW(),
+    NOW()
+FROM core_device_metrics
+WHERE timestamp >= %(start)s AND timestamp < %(end)s
+GROUP BY device_id, date
+ON CONFLICT (device_id, date) DO UPDATE SET
+    cleaned_air_volume_m3 = EXCLUDED.cleaned_air_volume_m3,
+    humidity_hours = EXCLUDED.humidity_hours,
+    metrics_count = EXCLUDED.metrics_count,
+    updated_at = NOW()
+"""
+
+
+def record_metric(metric):
+    """
+    Добавляет метрику в счётчики устройства одним UPSERT в текущей транзакции.
+    Метрики, созданные через bulk_create, сюда не попадают - их учитывает rebuild_device_stats.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_METRIC_SQL, {
+            'device_id': metric.device_id,
+            'cleaned': metric.cleaned_air_volume_m3 or 0.0,
+            'humidity': 1 if metric.humidity is not None else 0,
+        })
+
+
+def find_drift(tolerance=0.01):
+    return raw_sql(DRIFT_SQL, tolerance=tolerance)
+
+
+def rebuild():
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL)
+        rows = cursor.rowcount
+        cursor.execute(RESET_ORPHANS_SQL)
+        return rows + cursor.rowcount
+
+
+def rollup_days(start_date, end_date):
+    """
+    Пересчитывает дневные итоги всех устройств за даты [start_date, end_date] одним запросом.
+    Повторный запуск за те же даты безопасен.
+    """
+    tz = timezone.get_default_timezone()
+    with connection.cursor() as cursor:
+        cursor.execute(ROLLUP_SQL, {
+            'tz': settings.TIME_ZONE,
+            'start': timezone.make_aware(datetime.combine(start_date, time.min), tz),
+            'end': timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz),
+        })
+        return cursor.rowcount
@@ -0,0 +1,105 @@
+"""
+Сводка по устройствам клиента для главного экрана.
+Считается одним сгруппированным SQL запросом по последним метрикам устройств.
+Очищенный воздух за 7 дней берётся из дневных итогов (DeviceDailyStat) за 6 прошедших дней
+плюс сырые метрики с начала сегодняшнего дня; сырые метрики читаются только за последние 24 часа.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from core.models import DeviceInstance
+from toolkit.utils.db import raw_sql
+
+# Износ фильтра, при котором нужна замена (%)
+FILTER_WEAR_THRESHOLD = 80
+# Уровень жидкости, при котором нужна дозаправка (%)
+LIQUID_REFILL_THRESHOLD = 20
+
+FLEET_SUMMARY_SQL = """
+WITH devices AS (
+    SELECT d.id, d.room_id, d.is_power_on
+    FROM core_device_instances d
+    WHERE d.customer_id = %(customer_id)s AND d.status NOT IN %(excluded_statuses)s
+),
+latest AS (
+    SELECT DISTINCT ON (m.device_id)
+        m.device_id, m.pm25, m.humidity, m.filter_wear_percent, m.liquid_level_percent
+    FROM core_device_metrics m
+    WHERE m.device_id IN (SELECT id FROM devices)
+    ORDER BY m.device_id, m.timestamp DESC
+),
+cleaned AS (
+    SELECT device_id, SUM(cleaned_24h) AS cleaned_24h, SUM(cleaned_7d) AS cleaned_7d
+    FROM (
+        SELECT
+            m.device_id,
+            SUM(m.cleaned_air_volume_m3) AS cleaned_24h,
+            SUM(m.cleaned_air_volume_m3) FILTER (WHERE m.timestamp >= %(today_start)s) AS cleaned_7d
+        FROM core_device_metrics m
+        WHERE m.device_id IN (SELECT id FROM devices) AND m.timestamp >= %(day_ago)s
+        GROUP BY m.device_id
+        UNION ALL
+        SELECT s.device_id, 0, SUM(s.cleaned_air_volume_m3)
+        FROM core_device_daily_stats s
+        WHERE s.device_id IN (SELECT id FROM devices) AND s.date >= %(week_start)s AND s.date < %(today)s
+        GROUP BY s.device_id
+    ) parts
+    GROUP BY device_id
+)
+SELECT
+    GROUPING(d.room_id) = 1 AS is_total,
+    d.room_id,
+    r.name AS room_name,
+    COUNT(*) AS devices_count,
+    COUNT(*) FILTER (WHERE d.is_power_on) AS devices_on,
+    COUNT(*) FILTER (WHERE NOT d.is_power_on) AS devices_off,
+    AVG(l.pm25) AS avg_pm25,
+    MAX(l.pm25) AS max_pm25,
+    AVG(l.humidity) AS avg_humidity,
+    COUNT(*) FILTER (WHERE l.filter_wear_percent >= %(filter_threshold)s) AS filter_replacement_needed,
+    COUNT(*) FILTER (WHERE l.liquid_level_percent <= %(refill_threshold)s) AS refill_needed,
+    COALESCE(SUM(c.cleaned_24h), 0) AS cleaned_air_24h_m3,
+    COALESCE(SUM(c.cleaned_7d), 0) AS cleaned_air_7d_m3
+FROM devices d
+LEFT JOIN core_rooms r ON r.id = d.room_id
+LEFT JOIN latest l ON l.device_id = d.id
+LEFT JOIN cleaned c ON c.device_id = d.id
+GROUP BY GROUPING SETS ((d.room_id, r.name), ())
+ORDER BY is_total DESC, r.name
+"""
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def fleet_summary(customer_id):
+    now = timezone.now()
+    today = timezone.localdate(now)
+    rows = raw_sql(
+        FLEET_SUMMARY_SQL,
+        customer_id=customer_id,
+        excluded_statuses=(DeviceInstance.STATUS_DISABLED, DeviceInstance.STATUS_MAINTENANCE),
+        day_ago=now - timedelta(days=1),
+        today=today,
+        today_start=timezone.make_aware(datetime.combine(today, time.min)),
+        week_start=today - timedelta(days=6),
+        filter_threshold=FILTER_WEAR_THRESHOLD,
+        refill_threshold=LIQUID_REFILL_THRESHOLD,
+    )
+
+    overall = None
+    rooms = []
+    for row in rows:
+        is_total = row.pop('is_total')
+        for field in ('avg_pm25', 'max_pm25', 'avg_humidity', 'cleaned_air_24h_m3', 'cleaned_air_7d_m3'):
+            row[field] = _round(row[field])
+        if is_total:
+            row.pop('room_id')
+            row.pop('room_name')
+            overall = row
+        else:
+            rooms.append(row)
+
+    return {'overall': overall, 'rooms': rooms}
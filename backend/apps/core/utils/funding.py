@@ -0,0 +1,133 @@
+"""
+Счётчик привлечённых инвестиций устройства (DeviceInstance.funded_usd).
+Резервирование - один условный UPDATE без блокировок и SUM по инвестициям:
+границы DeviceType.min_investment_usd / max_investment_usd проверяются в том же запросе, что и увеличение счётчика.
+Сумма резервируется при создании инвестиции (PENDING) и освобождается при отмене (CANCELLED)
+или когда оплата не подтверждена за PENDING_TTL (FAILED, задача core.tasks.expire_pending_investments).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from django.utils import timezone
+
+from core.models import DeviceInstance, Investment
+from core.signals import CACHE_AVAILABLE_DEVICES
+from toolkit.utils.cache import bump_version
+from toolkit.utils.db import raw_sql
+
+# Статусы инвестиций, занимающих лимит устройства
+RESERVING_STATUSES = (Investment.STATUS_PENDING, Investment.STATUS_PAID)
+
+RESERVE_SQL = """
+UPDATE core_device_instances d
+SET funded_usd = d.funded_usd + %(amount)s
+FROM core_device_types t
+WHERE d.id = %(device_id)s
+    AND t.id = d.device_type_id
+    AND d.status = %(status)s
+    AND %(amount)s >= t.min_investment_usd
+    AND d.funded_usd + %(amount)s <= t.max_investment_usd
+RETURNING d.funded_usd
+"""
+
+# Время на подтверждение оплаты, после которого резерв освобождается
+PENDING_TTL = timedelta(hours=24)
+
+# Один запрос: просроченные PENDING инвестиции переводятся в FAILED, их суммы вычитаются из счётчиков.
+# Условие status = PENDING в том же UPDATE гарантирует, что каждый резерв освобождается ровно один раз.
+EXPIRE_SQL = """
+WITH expired AS (
+    UPDATE core_investments
+    SET status = %(failed)s, updated_at = NOW()
+    WHERE status = %(pending)s AND created_at < %(cutoff)s
+    RETURNING device_id, amount_usd
+),
+released AS (
+    UPDATE core_device_instances d
+    SET funded_usd = d.funded_usd - e.amount
+    FROM (SELECT device_id, SUM(amount_usd) AS amount FROM expired GROUP BY device_id) e
+    WHERE d.id = e.device_id
+)
+SELECT COUNT(*) FROM expired
+"""
+
+ACTUAL_FUNDED_SQL = """
+SELECT d.id AS device_id, d.funded_usd AS stored_funded_usd, COALESCE(SUM(i.amount_usd), 0) AS actual_funded_usd
+FROM core_device_instances d
+LEFT JOIN core_investments i ON i.device_id = d.id AND i.status IN %(statuses)s
+GROUP BY d.id
+"""
+
+DRIFT_SQL = f"""
+SELECT * FROM ({ACTUAL_FUNDED_SQL}) funded
+WHERE stored_funded_usd <> actual_funded_usd
+ORDER BY device_id
+"""
+
+RECONCILE_SQL = f"""
+UPDATE core_device_instances d
+SET funded_usd = funded.actual_funded_usd
+FROM ({ACTUAL_FUNDED_SQL}) funded
+WHERE d.id = funded.device_id AND d.funded_usd <> funded.actual_funded_usd
+"""
+
+
+def reserve(device_id, amount):
+    """
+    Увеличивает счётчик активного устройства на amount, если не превышен лимит типа.
+    Возвращает новое значение funded_usd или None, если резерв невозможен.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RESERVE_SQL, {'device_id': device_id, 'amount': amount, 'status': DeviceInstance.STATUS_ACTIVE})
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    bump_version(CACHE_AVAILABLE_DEVICES)
+    return row[0]
+
+
+def release(device_id, amount):
+    DeviceInstance.objects.filter(pk=device_id).update(funded_usd=F('funded_usd') - amount)
+    bump_version(CACHE_AVAILABLE_DEVICES)
+
+
+def close_pending(investment, status):
+    """
+    Переводит PENDING инвестицию в status и освобождает её резерв (отмена инвестором).
+    Условный UPDATE гарантирует, что резерв освобождается ровно один раз.
+    Возвращает False, если инвестиция уже не в PENDING.
+    """
+    with transaction.atomic():
+        updated = Investment.objects.filter(pk=investment.pk, status=Investment.STATUS_PENDING).update(status=status)
+        if updated:
+            release(investment.device_id, investment.amount_usd)
+    return bool(updated)
+
+
+def expire_pending(ttl=PENDING_TTL):
+    """
+    Переводит PENDING инвестиции старше ttl в FAILED и освобождает их резерв.
+    Возвращает количество истёкших инвестиций.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(EXPIRE_SQL, {
+            'failed': Investment.STATUS_FAILED,
+            'pending': Investment.STATUS_PENDING,
+            'cutoff': timezone.now() - ttl,
+        })
+        expired = cursor.fetchone()[0]
+    if expired:
+        bump_version(CACHE_AVAILABLE_DEVICES)
+    return expired
+
+
+def find_drift():
+    return raw_sql(DRIFT_SQL, statuses=RESERVING_STATUSES)
+
+
+def reconcile():
+    with connection.cursor() as cursor:
+        cursor.execute(RECONCILE_SQL, {'statuses': RESERVING_STATUSES})
+        return cursor.rowcount
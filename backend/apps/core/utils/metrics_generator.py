@@ -8,13 +8,14 @@ from datetime import timedelta
 from core.models import DeviceInstance, DeviceMetric, DeviceType
 
 
-def generate_metric_for_device(device: DeviceInstance, timestamp=None):
+def generate_metric_for_device(device: DeviceInstance, timestamp=None, last_metric=None):
     """
     Генерирует одну метрику для устройства.
     
     Args:
         device: Экземпляр DeviceInstance
         timestamp: Время метрики (по умолчанию текущее время)
+        last_metric: Последняя метрика устройства, если уже загружена
     
     Returns:
         DeviceMetric: Созданная метрика
@@ -22,6 +23,9 @@ def generate_metric_for_device(device: DeviceInstance, timestamp=None):
     if timestamp is None:
         timestamp = timezone.now()
     
+    if last_metric is None:
+        last_metric = DeviceMetric.objects.filter(device=device).order_by('-timestamp').first()
+    
     device_type = device.device_type
     metric_data = {
         'device': device,
@@ -50,8 +54,6 @@ def generate_metric_for_device(device: DeviceInstance, timestamp=None):
             metric_data['cleaned_air_volume_m3'] = 0.0
         
         # Износ фильтра: увеличивается со временем
-        # Получаем последнюю метрику для расчёта износа
-        last_metric = DeviceMetric.objects.filter(device=device).order_by('-timestamp').first()
         if last_metric and last_metric.filter_wear_percent is not None:
             # Увеличиваем износ на 0.1-0.5% за метрику (если устройство работает)
             wear_increase = random.uniform(0.1, 0.5) if device.is_power_on else 0.0
@@ -73,7 +75,6 @@ def generate_metric_for_device(device: DeviceInstance, timestamp=None):
         metric_data['humidity'] = round(humidity_base, 1)
         
         # Уровень жидкости в баке: уменьшается со временем
-        last_metric = DeviceMetric.objects.filter(device=device).order_by('-timestamp').first()
         if last_metric and last_metric.liquid_level_percent is not None:
             # Уменьшаем уровень на 0.5-2% за метрику (если устройство работает)
             level_decrease = random.uniform(0.5, 2.0) if device.is_power_on else 0.0
@@ -90,7 +91,6 @@ def generate_metric_for_device(device: DeviceInstance, timestamp=None):
             pass
         elif not device_type.supports_cleaning:
             # Для чистых увлажнителей тоже может быть фильтр
-            last_metric = DeviceMetric.objects.filter(device=device).order_by('-timestamp').first()
             if last_metric and last_metric.filter_wear_percent is not None:
                 wear_increase = random.uniform(0.05, 0.3) if device.is_power_on else 0.0
                 filter_wear = min(100.0, last_metric.filter_wear_percent + wear_increase)
@@ -144,15 +144,18 @@ def ensure_device_has_recent_metrics(device: DeviceInstance, hours_back=1):
         hours_back: Количество часов назад, после которых нужно создать новую метрику
     """
     last_metric = DeviceMetric.objects.filter(device=device).order_by('-timestamp').first()
+    refresh_stale_metric(device, last_metric, hours_back=hours_back)
+
+
+def refresh_stale_metric(device: DeviceInstance, last_metric, hours_back=1):
+    """
+    То же, что ensure_device_has_recent_metrics, но для уже загруженной последней метрики
+    (например, из prefetch). Не делает запросов, если метрика свежая.
     
-    if not last_metric:
-        # Нет метрик вообще - создаём первую
-        generate_metric_for_device(device)
-        return
-    
-    # Проверяем, не устарела ли последняя метрика
+    Returns:
+        DeviceMetric: Актуальная последняя метрика устройства
+    """
     threshold = timezone.now() - timedelta(hours=hours_back)
-    if last_metric.timestamp < threshold:
-        # Создаём новую метрику
-        generate_metric_for_device(device)
-
+    if last_metric is None or last_metric.timestamp < threshold:
+        return generate_metric_for_device(device, last_metric=last_metric)
+    return last_metric
@@ -0,0 +1,81 @@
+"""
+Обработчики событий заказов (core.utils.outbox).
+Повторный запуск обработчика после ошибки не должен дублировать устройства, подписки и письма:
+каждый шаг проверяет, что уже сделан.
+
+Письма отправляются отдельными событиями customer.email: обработчик заказа только публикует
+событие письма в своей транзакции, поэтому письмо ставится в очередь ровно один раз,
+а повтор после ошибки SMTP не повторяет остальные шаги.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import CustomerOrder, OrderDevice, Subscription
+from core.utils import outbox
+from core.utils.outbox import handler
+from core.utils.provisioning import provision_order_devices
+from users.models import User
+
+ORDER_PAID = 'order.paid'
+ORDER_ACTIVATED = 'order.activated'
+CUSTOMER_EMAIL = 'customer.email'
+
+
+@handler(ORDER_PAID)
+def handle_order_paid(payload):
+    """
+    Оплаченный заказ: устройства, подписка в статусе SUSPENDED (ACTIVE, если заказ уже активирован) и письмо клиенту.
+    Заказ блокируется: активация заказа администратором ждёт создания подписки и затем активирует её сама.
+    """
+    order = CustomerOrder.objects.select_for_update().prefetch_related(
+        'order_rooms__order_room_device_types'
+    ).get(pk=payload['order_id'])
+
+    if not OrderDevice.objects.filter(order=order).exists():
+        provision_order_devices(order)
+
+    # Подписка будет активирована автоматически когда заказ станет ACTIVE (после установки).
+    # Если заказ активировали раньше, чем обработано это событие, подписка сразу создаётся активной.
+    # Ежемесячная стоимость = общая стоимость заказа (разовая установка не включена в подписку)
+    now = timezone.now()
+    is_active = order.status == CustomerOrder.STATUS_ACTIVE
+    _, created = Subscription.objects.get_or_create(order=order, defaults={
+        'customer_id': order.customer_id,
+        'status': Subscription.STATUS_ACTIVE if is_active else Subscription.STATUS_SUSPENDED,
+        'monthly_amount_usd': order.total_cost,
+        'start_date': now,  # Для SUSPENDED будет пересчитано при активации
+        'next_payment_date': now + timedelta(days=30),
+    })
+
+    if created:
+        publish_email(
+            order.customer_id,
+            f'Заказ #{order.id} оплачен, {settings.COMPANY_NAME}',
+            f'Оплата заказа #{order.id} на сумму {order.total_cost} USD получена. '
+            f'Мы свяжемся с вами для согласования установки.',
+        )
+
+
+@handler(ORDER_ACTIVATED)
+def handle_order_activated(payload):
+    """
+    Заказ установлен и активен: письмо клиенту. Подписка активируется синхронно вместе со статусом заказа.
+    """
+    order = CustomerOrder.objects.get(pk=payload['order_id'])
+    publish_email(
+        order.customer_id,
+        f'Заказ #{order.id} установлен, {settings.COMPANY_NAME}',
+        f'Устройства по заказу #{order.id} установлены, подписка на обслуживание активирована.',
+    )
+
+
+def publish_email(user_id, subject, message):
+    outbox.publish(CUSTOMER_EMAIL, {'user_id': user_id, 'subject': subject, 'message': message})
+
+
+@handler(CUSTOMER_EMAIL)
+def handle_customer_email(payload):
+    """Единственный побочный эффект события - отправка письма, повторяется только если она не удалась."""
+    User.objects.get(pk=payload['user_id']).email_user(payload['subject'], payload['message'])
@@ -0,0 +1,96 @@
+"""
+Списание оплаты заказа через платёжный шлюз и фиксация результата.
+
+Платёж создаётся в статусе PENDING до запроса к шлюзу (CustomerOrderPayView), результат
+фиксируется условными UPDATE по статусу PENDING, поэтому параллельный запрос клиента
+и задача сверки не зафиксируют один платёж дважды.
+
+Если исход списания неизвестен, платёж остаётся PENDING. Повторная оплата заказа
+и задача core.tasks.reconcile_order_payments отправляют его в шлюз ещё раз с тем же
+external_id (ключ идемпотентности процессора), поэтому деньги не спишутся дважды.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import CustomerOrder, Payment
+from core.signals import CACHE_PAYMENTS
+from core.utils import outbox
+from core.utils.order_events import ORDER_PAID
+from core.utils.payment_gateway import get_gateway
+from toolkit.utils.cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+ORDER_PAYMENT_PREFIX = 'ORDER-'
+# Платёж PENDING дольше этого времени (больше всех таймаутов и повторов шлюза) считается зависшим
+STALE_AFTER = timedelta(minutes=5)
+
+
+def charge(payment):
+    """Отправляет платёж в шлюз (вне транзакции) и фиксирует результат, возвращает обновлённый платёж."""
+    result = get_gateway().charge(payment, payment.payment_card)
+    return finalize(payment, result)
+
+
+def finalize(payment, result):
+    """
+    Фиксирует результат списания:
+    - исход неизвестен - платёж остаётся PENDING
+    - отказ - платёж FAILED, заказ остаётся PENDING
+    - успех - платёж PAID, заказ APPROVED и событие order.paid в одной транзакции;
+      если заказ за время списания перестал быть PENDING, платёж помечается REFUND_REQUIRED
+    """
+    now = timezone.now()
+    if result.unknown:
+        # updated_at откладывает следующую попытку сверки на STALE_AFTER
+        logger.warning('Payment %s result is unknown, left PENDING', payment.external_id)
+        Payment.objects.filter(pk=payment.pk, status=Payment.STATUS_PENDING).update(updated_at=now)
+        payment.refresh_from_db()
+        return payment
+
+    with transaction.atomic():
+        order = CustomerOrder.objects.select_for_update().get(pk=payment.order_id)
+        pending = Payment.objects.filter(pk=payment.pk, status=Payment.STATUS_PENDING)
+
+        if not result.success:
+            pending.update(status=Payment.STATUS_FAILED, updated_at=now)
+        elif order.status != CustomerOrder.STATUS_PENDING:
+            if pending.update(status=Payment.STATUS_REFUND_REQUIRED, transaction_id=result.transaction_id, updated_at=now):
+                logger.error(
+                    'Payment %s charged for order %s in status %s, refund required',
+                    payment.external_id, order.id, order.status
+                )
+        elif pending.update(status=Payment.STATUS_PAID, paid_at=now, transaction_id=result.transaction_id, updated_at=now):
+            order.status = CustomerOrder.STATUS_APPROVED
+            order.save_changed()
+            # Устройства, подписка и письмо клиенту создаются асинхронно (core.utils.order_events),
+            # событие пишется в той же транзакции, что и оплата
+            outbox.publish(ORDER_PAID, {'order_id': order.id, 'payment_id': payment.id})
+
+        bump_version(CACHE_PAYMENTS, order.customer_id)
+
+    payment.refresh_from_db()
+    return payment
+
+
+def stale_payments(stale_after=STALE_AFTER):
+    return Payment.objects.filter(
+        status=Payment.STATUS_PENDING,
+        external_id__startswith=ORDER_PAYMENT_PREFIX,
+        updated_at__lt=timezone.now() - stale_after,
+    ).select_related('payment_card').order_by('id')
+
+
+def reconcile(stale_after=STALE_AFTER):
+    """
+    Повторно отправляет зависшие PENDING платежи заказов с тем же external_id
+    (упавший воркер, неизвестный исход). Возвращает количество платежей с известным исходом.
+    """
+    resolved = 0
+    for payment in stale_payments(stale_after):
+        resolved += charge(payment).status != Payment.STATUS_PENDING
+    logger.info('Reconciled %s stale order payments', resolved)
+    return resolved
@@ -0,0 +1,77 @@
+"""
+Массовая смена статусов заказов.
+Проверка переходов - по одному SELECT, затем один UPDATE заказов на целевой статус
+и одно множественное обновление подписок при переходе в ACTIVE.
+Сигналы save() не вызываются, поэтому кэши клиентов сбрасываются здесь.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import CustomerOrder, Subscription
+from core.signals import CACHE_ORDERS, CACHE_SUBSCRIPTIONS
+from core.utils import outbox
+from core.utils.order_events import ORDER_ACTIVATED
+from toolkit.utils.cache import bump_version
+
+# Допустимые переходы: текущий статус -> статусы, в которые его можно перевести
+ALLOWED_TRANSITIONS = {
+    CustomerOrder.STATUS_PENDING: {CustomerOrder.STATUS_APPROVED, CustomerOrder.STATUS_CANCELLED},
+    CustomerOrder.STATUS_APPROVED: {CustomerOrder.STATUS_INSTALLED, CustomerOrder.STATUS_CANCELLED},
+    CustomerOrder.STATUS_INSTALLED: {CustomerOrder.STATUS_ACTIVE},
+    CustomerOrder.STATUS_ACTIVE: {CustomerOrder.STATUS_CANCELLED},
+    CustomerOrder.STATUS_CANCELLED: set(),
+}
+
+# Период первого платежа активированной подписки (как в CustomerOrder._activate_subscription)
+BILLING_PERIOD = timedelta(days=30)
+
+
+def transition_orders(order_ids, status, user=None):
+    """
+    Переводит заказы order_ids в status.
+    Заказы, для которых переход недопустим, не меняются.
+    Возвращает {'updated': [id, ...], 'rejected': {id: текущий статус}, 'missing': [id, ...]}.
+    """
+    if status not in ALLOWED_TRANSITIONS:
+        raise ValueError(f'Unknown order status: {status}')
+
+    order_ids = set(order_ids)
+    with transaction.atomic():
+        rows = list(
+            CustomerOrder.objects.select_for_update()
+            .filter(pk__in=order_ids)
+            .values_list('id', 'status', 'customer_id')
+        )
+        updated, rejected, customers = [], {}, set()
+        for pk, current, customer_id in rows:
+            if status in ALLOWED_TRANSITIONS[current]:
+                updated.append(pk)
+                customers.add(customer_id)
+            else:
+                rejected[pk] = current
+
+        if updated:
+            now = timezone.now()
+            CustomerOrder.objects.filter(pk__in=updated).update(status=status, updated_at=now, updated_by=user)
+            bump_version(CACHE_ORDERS, *customers)
+
+            if status == CustomerOrder.STATUS_ACTIVE:
+                activated = Subscription.objects.filter(
+                    order_id__in=updated, status=Subscription.STATUS_SUSPENDED
+                ).update(
+                    status=Subscription.STATUS_ACTIVE,
+                    start_date=now,
+                    next_payment_date=now + BILLING_PERIOD,
+                    updated_at=now,
+                )
+                if activated:
+                    bump_version(CACHE_SUBSCRIPTIONS, *customers)
+                outbox.publish_many(ORDER_ACTIVATED, [{'order_id': pk} for pk in updated])
+
+    return {
+        'updated': sorted(updated),
+        'rejected': rejected,
+        'missing': sorted(order_ids - {row[0] for row in rows}),
+    }
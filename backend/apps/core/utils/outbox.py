@@ -0,0 +1,99 @@
+"""
+Transactional outbox: побочные эффекты изменений выполняются асинхронно и с повторами.
+
+publish() пишет событие в текущей транзакции и после коммита будит задачу relay_outbox.
+relay() забирает готовые события по одному через SELECT ... FOR UPDATE SKIP LOCKED,
+поэтому несколько воркеров обрабатывают разные события. Каждое событие обрабатывается
+и фиксируется в своей транзакции: блокировка держится только на время одного обработчика,
+а ошибка откладывает только это событие (экспоненциальная задержка) и не откатывает уже
+обработанные. После MAX_ATTEMPTS событие помечается FAILED. Обработчики должны быть идемпотентными.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+# Задержка повтора: RETRY_DELAY * 2^(попытка - 1), не больше MAX_RETRY_DELAY
+RETRY_DELAY = timedelta(seconds=30)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+HANDLERS = {}
+
+
+def handler(topic):
+    def register(function):
+        HANDLERS[topic] = function
+        return function
+    return register
+
+
+def publish(topic, payload):
+    from core.tasks import relay_outbox
+
+    event = OutboxEvent.objects.create(topic=topic, payload=payload, available_at=timezone.now())
+    transaction.on_commit(relay_outbox.delay)
+    return event
+
+
+def publish_many(topic, payloads):
+    """Одна вставка на все события (например, массовая смена статусов заказов)."""
+    from core.tasks import relay_outbox
+
+    now = timezone.now()
+    events = OutboxEvent.objects.bulk_create([
+        OutboxEvent(topic=topic, payload=payload, available_at=now) for payload in payloads
+    ])
+    if events:
+        transaction.on_commit(relay_outbox.delay)
+    return events
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def process(event):
+    try:
+        with transaction.atomic():
+            HANDLERS[event.topic](event.payload)
+    except Exception as e:
+        logger.exception('Outbox event %s (%s) failed', event.id, event.topic)
+        event.attempts += 1
+        event.last_error = repr(e)
+        if event.attempts >= MAX_ATTEMPTS:
+            event.status = OutboxEvent.STATUS_FAILED
+        else:
+            event.available_at = timezone.now() + retry_delay(event.attempts)
+        event.save(update_fields=['attempts', 'last_error', 'status', 'available_at', 'updated_at'])
+        return False
+
+    event.status = OutboxEvent.STATUS_DONE
+    event.processed_at = timezone.now()
+    event.save(update_fields=['status', 'processed_at', 'updated_at'])
+    return True
+
+
+def relay():
+    """
+    Обрабатывает готовые события, пока они есть. Возвращает количество успешно обработанных.
+    """
+    from core.utils import order_events  # noqa: F401 - регистрирует обработчики
+
+    processed = 0
+    while True:
+        with transaction.atomic():
+            event = (
+                OutboxEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=OutboxEvent.STATUS_PENDING, available_at__lte=timezone.now())
+                .order_by('available_at', 'id')
+                .first()
+            )
+            if event is None:
+                return processed
+            processed += process(event)
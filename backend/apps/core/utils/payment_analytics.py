@@ -0,0 +1,61 @@
+"""
+Аналитика платежей клиента для истории платежей.
+Итоги за всё время, за 30 и 7 дней считаются одним запросом условной агрегации
+(Sum/Count с filter). Помесячная разбивка - тем же запросом с группировкой по месяцу,
+итоги в этом случае складываются из месяцев.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from core.models import Payment
+
+WINDOWS = (('recent_30_days', 30), ('recent_7_days', 7))
+
+
+def aggregates(now):
+    paid = Q(status=Payment.STATUS_PAID)
+    zero = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+    result = {
+        'total_paid': Coalesce(Sum('amount', filter=paid), zero),
+        'total_payments': Count('id', filter=paid),
+    }
+    for name, days in WINDOWS:
+        window = paid & Q(created_at__gte=now - timedelta(days=days))
+        result[f'{name}_total'] = Coalesce(Sum('amount', filter=window), zero)
+        result[f'{name}_count'] = Count('id', filter=window)
+    return result
+
+
+def format_analytics(row):
+    analytics = {
+        'total_paid': float(row['total_paid']),
+        'total_payments': row['total_payments'],
+    }
+    for name, _ in WINDOWS:
+        analytics[name] = {'total': float(row[f'{name}_total']), 'count': row[f'{name}_count']}
+    return analytics
+
+
+def payment_analytics(customer_id, monthly=False):
+    payments = Payment.objects.filter(order__customer_id=customer_id).order_by()
+    now = timezone.now()
+    if not monthly:
+        return format_analytics(payments.aggregate(**aggregates(now)))
+
+    months = list(
+        payments.annotate(month=TruncMonth('created_at'))
+        .values('month')
+        .annotate(**aggregates(now))
+        .order_by('month')
+    )
+    totals = {key: sum(month[key] for month in months) for key in aggregates(now)}
+    analytics = format_analytics(totals)
+    analytics['monthly'] = [{
+        'month': month['month'].strftime('%Y-%m'),
+        'total': float(month['total_paid']),
+        'count': month['total_payments'],
+    } for month in months]
+    return analytics
@@ -0,0 +1,134 @@
+"""
+Клиент платёжного шлюза.
+
+Шлюз выбирается настройкой PAYMENT_GATEWAY['BACKEND']:
+- 'stub' - ответ формируется в процессе без сети (разработка и тесты)
+- 'http' - HTTP API процессора (или локальный stub-сервер: manage.py run_payment_gateway_stub)
+
+HTTP клиент один на процесс: keep-alive пул соединений, жёсткие таймауты подключения и чтения,
+повторы только на ошибках соединения и 502/503/504. Повтор безопасен, потому что каждый платёж
+отправляется с заголовком Idempotency-Key = Payment.external_id.
+
+Если исход списания неизвестен (таймаут, ошибка соединения, 5xx после повторов, ответ не JSON),
+шлюз возвращает ChargeResult(unknown=True): процессор мог списать деньги, поэтому платёж
+остаётся PENDING и позже отправляется повторно с тем же external_id (core.utils.order_payments).
+
+Вызов шлюза выполняется вне транзакции БД (см. CustomerOrderPayView).
+"""
+import logging
+from dataclasses import dataclass
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Карта, платежи по которой отклоняются (как тестовые карты процессоров)
+DECLINED_CARD_LAST4 = '0002'
+# Карта, платежи по которой stub-шлюз оставляет без ответа (как таймаут процессора)
+UNAVAILABLE_CARD_LAST4 = '0003'
+
+_gateway = None
+
+
+@dataclass(frozen=True)
+class ChargeResult:
+    success: bool
+    transaction_id: str = None
+    error: str = None
+    # Исход неизвестен: списание могло пройти, платёж нельзя считать отклонённым
+    unknown: bool = False
+
+
+UNKNOWN_RESULT = ChargeResult(success=False, error='Payment gateway is unavailable', unknown=True)
+
+
+def charge_payload(payment, card):
+    return {
+        'reference': payment.external_id,
+        'amount': str(payment.amount),
+        'currency': 'USD',
+        'card_last4': card.card_number_last4,
+    }
+
+
+class StubGateway:
+    def charge(self, payment, card):
+        if card.card_number_last4 == DECLINED_CARD_LAST4:
+            return ChargeResult(success=False, error='Card declined')
+        if card.card_number_last4 == UNAVAILABLE_CARD_LAST4:
+            return UNKNOWN_RESULT
+        return ChargeResult(success=True, transaction_id=f'TXN-{payment.external_id}')
+
+
+class HttpGateway:
+    def __init__(self, url, api_key='', connect_timeout=3.05, read_timeout=10, retries=2, pool_size=10):
+        self.url = url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {api_key}'
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            backoff_factor=0.2,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def charge(self, payment, card):
+        try:
+            response = self.session.post(
+                f'{self.url}/charges',
+                json=charge_payload(payment, card),
+                headers={'Idempotency-Key': payment.external_id},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            logger.warning('Payment gateway request failed for %s: %s', payment.external_id, e)
+            return UNKNOWN_RESULT
+
+        # 5xx после повторов и 409 (тот же ключ ещё обрабатывается процессором) - исход неизвестен
+        if response.status_code >= 500 or response.status_code == 409:
+            logger.warning('Payment gateway error %s for %s', response.status_code, payment.external_id)
+            return UNKNOWN_RESULT
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            # Например, HTML страница ошибки прокси
+            logger.warning('Payment gateway returned non-JSON %s for %s', response.status_code, payment.external_id)
+            return UNKNOWN_RESULT
+
+        if data.get('status') != 'succeeded':
+            return ChargeResult(success=False, error=data.get('error') or 'Payment declined')
+        return ChargeResult(success=True, transaction_id=data.get('id'))
+
+
+def build_gateway(config):
+    if config.get('BACKEND', 'stub') == 'stub':
+        return StubGateway()
+    return HttpGateway(
+        config['URL'],
+        api_key=config.get('API_KEY', ''),
+        connect_timeout=config.get('CONNECT_TIMEOUT', 3.05),
+        read_timeout=config.get('READ_TIMEOUT', 10),
+        retries=config.get('RETRIES', 2),
+        pool_size=config.get('POOL_SIZE', 10),
+    )
+
+
+def get_gateway():
+    """Шлюз процесса: пул соединений переиспользуется всеми запросами воркера."""
+    global _gateway
+    if _gateway is None:
+        _gateway = build_gateway(settings.PAYMENT_GATEWAY)
+    return _gateway
@@ -0,0 +1,82 @@
+"""
+Дневной временной ряд портфеля инвестора.
+Строится одним сгруппированным запросом по дневным итогам устройств (DeviceDailyStat):
+показатели устройства входят в портфель пропорционально доле инвестиции в устройстве
+начиная с даты оплаты. Доля за день считается от суммы PAID инвестиций устройства,
+оплаченных к этому дню: резервы PENDING (входят в funded_usd) и последующие оплаты
+не меняют долю в прошлых днях.
+"""
+from django.conf import settings
+
+from core.models import Investment
+from toolkit.utils.db import raw_sql
+
+DAYS_IN_MONTH = 30.4375
+
+SERIES_SQL = """
+WITH days AS (
+    SELECT generate_series(%(start)s::date, %(end)s::date, interval '1 day')::date AS date
+),
+paid AS (
+    SELECT i.investor_id, i.device_id, i.amount_usd,
+        (COALESCE(i.paid_at, i.created_at) AT TIME ZONE %(tz)s)::date AS start_date
+    FROM core_investments i
+    WHERE i.status = %(status)s
+      AND i.device_id IN (SELECT device_id FROM core_investments WHERE investor_id = %(investor_id)s)
+),
+funding AS (
+    SELECT days.date, paid.device_id, SUM(paid.amount_usd) AS paid_usd
+    FROM days
+    JOIN paid ON paid.start_date <= days.date
+    GROUP BY days.date, paid.device_id
+),
+positions AS (
+    SELECT
+        p.device_id,
+        p.start_date,
+        p.amount_usd,
+        (p.amount_usd * t.investment_profit_percentage / 100)::float AS nominal_return,
+        t.investment_period_months * %(days_in_month)s AS period_days
+    FROM paid p
+    JOIN core_device_instances d ON d.id = p.device_id
+    JOIN core_device_types t ON t.id = d.device_type_id
+    WHERE p.investor_id = %(investor_id)s
+)
+SELECT
+    days.date,
+    COALESCE(SUM(s.cleaned_air_volume_m3 * (p.amount_usd / GREATEST(f.paid_usd, p.amount_usd))::float), 0)
+        AS cleaned_air_m3,
+    COALESCE(SUM(s.humidity_hours * (p.amount_usd / GREATEST(f.paid_usd, p.amount_usd))::float), 0)
+        AS humidity_hours,
+    COALESCE(SUM(p.nominal_return * LEAST((days.date - p.start_date + 1) / p.period_days, 1)), 0)
+        AS accrued_return_usd
+FROM days
+LEFT JOIN positions p ON p.start_date <= days.date
+LEFT JOIN funding f ON f.device_id = p.device_id AND f.date = days.date
+LEFT JOIN core_device_daily_stats s ON s.device_id = p.device_id AND s.date = days.date
+GROUP BY days.date
+ORDER BY days.date
+"""
+
+
+def portfolio_series(investor_id, start_date, end_date):
+    """
+    Возвращает по строке на каждый день [start_date, end_date]:
+    - cleaned_air_m3, humidity_hours - доля портфеля в показателях устройств за день
+    - accrued_return_usd - прогнозный доход, равномерно начисленный к концу дня
+    """
+    rows = raw_sql(
+        SERIES_SQL,
+        investor_id=investor_id,
+        status=Investment.STATUS_PAID,
+        start=start_date,
+        end=end_date,
+        tz=settings.TIME_ZONE,
+        days_in_month=DAYS_IN_MONTH,
+    )
+    return [{
+        'date': row['date'].isoformat(),
+        'cleaned_air_m3': round(row['cleaned_air_m3'], 2),
+        'humidity_hours': round(row['humidity_hours'], 2),
+        'accrued_return_usd': round(row['accrued_return_usd'], 2),
+    } for row in rows]
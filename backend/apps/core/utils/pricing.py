@@ -0,0 +1,73 @@
+"""
+Стоимость обслуживания помещений заказа.
+room_cost считает в памяти (создание заказа и предварительный расчёт),
+room_cost_expression - то же правило в SQL для пересчёта сохранённых заказов.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+
+# Стоимость услуг за м³ объёма помещения (USD)
+CLEANING_RATE = Decimal("0.10")
+HUMIDIFYING_RATE = Decimal("0.10")
+AROMA_RATE = Decimal("0.05")
+
+CENT = Decimal("0.01")
+
+
+def room_cost(volume_m3, device_types):
+    """
+    Стоимость помещения по услугам, которые дают его типы устройств, с округлением до цента.
+    Если есть и cleaning, и humidifying, арома добавляется в подарок.
+    """
+    has_cleaning = any(device_type.supports_cleaning for device_type in device_types)
+    has_humidifying = any(device_type.supports_humidifying for device_type in device_types)
+    has_aroma = any(device_type.supports_aroma for device_type in device_types)
+
+    volume_m3 = Decimal(str(volume_m3 or 0))
+    cost = Decimal("0.00")
+    if has_cleaning:
+        cost += volume_m3 * CLEANING_RATE
+    if has_humidifying:
+        cost += volume_m3 * HUMIDIFYING_RATE
+    if has_aroma and not (has_cleaning and has_humidifying):
+        # Арома отдельно только если не в подарок
+        cost += volume_m3 * AROMA_RATE
+    return cost.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def room_cost_expression(order_room='pk'):
+    """
+    Выражение стоимости OrderRoom по тому же правилу, что room_cost.
+    order_room - путь к id OrderRoom в запросе (по умолчанию сам OrderRoom).
+    """
+    from core.models import OrderRoomDeviceType
+
+    def supports(flag):
+        return Exists(OrderRoomDeviceType.objects.filter(order_room=OuterRef(order_room), **{f'device_type__{flag}': True}))
+
+    has_cleaning = supports('supports_cleaning')
+    has_humidifying = supports('supports_humidifying')
+    has_aroma = supports('supports_aroma')
+    output_field = DecimalField(max_digits=12, decimal_places=4)
+    zero = Value(Decimal('0'), output_field=output_field)
+
+    rate = ExpressionWrapper(
+        Case(When(has_cleaning, then=Value(CLEANING_RATE)), default=zero, output_field=output_field)
+        + Case(When(has_humidifying, then=Value(HUMIDIFYING_RATE)), default=zero, output_field=output_field)
+        # Арома отдельно только если не в подарок к очистке с увлажнением
+        + Case(
+            When(has_cleaning & has_humidifying, then=zero),
+            When(has_aroma, then=Value(AROMA_RATE)),
+            default=zero,
+            output_field=output_field,
+        ),
+        output_field=output_field,
+    )
+    volume_m3 = Coalesce(F('room__volume_m3'), Value(0.0))
+    return Round(
+        ExpressionWrapper(Cast(volume_m3, output_field) * rate, output_field=output_field),
+        2,
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
@@ -0,0 +1,139 @@
+"""
+Вероятностный прогноз доходности портфеля инвестора (Monte Carlo).
+
+Доход инвестиции по договору - amount × profit_percentage за investment_period_months
+при номинальной загрузке устройства. Фактическая загрузка (доля времени, когда устройство
+на связи и включено) моделируется по историческим метрикам типа устройства:
+чем она ниже номинальной, тем меньше доход и тем позже окупаемость.
+
+Все пути симулируются одной матрицей (paths × investments), общий шок задаёт
+корреляцию загрузки устройств внутри пути.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from toolkit.utils.db import raw_sql
+
+PATHS = 5000
+PERCENTILES = (5, 25, 50, 75, 95)
+# Загрузка, заложенная в условия типа устройства
+NOMINAL_UTILIZATION = 0.8
+# Доля дисперсии загрузки, общая для всех устройств (перебои сети, сезонность)
+COMMON_SHOCK_SHARE = 0.3
+# Нижняя граница загрузки, чтобы срок окупаемости оставался конечным
+MIN_UTILIZATION = 0.05
+# Априорные параметры для типов без истории и вес априори в числе устройств
+PRIOR_MEAN = NOMINAL_UTILIZATION
+PRIOR_STD = 0.15
+PRIOR_WEIGHT = 5
+CALIBRATION_DAYS = 30
+CALIBRATION_TIMEOUT = 60 * 60 * 6
+DAYS_IN_MONTH = 30.4375
+
+CALIBRATION_SQL = """
+WITH per_device AS (
+    SELECT
+        d.device_type_id,
+        LEAST(COUNT(DISTINCT date_trunc('hour', m.timestamp)) / %(window_hours)s::float, 1)
+            * COALESCE(AVG(CASE WHEN m.cleaned_air_volume_m3 > 0 THEN 1.0 WHEN m.cleaned_air_volume_m3 = 0 THEN 0.0 END), 1)
+            AS utilization
+    FROM core_device_metrics m
+    JOIN core_device_instances d ON d.id = m.device_id
+    WHERE d.device_type_id IN %(type_ids)s AND m.timestamp >= %(since)s
+    GROUP BY d.device_type_id, m.device_id
+)
+SELECT
+    device_type_id,
+    COUNT(*) AS devices,
+    AVG(utilization) AS mean,
+    COALESCE(STDDEV_SAMP(utilization), 0) AS std
+FROM per_device
+GROUP BY device_type_id
+"""
+
+
+def calibration_key(device_type_id):
+    return f'projection-calibration:{device_type_id}'
+
+
+def calibrate(device_type_ids):
+    """
+    Возвращает {device_type_id: (mean, std)} загрузки устройств типа за CALIBRATION_DAYS.
+    Загрузка устройства - доля часов с метриками, умноженная на долю метрик во включённом состоянии
+    (по объёму очищенного воздуха; у устройств без очистки учитывается только доля часов).
+    Оценки сглаживаются к априорным, параметры кэшируются по типу устройства.
+    """
+    device_type_ids = set(device_type_ids)
+    cached = cache.get_many([calibration_key(pk) for pk in device_type_ids])
+    result = {pk: cached[calibration_key(pk)] for pk in device_type_ids if calibration_key(pk) in cached}
+
+    missing = device_type_ids - set(result)
+    if missing:
+        now = timezone.now()
+        rows = {row['device_type_id']: row for row in raw_sql(
+            CALIBRATION_SQL,
+            type_ids=tuple(missing),
+            since=now - timedelta(days=CALIBRATION_DAYS),
+            window_hours=CALIBRATION_DAYS * 24,
+        )}
+        for pk in missing:
+            row = rows.get(pk)
+            devices = row['devices'] if row else 0
+            mean = row['mean'] if row else PRIOR_MEAN
+            std = row['std'] if row else PRIOR_STD
+            weight = devices + PRIOR_WEIGHT
+            result[pk] = (
+                (devices * mean + PRIOR_WEIGHT * PRIOR_MEAN) / weight,
+                (devices * std + PRIOR_WEIGHT * PRIOR_STD) / weight,
+            )
+        cache.set_many({calibration_key(pk): result[pk] for pk in missing}, CALIBRATION_TIMEOUT)
+
+    return result
+
+
+def simulate(positions, paths=PATHS, seed=None):
+    """
+    positions - список словарей с ключами amount_usd, profit_percentage, period_months,
+    device_type_id и start_date (дата начала начисления дохода).
+
+    Возвращает перцентили дохода портфеля (USD) и даты окупаемости портфеля
+    (средневзвешенной по суммам инвестиций).
+    """
+    if not positions:
+        return None
+
+    params = calibrate(position['device_type_id'] for position in positions)
+    today = timezone.localdate()
+
+    amount = np.array([float(position['amount_usd']) for position in positions])
+    nominal_return = amount * np.array([position['profit_percentage'] for position in positions]) / 100
+    period_days = np.array([position['period_months'] for position in positions]) * DAYS_IN_MONTH
+    start_offset = np.array([(position['start_date'] - today).days for position in positions])
+    mean = np.array([params[position['device_type_id']][0] for position in positions])
+    std = np.array([params[position['device_type_id']][1] for position in positions])
+
+    rng = np.random.default_rng(seed)
+    common = rng.standard_normal((paths, 1))
+    own = rng.standard_normal((paths, len(positions)))
+    shocks = np.sqrt(COMMON_SHOCK_SHARE) * common + np.sqrt(1 - COMMON_SHOCK_SHARE) * own
+    utilization = np.clip(mean + std * shocks, MIN_UTILIZATION, 1)
+    performance = utilization / NOMINAL_UTILIZATION
+
+    returns = (nominal_return * performance).sum(axis=1)
+    payback_offset = ((start_offset + period_days / performance) * amount).sum(axis=1) / amount.sum()
+
+    return_bands = np.percentile(returns, PERCENTILES)
+    payback_bands = np.percentile(payback_offset, PERCENTILES)
+    return {
+        'paths': paths,
+        'invested_usd': round(float(amount.sum()), 2),
+        'nominal_return_usd': round(float(nominal_return.sum()), 2),
+        'return_usd': {f'p{p}': round(float(value), 2) for p, value in zip(PERCENTILES, return_bands)},
+        'payback_date': {
+            f'p{p}': (today + timedelta(days=int(np.ceil(value)))).isoformat()
+            for p, value in zip(PERCENTILES, payback_bands)
+        },
+    }
@@ -0,0 +1,59 @@
+"""
+Создание устройств оплаченного заказа.
+Все устройства и их связи с заказом вставляются двумя bulk_create, внутренние коды
+выдаются одним запросом из последовательности core_device_internal_code_seq.
+bulk_create не вызывает сигналы сохранения, поэтому кэши и телеметрия обновляются здесь.
+"""
+from django.db import transaction
+
+from core.models import DeviceInstance, OrderDevice
+from core.signals import CACHE_AVAILABLE_DEVICES, CACHE_DEVICES, CACHE_ORDERS
+from core.utils.telemetry import publish_device_state
+from toolkit.utils.cache import bump_version
+from toolkit.utils.db import raw_sql
+
+INTERNAL_CODE_SEQUENCE = 'core_device_internal_code_seq'
+
+INTERNAL_CODES_SQL = f"""
+SELECT nextval('{INTERNAL_CODE_SEQUENCE}') AS value
+FROM generate_series(1, %(count)s)
+"""
+
+
+def allocate_internal_codes(count):
+    if count <= 0:
+        return []
+    return [f"FA-{row['value']:08d}" for row in raw_sql(INTERNAL_CODES_SQL, count=count)]
+
+
+def provision_order_devices(order):
+    """
+    Создаёт по ACTIVE устройству на каждый тип устройства каждой комнаты заказа и связывает их с заказом.
+    order.order_rooms должны быть загружены вместе с order_room_device_types.
+    Возвращает созданные устройства.
+    """
+    pairs = [
+        (order_room.room_id, link.device_type_id)
+        for order_room in order.order_rooms.all()
+        for link in order_room.order_room_device_types.all()
+    ]
+    codes = allocate_internal_codes(len(pairs))
+    devices = DeviceInstance.objects.bulk_create([
+        DeviceInstance(
+            device_type_id=device_type_id,
+            room_id=room_id,
+            customer_id=order.customer_id,
+            status=DeviceInstance.STATUS_ACTIVE,
+            is_power_on=True,
+            internal_code=code,
+        )
+        for (room_id, device_type_id), code in zip(pairs, codes)
+    ])
+    OrderDevice.objects.bulk_create([OrderDevice(order=order, device=device) for device in devices])
+
+    if devices:
+        bump_version(CACHE_DEVICES, order.customer_id)
+        bump_version(CACHE_ORDERS, order.customer_id)
+        bump_version(CACHE_AVAILABLE_DEVICES)
+        transaction.on_commit(lambda: [publish_device_state(device) for device in devices])
+    return devices
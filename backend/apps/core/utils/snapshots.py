@@ -0,0 +1,116 @@
+"""
+Снимки статистики инвестиций (InvestmentStatSnapshot).
+Считаются пачками по оплаченным инвестициям: накопительные показатели берутся из DeviceStat,
+прогноз дохода - из условий типа устройства. Пачка считается массивами numpy.
+Снимки старше SNAPSHOT_RETENTION_DAYS удаляются, последний снимок инвестиции сохраняется всегда.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Investment, InvestmentStatSnapshot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000
+
+SNAPSHOT_RETENTION_DAYS = 90
+
+
+def iterate_paid_investments(chunk_size=CHUNK_SIZE):
+    """
+    Отдаёт оплаченные инвестиции пачками, итерируя по id (keyset) вместо OFFSET.
+    Каждая пачка - один запрос вместе с условиями типа устройства и счётчиками устройства.
+    """
+    last_id = 0
+    while True:
+        chunk = list(
+            Investment.objects.paid()
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values('id', 'device_id', 'amount_usd', 'paid_at', 'created_at')
+            .annotate(
+                profit_percentage=F('device__device_type__investment_profit_percentage'),
+                period_months=F('device__device_type__investment_period_months'),
+                cleaned_air=Coalesce(F('device__stat__cleaned_air_volume_m3'), 0.0),
+                humidity_hours=Coalesce(F('device__stat__humidity_hours'), 0.0),
+            )[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]['id']
+
+
+def projected_return_dates(start_dates, months):
+    """
+    Даты окончания периода инвестиций: start_dates + months месяцев,
+    день ограничивается длиной целевого месяца (как toolkit.utils.date.add_months).
+    """
+    start_dates = np.array(start_dates, dtype='datetime64[D]')
+    start_months = start_dates.astype('datetime64[M]')
+    target_months = start_months + months.astype('timedelta64[M]')
+    month_lengths = ((target_months + 1).astype('datetime64[D]') - target_months.astype('datetime64[D]')).astype(int)
+    days = np.minimum((start_dates - start_months.astype('datetime64[D]')).astype(int), month_lengths - 1)
+    return target_months.astype('datetime64[D]') + days
+
+
+def build_snapshots(chunk, timestamp):
+    """Строит снимки пачки инвестиций, прогноз считается по всей пачке сразу."""
+    amounts_cents = np.array([int(row['amount_usd'] * 100) for row in chunk], dtype=np.int64)
+    profit = np.array([row['profit_percentage'] for row in chunk], dtype=float)
+    months = np.array([row['period_months'] for row in chunk], dtype=np.int64)
+    started = [timezone.localdate(row['paid_at'] or row['created_at']) for row in chunk]
+
+    returns_cents = np.rint(amounts_cents * profit / 100).astype(np.int64)
+    return_dates = projected_return_dates(started, months).tolist()
+
+    return [
+        InvestmentStatSnapshot(
+            investment_id=row['id'],
+            device_id=row['device_id'],
+            timestamp=timestamp,
+            cumulative_cleaned_air_volume_m3=row['cleaned_air'],
+            cumulative_humidity_hours=row['humidity_hours'],
+            projected_return_amount=Decimal(int(cents)).scaleb(-2),
+            projected_return_date=return_date,
+        )
+        for row, cents, return_date in zip(chunk, returns_cents, return_dates)
+    ]
+
+
+def compute_snapshots(chunk_size=CHUNK_SIZE):
+    """
+    Создаёт по одному снимку на каждую оплаченную инвестицию с общей меткой времени.
+    Возвращает количество созданных снимков.
+    """
+    timestamp = timezone.now()
+    created = 0
+    for chunk in iterate_paid_investments(chunk_size):
+        snapshots = build_snapshots(chunk, timestamp)
+        InvestmentStatSnapshot.objects.bulk_create(snapshots, batch_size=chunk_size)
+        created += len(snapshots)
+
+    logger.info('Computed %s investment snapshots', created)
+    return created
+
+
+def prune_snapshots(retention_days=SNAPSHOT_RETENTION_DAYS):
+    """
+    Удаляет снимки старше retention_days, кроме последнего снимка каждой инвестиции.
+    Возвращает количество удалённых снимков.
+    """
+    newer = InvestmentStatSnapshot.objects.filter(investment_id=OuterRef('investment_id'), timestamp__gt=OuterRef('timestamp'))
+    deleted, _ = (
+        InvestmentStatSnapshot.objects
+        .filter(timestamp__lt=timezone.now() - timedelta(days=retention_days))
+        .filter(Exists(newer))
+        .delete()
+    )
+    logger.info('Pruned %s investment snapshots', deleted)
+    return deleted
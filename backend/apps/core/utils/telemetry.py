@@ -0,0 +1,78 @@
+"""
+Живая телеметрия устройств через Redis pub/sub.
+Путь приёма метрик и переключение устройств публикуют события в канал клиента,
+SSE-эндпоинт (core.views.stream) подписывается на него.
+"""
+import json
+import logging
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def channel_name(customer_id):
+    return f'telemetry:customer:{customer_id}'
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.TELEMETRY_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _client
+
+
+def publish_event(customer_id, event, data):
+    """
+    Публикует событие для клиента после коммита транзакции.
+    Ошибки Redis только логируются - приём метрик не должен от них зависеть.
+    """
+    if customer_id is None:
+        return
+
+    message = json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+
+    def publish():
+        try:
+            get_client().publish(channel_name(customer_id), message)
+        except redis.RedisError as e:
+            logger.warning('Telemetry publish failed: %s', e)
+
+    transaction.on_commit(publish)
+
+
+def publish_metric(metric, customer_id):
+    from core.serializers.device import DeviceMetricSerializer
+    publish_event(customer_id, 'metric', DeviceMetricSerializer(metric).data)
+
+
+def publish_device_state(device):
+    publish_event(device.customer_id, 'device', {
+        'id': device.id,
+        'status': device.status,
+        'is_power_on': device.is_power_on,
+    })
+
+
+async def subscribe(customer_id, heartbeat=15):
+    """
+    Асинхронно отдаёт сообщения из канала клиента.
+    Раз в heartbeat секунд без сообщений отдаёт None, чтобы поток мог отправить keep-alive.
+    """
+    client = aioredis.Redis.from_url(settings.TELEMETRY_REDIS_URL)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(channel_name(customer_id))
+    try:
+        while True:
+            message = await pubsub.get_message(timeout=heartbeat)
+            yield message['data'].decode() if message else None
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
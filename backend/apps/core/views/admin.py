@@ -1,11 +1,14 @@
 from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from toolkit.views import BaseView, CreateMixin, UpdatePartialMixin
 from core.models import DeviceInstance
+from core.serializers.customer_order import OrderTransitionSerializer
 from core.serializers.device import DeviceInstanceSerializer
+from core.utils.order_transitions import transition_orders
 
 
 class AdminDeviceView(CreateMixin, UpdatePartialMixin, BaseView):
@@ -44,12 +47,30 @@ class AdminDeviceStatusView(APIView):
             raise ValidationError('Invalid status')
         
         device.status = new_status
-        device.save()
+        device.save_changed()
         
         serializer = DeviceInstanceSerializer(device)
         return Response(serializer.data)
 
 
+class AdminOrderStatusView(APIView):
+    """
+    Массовая смена статуса заказов.
+
+    POST: {"order_ids": [1, 2, 3], "status": "ACTIVE"}
+    Допустимые переходы: PENDING → APPROVED → INSTALLED → ACTIVE, отмена - из PENDING, APPROVED и ACTIVE.
+    При переходе в ACTIVE приостановленные подписки заказов активируются одним запросом.
+    Заказы с недопустимым переходом не меняются и возвращаются в rejected.
+    """
+    def post(self, request):
+        if not request.user.has_perm('core.change_customerorder'):
+            raise PermissionDenied()
+
+        data = OrderTransitionSerializer.check(request)
+        result = transition_orders(data['order_ids'], data['status'], request.user)
+        return Response(result)
+
+
 class InternalDeviceMetricsView(APIView):
     """
     Приём метрик от устройства (IoT).
@@ -1,16 +1,20 @@
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
-from toolkit.views import BaseView, CreateMixin, ListMixin
-from core.models import Room, CustomerOrder, DeviceInstance, DeviceMetric, DeviceType, OrderRoom, OrderRoomDeviceType, OrderDevice, PaymentCard, Payment, Subscription
+from django.db.models import Exists, OuterRef, Q
+from toolkit.utils.date import parse_since
+from toolkit.views import BaseView, CachedListMixin, CreateMixin, IdempotencyMixin, ListMixin, SparseFieldsMixin
+from core.models import Room, CustomerOrder, DeviceInstance, DeviceMetric, DeviceType, OrderRoom, OrderRoomDeviceType, PaymentCard, Payment, Subscription
 from core.serializers.room import RoomSerializer
-from core.serializers.customer_order import CustomerOrderSerializer
+from core.serializers.customer_order import CustomerOrderSerializer, OrderQuoteSerializer
 from core.serializers.device import DeviceInstanceSerializer, DeviceMetricSerializer, DeviceTypeSerializer
 from core.serializers.payment import PaymentCardSerializer, PaymentCardCreateSerializer, PaymentSerializer
 from core.serializers.subscription import SubscriptionSerializer
+from core.signals import CACHE_CATALOG, CACHE_DEVICES, CACHE_ORDERS, CACHE_PAYMENTS, CACHE_SUBSCRIPTIONS
 
 
 class CustomerMixin:
@@ -59,7 +63,7 @@ class RoomListView(CustomerMixin, ListMixin, CreateMixin, BaseView):
         super().perform_create(serializer)
 
 
-class CustomerOrderListView(CustomerMixin, ListMixin, CreateMixin, BaseView):
+class CustomerOrderListView(IdempotencyMixin, CustomerMixin, SparseFieldsMixin, CachedListMixin, ListMixin, CreateMixin, BaseView):
     """
     Список заказов клиента / Создать заказ.
     
@@ -83,20 +87,16 @@ class CustomerOrderListView(CustomerMixin, ListMixin, CreateMixin, BaseView):
          "comment": "Опциональный комментарий"
        }
     После создания заказ получает статус PENDING.
+    Повтор POST с тем же заголовком Idempotency-Key не создаёт второй заказ.
     """
     serializer_class = CustomerOrderSerializer
     queryset = CustomerOrder.objects.all()
+    cache_scopes = (CACHE_ORDERS, CACHE_DEVICES)
     check_retrieve_permission = False  # Фильтрация по customer обеспечивает безопасность
     check_create_permission = False  # Отключаем проверку прав для создания - customer уже установлен в perform_create
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.prefetch_related(
-            'order_rooms__room',
-            'order_rooms__device_types',  # device_types уже указывает на DeviceType
-            'devices__device_type',
-            'devices__room'
-        )
         status = self.request.query_params.get('status')
         if status:
             queryset = queryset.filter(status=status)
@@ -107,7 +107,38 @@ class CustomerOrderListView(CustomerMixin, ListMixin, CreateMixin, BaseView):
         return serializer.save()
 
 
-class CustomerDeviceListView(CustomerMixin, ListMixin, BaseView):
+class CustomerOrderQuoteView(APIView):
+    """
+    Предварительный расчёт заказа без его создания.
+    
+    Принимает тот же rooms_data, что и создание заказа (услуги или device_type_ids по комнатам),
+    и возвращает подобранные типы устройств, стоимость каждой комнаты и общую стоимость.
+    Ничего не записывает в БД: подбор и расчёт выполняются по каталогу типов устройств в памяти.
+    Результат для одинакового rooms_data кэшируется до изменения каталога.
+    """
+    cache_timeout = 60 * 60
+
+    def post(self, request):
+        import json
+        from django.core.cache import cache
+        from toolkit.utils.cache import versioned_key
+
+        serializer = OrderQuoteSerializer(data=request.data)
+        # Ключ кэша строится из rooms_data, поэтому тело не-объект (массив, строка) сразу отдаёт 400
+        if not isinstance(request.data, dict):
+            serializer.is_valid(raise_exception=True)
+
+        payload = json.dumps(request.data.get('rooms_data'), sort_keys=True, default=str)
+        key = versioned_key('order-quote', (CACHE_CATALOG,), extra=payload)
+        data = cache.get(key)
+        if data is None:
+            serializer.is_valid(raise_exception=True)
+            data = serializer.quote()
+            cache.set(key, data, self.cache_timeout)
+        return Response(data)
+
+
+class CustomerDeviceListView(CustomerMixin, SparseFieldsMixin, CachedListMixin, ListMixin, BaseView):
     """
     Дашборд устройств клиента.
     
@@ -117,19 +148,27 @@ class CustomerDeviceListView(CustomerMixin, ListMixin, BaseView):
     - Название помещения
     - Статус устройства
     - Последние метрики (PM2.5, влажность, износ фильтров, уровень жидкости)
+    
+    Дельта-режим: ?since=<cursor> возвращает только устройства, у которых с этого момента
+    изменилось состояние или появилась новая метрика. В ответе всегда есть cursor
+    для следующего запроса. Курсор - время сервера, поэтому новые метрики определяются
+    по времени записи (created_at), а не по timestamp устройства: поздние показания
+    с прошлым timestamp тоже отмечают устройство изменённым.
+    В дельта-режиме возвращаются и устройства, переведённые в DISABLED или MAINTENANCE,
+    чтобы клиент по статусу убрал их из списка.
     """
+    # Запас на транзакции, которые закоммитились после начала запроса.
+    # Клиент может получить устройство повторно, но не пропустит изменение.
+    cursor_overlap = timedelta(seconds=5)
+
     serializer_class = DeviceInstanceSerializer
-    queryset = DeviceInstance.objects.select_related('device_type', 'room').prefetch_related('metrics').all()
+    queryset = DeviceInstance.objects.all()
+    cache_scopes = (CACHE_DEVICES,)
     check_retrieve_permission = False  # Фильтрация по customer обеспечивает безопасность
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        # Показываем все устройства клиента (ACTIVE, ORDERED, INSTALLING), но не DISABLED и не в MAINTENANCE
-        queryset = queryset.filter(
-            customer=self.request.user
-        ).exclude(
-            status__in=[DeviceInstance.STATUS_DISABLED, DeviceInstance.STATUS_MAINTENANCE]
-        )
+        queryset = queryset.filter(customer=self.request.user)
         
         # Фильтрация по комнате, если указана
         room_id = self.request.query_params.get('room_id')
@@ -139,8 +178,52 @@ class CustomerDeviceListView(CustomerMixin, ListMixin, BaseView):
             except (ValueError, TypeError):
                 pass
         
+        since = parse_since(self.request.query_params.get('since'))
+        if since:
+            new_metrics = DeviceMetric.objects.filter(device=OuterRef('pk'), created_at__gt=since)
+            queryset = queryset.filter(Q(updated_at__gt=since) | Exists(new_metrics))
+        else:
+            # Показываем все устройства клиента (ACTIVE, ORDERED, INSTALLING), но не DISABLED и не в MAINTENANCE
+            queryset = queryset.exclude(
+                status__in=[DeviceInstance.STATUS_DISABLED, DeviceInstance.STATUS_MAINTENANCE]
+            )
+        
         return queryset.order_by('-created_at')
 
+    def list(self, request, *args, **kwargs):
+        self.cursor = timezone.now() - self.cursor_overlap
+        return super().list(request, *args, **kwargs)
+
+    def list_response(self, data):
+        data['cursor'] = self.cursor.isoformat()
+        return data
+
+
+class CustomerFleetSummaryView(APIView):
+    """
+    Сводка по устройствам клиента для главного экрана.
+    
+    Возвращает итоговые показатели (overall) и показатели по каждому помещению (rooms):
+    - Средний и максимальный PM2.5 по последним метрикам
+    - Средняя влажность
+    - Количество включённых и выключенных устройств
+    - Количество устройств, которым нужна замена фильтра или дозаправка
+    - Объём очищенного воздуха за 24 часа и 7 дней (м³), 7 дней - по дневным итогам и сегодняшним метрикам
+    
+    Считается одним SQL запросом и кэшируется до следующего изменения устройств клиента.
+    """
+    def get(self, request):
+        from django.core.cache import cache
+        from toolkit.utils.cache import versioned_key
+        from core.utils.fleet import fleet_summary
+        
+        key = versioned_key('fleet-summary', (CACHE_DEVICES,), request.user.pk)
+        data = cache.get(key)
+        if data is None:
+            data = fleet_summary(request.user.pk)
+            cache.set(key, data, 60 * 10)
+        return Response(data)
+
 
 class DeviceToggleView(APIView):
     """
@@ -163,7 +246,7 @@ class DeviceToggleView(APIView):
         is_power_on = request.data.get('is_power_on')
         if is_power_on is not None:
             device.is_power_on = is_power_on
-            device.save()
+            device.save_changed()
         
         serializer = DeviceInstanceSerializer(device)
         return Response(serializer.data)
@@ -182,6 +265,9 @@ class DeviceMetricsView(APIView):
     - Объём очищенного воздуха (м³)
     - Износ фильтров (%)
     - Уровень жидкости в увлажнителе (%)
+    
+    Дельта-режим: ?since=<timestamp последней точки клиента> возвращает только более новые точки,
+    не старше начала периода range.
     """
     def get(self, request, pk):
         try:
@@ -190,7 +276,7 @@ class DeviceMetricsView(APIView):
             from rest_framework.exceptions import NotFound
             raise NotFound()
         
-        if device.customer != request.user:
+        if device.customer_id != request.user.pk:
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied()
         
@@ -205,6 +291,20 @@ class DeviceMetricsView(APIView):
         from datetime import timedelta
         from core.utils.metrics_generator import ensure_device_has_recent_metrics, generate_metrics_for_device
         
+        since = parse_since(request.query_params.get('since'))
+        if since:
+            # Только точки новее последней точки клиента (диапазонный скан по индексу device, timestamp),
+            # без генерации метрик и не дальше окна range
+            since = max(since, timezone.now() - timedelta(days=days))
+            metrics = DeviceMetric.objects.filter(device=device, timestamp__gt=since).order_by('timestamp')
+            serializer = DeviceMetricSerializer(metrics, many=True)
+            return Response({
+                'device_id': device.id,
+                'range': range_param,
+                'since': since.isoformat(),
+                'points': serializer.data
+            })
+        
         # Убеждаемся, что у устройства есть свежие метрики
         ensure_device_has_recent_metrics(device, hours_back=1)
         
@@ -233,7 +333,7 @@ class DeviceMetricsView(APIView):
         })
 
 
-class CustomerOrderPayView(APIView):
+class CustomerOrderPayView(IdempotencyMixin, APIView):
     """
     Оплата заказа клиента.
     
@@ -242,111 +342,102 @@ class CustomerOrderPayView(APIView):
     После оплаты:
     - Создает запись Payment
     - Меняет статус заказа на APPROVED
-    - Автоматически создаёт DeviceInstance для каждого типа устройства в каждой комнате заказа
-    - Связывает созданные устройства с заказом через OrderDevice
+    - Асинхронно создаёт DeviceInstance для каждого типа устройства в каждой комнате заказа
+      и связывает их с заказом через OrderDevice, создаёт подписку SUSPENDED
+
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает сохранённый ответ первой оплаты.
+
+    Оплата в две фазы, запрос к платёжному шлюзу выполняется вне транзакции БД:
+    1. транзакция: проверки и платёж в статусе PENDING (заказ блокируется на время проверки)
+    2. списание через core.utils.payment_gateway
+    3. транзакция: платёж PAID, заказ APPROVED и событие order.paid (core.utils.order_payments)
+    Устройства, подписка и уведомление создаются обработчиком события (core.utils.order_events).
+
+    Ответы при неуспешном списании:
+    - 402: карта отклонена, платёж FAILED, заказ остаётся PENDING
+    - 503: исход неизвестен (таймаут шлюза), платёж остаётся PENDING. Повторная оплата заказа
+      отправляет тот же платёж (с той же картой и external_id) ещё раз, поэтому двойного списания нет;
+      без повтора платёж сверяет задача core.tasks.reconcile_order_payments
+    - 409: заказ изменился во время списания (например, отменён), платёж REFUND_REQUIRED
     """
-    
-    @transaction.atomic
+
     def post(self, request, pk):
-        from django.utils import timezone
+        from uuid import uuid4
         from rest_framework.exceptions import NotFound, ValidationError, PermissionDenied
-        from decimal import Decimal
-        
-        try:
-            order = CustomerOrder.objects.prefetch_related(
-                'order_rooms__room',
-                'order_rooms__device_types'
-            ).get(pk=pk)
-        except CustomerOrder.DoesNotExist:
-            raise NotFound('Order not found')
-        
-        # Проверка прав доступа
-        if order.customer != request.user:
-            raise PermissionDenied('You do not have permission to pay this order')
-        
-        # Проверка статуса
-        if order.status != CustomerOrder.STATUS_PENDING:
-            raise ValidationError(f'Order is not in PENDING status. Current status: {order.status}')
-        
-        # Получаем карту для оплаты
-        payment_card_id = request.data.get('payment_card_id')
-        if not payment_card_id:
-            raise ValidationError('payment_card_id is required')
-        
-        try:
-            payment_card = PaymentCard.objects.get(pk=payment_card_id, customer=request.user)
-        except PaymentCard.DoesNotExist:
-            raise NotFound('Payment card not found')
-        
-        # Вычисляем сумму заказа
-        total_amount = order.calculate_total_cost()
-        
-        # Сохраняем стоимость в заказе, если еще не сохранена
-        if not order.total_cost:
-            order.total_cost = total_amount
-            order.save(update_fields=['total_cost'])
-        
-        # Создаем запись о платеже
-        payment = Payment.objects.create(
-            order=order,
-            payment_card=payment_card,
-            amount=total_amount,
-            status=Payment.STATUS_PAID,
-            paid_at=timezone.now(),
-            transaction_id=f'TXN-ORDER-{order.id}-{timezone.now().strftime("%Y%m%d%H%M%S")}'
-        )
-        
-        # Меняем статус заказа
-        order.status = CustomerOrder.STATUS_APPROVED
-        order.save()
-        
-        # Создаем устройства для каждой комнаты в заказе
-        created_devices = []
-        for order_room in order.order_rooms.all():
-            room = order_room.room
-            for order_room_device_type in order_room.order_room_device_types.all():
-                device_type = order_room_device_type.device_type
-                
-                # Создаем DeviceInstance со статусом ACTIVE
-                device = DeviceInstance.objects.create(
-                    device_type=device_type,
-                    room=room,
-                    customer=order.customer,
-                    status=DeviceInstance.STATUS_ACTIVE,
-                    is_power_on=True
+        from core.utils import order_payments
+        from core.utils.payment_gateway import get_gateway
+
+        with transaction.atomic():
+            try:
+                order = CustomerOrder.objects.select_for_update().get(pk=pk)
+            except CustomerOrder.DoesNotExist:
+                raise NotFound('Order not found')
+
+            # Проверка прав доступа
+            if order.customer_id != request.user.pk:
+                raise PermissionDenied('You do not have permission to pay this order')
+
+            # Проверка статуса
+            if order.status != CustomerOrder.STATUS_PENDING:
+                raise ValidationError(f'Order is not in PENDING status. Current status: {order.status}')
+
+            # Получаем карту для оплаты
+            payment_card_id = request.data.get('payment_card_id')
+            if not payment_card_id:
+                raise ValidationError('payment_card_id is required')
+
+            # Незавершённый платёж (неизвестный исход или упавший воркер) отправляется повторно
+            # с тем же external_id - процессор не спишет его второй раз
+            payment = Payment.objects.select_related('payment_card').filter(
+                order=order, status=Payment.STATUS_PENDING
+            ).first()
+
+            if payment is None:
+                try:
+                    payment_card = PaymentCard.objects.get(pk=payment_card_id, customer=request.user)
+                except PaymentCard.DoesNotExist:
+                    raise NotFound('Payment card not found')
+
+                # Стоимость сохраняется при создании заказа, пересчёт нужен только для заказов без неё
+                if order.total_cost is None:
+                    order.total_cost = order.calculate_total_cost()
+                    order.save(update_fields=['total_cost'])
+
+                # Платёж ожидает ответа шлюза, external_id - ключ идемпотентности списания
+                payment = Payment.objects.create(
+                    order=order,
+                    payment_card=payment_card,
+                    amount=order.total_cost,
+                    status=Payment.STATUS_PENDING,
+                    external_id=f'{order_payments.ORDER_PAYMENT_PREFIX}{order.id}-{uuid4().hex}',
                 )
-                created_devices.append(device)
-                
-                # Связываем устройство с заказом через OrderDevice
-                OrderDevice.objects.get_or_create(order=order, device=device)
-        
-        # Создаем подписку для заказа со статусом SUSPENDED
-        # Подписка будет активирована автоматически когда заказ станет ACTIVE (после установки через админку)
-        # Ежемесячная стоимость = общая стоимость заказа (разовая установка не включена в подписку)
-        monthly_amount = total_amount  # Можно настроить отдельную логику расчета
-        
-        # Пока заказ не ACTIVE, подписка в статусе SUSPENDED (ожидает активации)
-        # start_date и next_payment_date будут установлены при активации
-        subscription = Subscription.objects.create(
-            customer=order.customer,
-            order=order,
-            status=Subscription.STATUS_SUSPENDED,  # Ожидает активации заказа
-            monthly_amount_usd=monthly_amount,
-            start_date=timezone.now(),  # Дата создания, но подписка еще не активна
-            next_payment_date=timezone.now() + timedelta(days=30)  # Будет пересчитано при активации
-        )
-        
-        # Возвращаем обновленный заказ с созданными устройствами и подпиской
-        order_serializer = CustomerOrderSerializer(order)
-        payment_serializer = PaymentSerializer(payment)
-        subscription_serializer = SubscriptionSerializer(subscription)
-        
+
+        result = get_gateway().charge(payment, payment.payment_card)
+        payment = order_payments.finalize(payment, result)
+
+        if payment.status == Payment.STATUS_PENDING:
+            return Response({
+                'detail': 'Payment result is not known yet, retry later to complete it.',
+                'payment': PaymentSerializer(payment).data,
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '30'})
+
+        if payment.status == Payment.STATUS_FAILED:
+            return Response({
+                'detail': result.error,
+                'payment': PaymentSerializer(payment).data,
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+
+        if payment.status == Payment.STATUS_REFUND_REQUIRED:
+            return Response({
+                'detail': 'Order was changed during payment, the payment will be refunded.',
+                'payment': PaymentSerializer(payment).data,
+            }, status=status.HTTP_409_CONFLICT)
+
+        order = CustomerOrder.objects.get(pk=pk)
         return Response({
-            'order': order_serializer.data,
-            'payment': payment_serializer.data,
-            'subscription': subscription_serializer.data,
-            'devices_created': len(created_devices),
-            'message': 'Payment confirmed. Devices created successfully. Subscription created and will be activated when order is installed.'
+            'order': CustomerOrderSerializer(order).data,
+            'payment': PaymentSerializer(payment).data,
+            'message': 'Payment confirmed. Devices and subscription will be created shortly and activated when order is installed.'
         })
 
 
@@ -438,84 +529,53 @@ class PaymentCardDetailView(APIView):
         return Response({'message': 'Payment card deleted successfully'}, status=204)
 
 
-class CustomerPaymentListView(ListMixin, BaseView):
+class CustomerPaymentListView(SparseFieldsMixin, CachedListMixin, ListMixin, BaseView):
     """
     История платежей клиента.
     
     GET: Возвращает список всех платежей текущего клиента с аналитикой.
+    ?monthly=true добавляет в аналитику помесячную разбивку для графиков.
     """
     serializer_class = PaymentSerializer
-    queryset = Payment.objects.select_related('order', 'payment_card').all()
+    queryset = Payment.objects.all()
     check_retrieve_permission = False
+    cache_scopes = (CACHE_PAYMENTS,)
     
     def get_queryset(self):
         # Не используем CustomerMixin, так как Payment не имеет поля customer
         # Фильтруем через order__customer
-        queryset = self.queryset
+        queryset = super().get_queryset()
         return queryset.filter(order__customer=self.request.user).order_by('-created_at')
     
-    def list(self, request, *args, **kwargs):
-        from django.db.models import Sum, Count
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        response = super().list(request, *args, **kwargs)
-        
-        # Вычисляем аналитику
-        payments = self.get_queryset()
-        
-        # Общая статистика
-        total_paid = payments.filter(status=Payment.STATUS_PAID).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        total_payments = payments.filter(status=Payment.STATUS_PAID).count()
-        
-        # Статистика за последние 30 дней
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_payments = payments.filter(
-            status=Payment.STATUS_PAID,
-            created_at__gte=thirty_days_ago
-        )
-        recent_total = recent_payments.aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Статистика за последние 7 дней
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        week_payments = payments.filter(
-            status=Payment.STATUS_PAID,
-            created_at__gte=seven_days_ago
-        )
-        week_total = week_payments.aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Добавляем аналитику в ответ
-        response.data['analytics'] = {
-            'total_paid': float(total_paid),
-            'total_payments': total_payments,
-            'recent_30_days': {
-                'total': float(recent_total),
-                'count': recent_payments.count()
-            },
-            'recent_7_days': {
-                'total': float(week_total),
-                'count': week_payments.count()
-            }
-        }
-        
-        return response
-
-
-class CustomerSubscriptionListView(CustomerMixin, ListMixin, BaseView):
+    def list_response(self, data):
+        from django.core.cache import cache
+        from toolkit.utils.cache import versioned_key
+        from toolkit.utils.request import get_boolean
+        from core.utils.payment_analytics import payment_analytics
+
+        # Аналитика кэшируется на клиента отдельно от страниц списка и сбрасывается вместе с ними
+        monthly = get_boolean(self.request.query_params.get('monthly'))
+        key = versioned_key('payment-analytics', self.cache_scopes, self.request.user.pk, 'monthly' if monthly else '')
+        analytics = cache.get(key)
+        if analytics is None:
+            analytics = payment_analytics(self.request.user.pk, monthly=monthly)
+            cache.set(key, analytics, self.cache_timeout)
+
+        # Добавляем аналитику в ответ (попадает в кэш вместе со списком)
+        data['analytics'] = analytics
+        return data
+
+
+class CustomerSubscriptionListView(CustomerMixin, SparseFieldsMixin, CachedListMixin, ListMixin, BaseView):
     """
     Список подписок клиента.
     
     GET: Возвращает список всех подписок текущего клиента.
     """
     serializer_class = SubscriptionSerializer
-    queryset = Subscription.objects.select_related('order', 'customer').prefetch_related(
-        'order__order_rooms__room',
-        'order__order_rooms__device_types'
-    ).all()
+    queryset = Subscription.objects.all()
     check_retrieve_permission = False
+    cache_scopes = (CACHE_SUBSCRIPTIONS, CACHE_ORDERS, CACHE_DEVICES)
 
 
 class CustomerSubscriptionCancelView(APIView):
@@ -544,7 +604,7 @@ class CustomerSubscriptionCancelView(APIView):
         # Отменяем подписку
         subscription.status = Subscription.STATUS_CANCELLED
         subscription.cancelled_at = timezone.now()
-        subscription.save()
+        subscription.save_changed()
         
         serializer = SubscriptionSerializer(subscription)
         return Response({
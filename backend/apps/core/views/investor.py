@@ -1,10 +1,19 @@
-from django.db.models import Sum, Q
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Max, Sum, Q
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from toolkit.views import BaseView, CreateMixin, ListMixin
-from core.models import Investment, DeviceInstance, DeviceMetric, InvestmentStatSnapshot
+from toolkit.utils.cache import bump_version
+from toolkit.views import BaseView, CachedListMixin, CreateMixin, IdempotencyMixin, ListMixin, SparseFieldsMixin
+from core.models import Investment, DeviceInstance, DeviceMetric
+from core.querysets.device import latest_metric_prefetch
+from core.signals import CACHE_AVAILABLE_DEVICES, CACHE_INVESTMENTS
 from core.serializers.investment import InvestmentSerializer, AvailableDeviceSerializer
 
 
@@ -27,47 +36,112 @@ class InvestorDashboardView(APIView):
     - Дата прогнозируемого возврата
     """
     def get(self, request):
-        investments = Investment.objects.filter(
-            investor=request.user,
-            status=Investment.STATUS_PAID
-        ).select_related('device', 'device__device_type', 'device__room')
-
-        total_invested = investments.aggregate(total=Sum('amount_usd'))['total'] or 0
-        active_devices_count = investments.values('device').distinct().count()
-
-        device_ids = investments.values_list('device_id', flat=True)
-        total_cleaned_air = DeviceMetric.objects.filter(
-            device_id__in=device_ids
-        ).aggregate(total=Sum('cleaned_air_volume_m3'))['total'] or 0
+        # Объём воздуха и часы увлажнения берутся из накопительных счётчиков устройств (DeviceStat)
+        totals = Investment.objects.filter(investor=request.user).paid().portfolio_totals()
 
-        total_humidified_hours = DeviceMetric.objects.filter(
-            device_id__in=device_ids,
-            humidity__isnull=False
-        ).count()
-
-        latest_snapshot = InvestmentStatSnapshot.objects.filter(
-            investment__investor=request.user
-        ).order_by('-timestamp').first()
-
-        projected_return_total = latest_snapshot.projected_return_amount if latest_snapshot else 0
-        projected_return_date = latest_snapshot.projected_return_date if latest_snapshot else None
+        # Прогноз - сумма последних снимков по каждой оплаченной инвестиции
+        projection = Investment.objects.filter(investor=request.user).paid().with_stats().aggregate(
+            total=Sum('snapshot_return_amount'), date=Max('snapshot_return_date')
+        )
+        projected_return_total = projection['total'] or 0
+        projected_return_date = projection['date']
 
         return Response({
-            'total_invested_usd': str(total_invested),
-            'active_devices_count': active_devices_count,
-            'total_cleaned_air_m3': total_cleaned_air,
-            'total_humidified_hours': total_humidified_hours,
+            'total_invested_usd': str(totals['total_invested']),
+            'active_devices_count': totals['devices_count'],
+            'total_cleaned_air_m3': totals['cleaned_air_volume_m3'],
+            'total_humidified_hours': totals['humidity_hours'],
             'projected_return_total_usd': str(projected_return_total),
             'projected_return_date': projected_return_date.isoformat() if projected_return_date else None
         })
 
 
-class AvailableDevicesView(ListMixin, BaseView):
+class InvestorProjectionView(APIView):
+    """
+    Вероятностный прогноз доходности портфеля инвестора.
+
+    Моделирует загрузку устройств оплаченных инвестиций методом Monte Carlo
+    по историческим метрикам их типов (core.utils.projection) и возвращает перцентили (p5-p95):
+    - Доход портфеля (USD)
+    - Дата окупаемости портфеля (средневзвешенная по суммам инвестиций)
+    Пустой портфель возвращает null.
+    """
+    def get(self, request):
+        from core.utils.projection import simulate
+
+        investments = Investment.objects.filter(investor=request.user).paid().values(
+            'amount_usd', 'paid_at', 'created_at',
+            device_type_id=F('device__device_type_id'),
+            profit_percentage=F('device__device_type__investment_profit_percentage'),
+            period_months=F('device__device_type__investment_period_months'),
+        )
+        positions = [
+            dict(item, start_date=timezone.localdate(item['paid_at'] or item['created_at']))
+            for item in investments
+        ]
+        # Фиксированный seed: повторные запросы дают одинаковые полосы
+        return Response(simulate(positions, seed=request.user.pk))
+
+
+class InvestorPortfolioSeriesView(APIView):
+    """
+    Дневной временной ряд портфеля инвестора.
+    
+    Query параметры:
+    - ?days=30 - последние N дней включая сегодня (по умолчанию 30, максимум 366)
+    - ?start=2025-01-01&end=2025-03-31 - произвольный диапазон дат (не больше 366 дней)
+    
+    Для каждого дня:
+    - Объём очищенного воздуха (м³) и часы увлажнения - доля портфеля в показателях устройств
+    - Прогнозный доход (USD), начисленный к концу дня
+    
+    Считается одним запросом по дневным итогам устройств, ряд за последние N дней
+    кэшируется для инвестора до изменения его инвестиций.
+    """
+    max_days = 366
+    cache_timeout = 60 * 60
+
+    def get(self, request):
+        from django.core.cache import cache
+        from toolkit.utils.cache import versioned_key
+        from core.utils.portfolio import portfolio_series
+
+        params = request.query_params
+        if 'start' in params or 'end' in params:
+            try:
+                start, end = parse_date(params.get('start') or ''), parse_date(params.get('end') or '')
+            except ValueError:
+                start = end = None
+            if start is None or end is None or not 0 <= (end - start).days < self.max_days:
+                raise ValidationError({'start': f'Invalid date range, up to {self.max_days} days are allowed'})
+            return Response({'start': start, 'end': end, 'series': portfolio_series(request.user.pk, start, end)})
+
+        try:
+            days = int(params.get('days', 30))
+        except ValueError:
+            days = 0
+        if not 0 < days <= self.max_days:
+            raise ValidationError({'days': f'Must be between 1 and {self.max_days}'})
+
+        end = timezone.localdate()
+        start = end - timedelta(days=days - 1)
+        key = versioned_key('portfolio-series', (CACHE_INVESTMENTS,), request.user.pk, f'{start}:{end}')
+        series = cache.get(key)
+        if series is None:
+            series = portfolio_series(request.user.pk, start, end)
+            cache.set(key, series, self.cache_timeout)
+        return Response({'start': start, 'end': end, 'series': series})
+
+
+class AvailableDevicesView(CachedListMixin, ListMixin, BaseView):
     """
     Список доступных устройств для инвестиций.
     
-    Возвращает устройства, в которые можно вложиться.
-    Поддерживает фильтрацию по бюджету через query параметр ?budget=500.
+    Возвращает активные устройства, лимит инвестиций которых ещё не исчерпан.
+    Поддерживает фильтрацию через query параметры:
+    - ?budget=500 - минимальная инвестиция не больше бюджета
+    - ?category=PURIFIER - категория типа устройства
+    - ?city=Tashkent - город помещения устройства
     
     Для каждого устройства отображается:
     - ID устройства и название типа
@@ -75,28 +149,40 @@ class AvailableDevicesView(ListMixin, BaseView):
     - Минимальная и максимальная сумма инвестиции
     - Текущий уровень PM2.5
     - Краткий прогноз доходности
+    
+    Список общий для всех инвесторов и кэшируется целиком до изменения устройств или их типов.
     """
     serializer_class = AvailableDeviceSerializer
-    queryset = DeviceInstance.objects.filter(status=DeviceInstance.STATUS_ACTIVE).select_related('device_type', 'room').prefetch_related('metrics')
+    queryset = DeviceInstance.objects.filter(
+        status=DeviceInstance.STATUS_ACTIVE, funded_usd__lt=F('device_type__max_investment_usd')
+    ).select_related('device_type', 'room').with_last_metric().order_by('id')
     check_retrieve_permission = False  # Отключаем проверку прав, так как это публичный список для инвесторов
+    cache_scopes = (CACHE_AVAILABLE_DEVICES,)
+    # Последние метрики меняются постоянно, поэтому время жизни короткое
+    cache_timeout = 60
+
+    def get_cache_owner(self):
+        return None
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        budget = self.request.query_params.get('budget')
+        params = self.request.query_params
+        budget = params.get('budget')
         if budget:
             try:
-                from decimal import Decimal
-                budget_decimal = Decimal(str(budget))
-                # Фильтруем устройства, у которых минимальная инвестиция меньше или равна бюджету
-                queryset = queryset.filter(
-                    device_type__min_investment_usd__lte=budget_decimal
-                )
-            except (ValueError, TypeError):
-                pass
-        return queryset.distinct()
-
-
-class InvestmentListView(InvestorMixin, ListMixin, CreateMixin, BaseView):
+                budget_decimal = Decimal(budget)
+            except InvalidOperation:
+                raise ValidationError({'budget': 'Invalid number'})
+            # Фильтруем устройства, у которых минимальная инвестиция меньше или равна бюджету
+            queryset = queryset.filter(device_type__min_investment_usd__lte=budget_decimal)
+        if params.get('category'):
+            queryset = queryset.filter(device_type__device_category=params['category'])
+        if params.get('city'):
+            queryset = queryset.filter(room__city__iexact=params['city'])
+        return queryset
+
+
+class InvestmentListView(InvestorMixin, SparseFieldsMixin, ListMixin, CreateMixin, BaseView):
     """
     Список инвестиций инвестора / Создать инвестицию.
     
@@ -106,39 +192,67 @@ class InvestmentListView(InvestorMixin, ListMixin, CreateMixin, BaseView):
     Инвестиция создаётся со статусом PENDING и требует подтверждения оплаты.
     """
     serializer_class = InvestmentSerializer
-    queryset = Investment.objects.select_related('device', 'device__device_type', 'device__room').prefetch_related('stat_snapshots').order_by('-created_at')
+    queryset = Investment.objects.with_stats().order_by('-created_at')
     check_retrieve_permission = False  # Фильтрация по investor обеспечивает безопасность
     check_create_permission = False  # Проверяем только что пользователь - инвестор
 
     def perform_create(self, serializer):
+        from core.utils import funding
+
         serializer.validated_data['investor'] = self.request.user
         serializer.validated_data['status'] = Investment.STATUS_PENDING
-        return serializer.save()
+        with transaction.atomic():
+            # Резерв суммы в лимите устройства одним условным UPDATE, без блокировок
+            if funding.reserve(serializer.validated_data['device_id'], serializer.validated_data['amount_usd']) is None:
+                raise ValidationError({'amount_usd': 'Сумма меньше минимальной инвестиции или превышает доступный лимит устройства'})
+            return serializer.save()
 
 
-class ConfirmPaymentView(APIView):
+class ConfirmPaymentView(IdempotencyMixin, APIView):
     """
     Подтвердить оплату инвестиции (фейковый платёж).
     
     На странице оплаты инвестор нажимает кнопку "Я оплатил".
     Бекенд меняет статус инвестиции с PENDING на PAID и устанавливает дату оплаты.
     Для прототипа это фейковый платёж без реальной интеграции с платёжными системами.
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает сохранённый ответ.
     """
     def post(self, request, pk):
+        # Условный UPDATE: повторное или параллельное подтверждение не пройдёт дважды,
+        # сумма уже зарезервирована в лимите устройства при создании инвестиции
+        updated = Investment.objects.filter(
+            pk=pk, investor=request.user, status=Investment.STATUS_PENDING
+        ).update(status=Investment.STATUS_PAID, paid_at=timezone.now())
+        if not updated:
+            if not Investment.objects.filter(pk=pk, investor=request.user).exists():
+                raise NotFound()
+            raise ValidationError('Investment is not in PENDING status')
+        bump_version(CACHE_INVESTMENTS, request.user.pk)
+
+        investment = Investment.objects.select_related(
+            'device', 'device__device_type', 'device__room'
+        ).prefetch_related(latest_metric_prefetch('device__metrics')).with_stats().get(pk=pk)
+        serializer = InvestmentSerializer(investment)
+        return Response(serializer.data)
+
+
+class CancelInvestmentView(APIView):
+    """
+    Отменить неоплаченную инвестицию.
+    
+    Переводит инвестицию из PENDING в CANCELLED и освобождает её сумму в лимите устройства.
+    """
+    def post(self, request, pk):
+        from core.utils import funding
+
         try:
             investment = Investment.objects.get(pk=pk, investor=request.user)
         except Investment.DoesNotExist:
-            from rest_framework.exceptions import NotFound
             raise NotFound()
-        
-        if investment.status != Investment.STATUS_PENDING:
-            from rest_framework.exceptions import ValidationError
+
+        if not funding.close_pending(investment, Investment.STATUS_CANCELLED):
             raise ValidationError('Investment is not in PENDING status')
-        
-        investment.status = Investment.STATUS_PAID
-        investment.paid_at = timezone.now()
-        investment.save()
-        
-        serializer = InvestmentSerializer(investment)
-        return Response(serializer.data)
+
+        investment.refresh_from_db()
+        return Response(InvestmentSerializer(investment).data)
 
@@ -0,0 +1,79 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.models import DeviceInstance
+from core.utils.telemetry import subscribe
+from users.utils.authentication import CustomTokenAuthentication
+
+
+class CustomerTelemetryStreamView(View):
+    """
+    Живой поток телеметрии устройств клиента (Server-Sent Events).
+
+    Заменяет периодический опрос /customer/devices и /customer/devices/<pk>/metrics.
+    Отправляет события:
+    - metric: новая метрика устройства (формат как в DeviceMetricSerializer)
+    - device: изменение статуса или питания устройства (id, status, is_power_on)
+
+    EventSource не умеет передавать заголовки, поэтому токен можно передать
+    как в заголовке Authorization: Token <key>, так и в query параметре ?token=<key>.
+    ?device=<pk> ограничивает поток одним устройством клиента (чужое устройство - 403).
+    Асинхронный view: обслуживается через ASGI (config/asgi.py), открытый поток не занимает воркер.
+    """
+    heartbeat = 15
+
+    async def get(self, request):
+        user = await self.authenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        device_id = request.GET.get('device')
+        if device_id:
+            try:
+                device_id = int(device_id)
+            except ValueError:
+                return JsonResponse({'detail': 'Not found.'}, status=404)
+            customer_id = await DeviceInstance.objects.filter(pk=device_id).values_list('customer_id', flat=True).afirst()
+            if customer_id is None:
+                return JsonResponse({'detail': 'Not found.'}, status=404)
+            if customer_id != user.id:
+                return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+
+        response = StreamingHttpResponse(self.stream(user.id, device_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def authenticate(self, request):
+        key = request.GET.get('token')
+        header = request.headers.get('Authorization', '').split()
+        if len(header) == 2 and header[0] == 'Token':
+            key = header[1]
+        if not key:
+            return None
+
+        try:
+            user, _ = await sync_to_async(CustomTokenAuthentication().authenticate_credentials)(key)
+        except AuthenticationFailed:
+            return None
+        return user
+
+    async def stream(self, customer_id, device_id=None):
+        yield f'retry: {self.heartbeat * 1000}\n\n'
+        async for message in subscribe(customer_id, heartbeat=self.heartbeat):
+            if message is None:
+                yield ': keep-alive\n\n'
+            else:
+                message = json.loads(message)
+                if device_id and self.device_of(message) != device_id:
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+    @staticmethod
+    def device_of(message):
+        data = message['data']
+        return data['device'] if message['event'] == 'metric' else data['id']
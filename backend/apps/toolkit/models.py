@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import SET_NULL
 
@@ -10,6 +11,84 @@ class BaseModel(models.Model):
     updated_by = models.ForeignKey('users.User', SET_NULL, null=True, blank=True,
                                    related_name='updated_%(model_name)ss')
 
+    # Fields whose values are remembered on load from the DB and after each save,
+    # so has_changed() and changed_fields work without a pre-save SELECT.
+    tracked_fields = ()
+
     class Meta:
         abstract = True
         ordering = ('id',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Hot path for every loaded row: models without tracked fields skip tracking entirely
+        if cls.tracked_fields:
+            instance._remember_tracked()
+        return instance
+
+    def _remember_tracked(self, names=None):
+        if not self.tracked_fields:
+            return
+        deferred = self.get_deferred_fields()
+        original = self.__dict__.setdefault('_tracked_original', {})
+        for name in self.tracked_fields if names is None else names:
+            attname = self._meta.get_field(name).attname
+            if attname not in deferred:
+                original[name] = getattr(self, attname)
+
+    def has_changed(self, name):
+        """
+        True if the tracked field differs from the value loaded from the DB.
+        Unsaved instances and deferred fields have no known original and count as changed.
+        """
+        original = self.__dict__.get('_tracked_original', {})
+        if name not in original:
+            return True
+        return original[name] != getattr(self, self._meta.get_field(name).attname)
+
+    @property
+    def changed_fields(self):
+        return [name for name in self.tracked_fields if self.has_changed(name)]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._remember_tracked()
+        else:
+            self._remember_tracked([name for name in self.tracked_fields if name in update_fields])
+
+    def save_changed(self, *extra_fields):
+        """
+        Writes only the changed tracked fields (plus extra_fields and updated_at).
+        Returns False without a query when nothing has changed.
+        """
+        if self._state.adding:
+            self.save()
+            return True
+        changed = self.changed_fields
+        if not changed and not extra_fields:
+            return False
+        self.save(update_fields=[*changed, *extra_fields, 'updated_at'])
+        return True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_tracked(None if fields is None else [name for name in self.tracked_fields if name in fields])
+
+
+class IdempotencyKey(models.Model):
+    """
+    Durable copy of a response stored by toolkit.views.IdempotencyMixin,
+    used when the cache entry has been evicted or the cache is unavailable.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'toolkit_idempotency_keys'
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from toolkit.utils import idempotency
+
+
+@shared_task
+def purge_idempotency_keys():
+    return idempotency.purge_expired()
@@ -0,0 +1,46 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(scope, owner=None):
+    return f'version:{scope}' if owner is None else f'version:{scope}:{owner}'
+
+
+def get_versions(scopes, owner=None):
+    """
+    Returns current version tokens of the given scopes in one cache round trip.
+    Missing versions are created, so entries cached before an eviction are never reused.
+    """
+    keys = [version_key(scope, owner) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(scope, *owners):
+    """
+    Invalidates everything cached under the scope (for every given owner) by switching its version.
+    Called on transaction commit, so readers never cache data of an uncommitted state.
+    """
+    if owners:
+        keys = [version_key(scope, owner) for owner in set(owners) if owner is not None]
+    else:
+        keys = [version_key(scope)]
+
+    def bump():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    if keys:
+        transaction.on_commit(bump)
+
+
+def versioned_key(prefix, scopes, owner=None, extra=''):
+    versions = ':'.join(str(version) for version in get_versions(scopes, owner))
+    digest = hashlib.md5(extra.encode()).hexdigest()
+    return f'{prefix}:{owner}:{versions}:{digest}'
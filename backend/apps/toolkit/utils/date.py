@@ -1,7 +1,10 @@
+import re
 from calendar import monthrange
 from datetime import date
 
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
 
 months = {
     1: 'Январь',
@@ -33,3 +36,23 @@ def add_months(source_date, extra):
     month = month % 12 + 1
     day = min(source_date.day, monthrange(year, month)[1])
     return date(year, month, day)
+
+
+def parse_since(value):
+    """
+    Parses ?since=<ISO datetime> query parameter, returns aware datetime or None.
+    "+" of the UTC offset often arrives decoded as a space, so it is restored.
+    """
+    if not value:
+        return None
+
+    try:
+        since = parse_datetime(re.sub(r'(:\d{2}(?:\.\d+)?) (\d{2}:?\d{2})$', r'\1+\2', value))
+    except ValueError:
+        since = None
+    if since is None:
+        raise ValidationError({'since': 'Invalid datetime, ISO 8601 expected.'})
+
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
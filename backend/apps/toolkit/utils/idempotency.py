@@ -0,0 +1,57 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from toolkit.models import IdempotencyKey
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method}:{request.path}:{body}'.encode()).hexdigest()
+
+
+def get_stored(key):
+    """
+    Returns the stored {'hash', 'status', 'data'} of a key: from the cache,
+    or from the database when the cache entry is gone.
+    """
+    stored = cache.get(f'idempotency:{key}')
+    if stored is not None:
+        return stored
+
+    record = IdempotencyKey.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+    if record is None:
+        return None
+    stored = {'hash': record.request_hash, 'status': record.status_code, 'data': record.response}
+    cache.set(f'idempotency:{key}', stored, max(int((record.expires_at - timezone.now()).total_seconds()), 1))
+    return stored
+
+
+def store(key, hash_, status, data, timeout):
+    IdempotencyKey.objects.update_or_create(key=key, defaults={
+        'request_hash': hash_,
+        'status_code': status,
+        'response': data,
+        'expires_at': timezone.now() + timedelta(seconds=timeout),
+    })
+    cache.set(f'idempotency:{key}', {'hash': hash_, 'status': status, 'data': data}, timeout)
+
+
+def acquire_lock(key, timeout):
+    """
+    True if the lock is taken by this request, False if another request holds it.
+    None when the cache is unavailable (DJANGO_REDIS_IGNORE_EXCEPTIONS) - the request runs unlocked.
+    """
+    return cache.add(f'idempotency-lock:{key}', 1, timeout)
+
+
+def release_lock(key):
+    cache.delete(f'idempotency-lock:{key}')
+
+
+def purge_expired():
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
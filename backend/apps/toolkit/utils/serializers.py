@@ -1,4 +1,29 @@
-from rest_framework.serializers import Serializer, ModelSerializer
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+from rest_framework.serializers import ListSerializer, Serializer, ModelSerializer
+
+
+def _split_param(value):
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def sparse_params(request):
+    """
+    Returns (fields, expand) sets from ?fields= and ?expand= of a GET request,
+    or None when the request does not use sparse fieldsets.
+    """
+    if request is None or request.method != 'GET':
+        return None
+    params = request.query_params
+    if 'fields' not in params and 'expand' not in params:
+        return None
+
+    expand = set()
+    for path in _split_param(params.get('expand', '')):
+        # Раскрытие вложенного поля раскрывает и всех его родителей
+        parts = path.split('.')
+        expand.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return _split_param(params.get('fields', '')), expand
 
 
 class BaseSerializer(Serializer):
@@ -19,4 +44,87 @@ class BaseSerializer(Serializer):
 
 
 class BaseModelSerializer(ModelSerializer):
-    ...
+    """
+    Supports sparse fieldsets for GET requests (paths are dotted from the root serializer):
+    - ?fields=id,status,order.id - keeps only the listed fields; a nested field listed
+      without its own sub-fields is kept whole
+    - ?expand=order,order.devices - once a request uses ?fields or ?expand, fields from
+      Meta.expandable_fields are rendered as primary keys unless expanded (or their
+      sub-fields are requested); requests without both parameters are rendered in full
+
+    Fields are pruned in get_fields(), so SerializerMethodFields of dropped subtrees never run.
+    Meta.prefetch_fields maps a field name to a function of the lookup prefix returning extra
+    prefetch lookups it needs; related_lookups() collects them for toolkit.views.SparseFieldsMixin.
+    """
+
+    @property
+    def field_path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return '.'.join(reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        params = sparse_params(self.context.get('request'))
+        if params is None:
+            return fields
+
+        requested, expand = params
+        prefix = f'{self.field_path}.' if self.field_path else ''
+        own = {path[len(prefix):].split('.')[0] for path in requested if path.startswith(prefix)}
+        if own:
+            fields = {name: field for name, field in fields.items() if name in own}
+
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            path = prefix + name
+            if name not in fields or path in expand or any(item.startswith(f'{path}.') for item in requested):
+                continue
+            field = fields[name]
+            kwargs = {'source': field.source} if field.source and field.source != name else {}
+            fields[name] = PrimaryKeyRelatedField(many=isinstance(field, ListSerializer), read_only=True, **kwargs)
+        return fields
+
+
+def related_lookups(serializer, prefix='', many=False):
+    """
+    Returns (select_related, prefetch_related) lookups needed to render the serializer's
+    current fields. Relations below a to-many relation are prefetched, to-one relations
+    above it are joined.
+    """
+    select, prefetch = [], []
+    model = serializer.Meta.model
+    extra = getattr(serializer.Meta, 'prefetch_fields', {})
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in extra:
+            prefetch.extend(extra[name](prefix))
+
+        nested = field.child if isinstance(field, ListSerializer) else field
+        if not isinstance(nested, (BaseModelSerializer, RelatedField, ManyRelatedField)) or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        path = prefix + field.source
+        to_many = model_field.many_to_many or model_field.one_to_many
+        if isinstance(field, PrimaryKeyRelatedField) and not to_many:
+            # Первичный ключ берётся из <field>_id без запроса
+            continue
+        (prefetch if many or to_many else select).append(path)
+
+        if isinstance(nested, BaseModelSerializer):
+            nested_select, nested_prefetch = related_lookups(nested, f'{path}__', many or to_many)
+            select.extend(nested_select)
+            prefetch.extend(nested_prefetch)
+
+    return select, prefetch
@@ -1,12 +1,17 @@
 from time import sleep
 
-from rest_framework.exceptions import PermissionDenied
+from django.core.cache import cache
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.mixins import CreateModelMixin, ListModelMixin
 from rest_framework.mixins import RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from toolkit.utils import idempotency
+from toolkit.utils.cache import versioned_key
+from toolkit.utils.serializers import related_lookups
+
 
 class BaseAPIView(APIView):
     ...
@@ -61,6 +66,142 @@ class ListMixin(ListModelMixin):
         }))
 
 
+class CachedListMixin:
+    """
+    Caches list responses per user and query string.
+    Entries are invalidated by toolkit.utils.cache.bump_version() on any of cache_scopes.
+    """
+    cache_scopes = ()
+    cache_timeout = 60 * 10
+
+    def get_cache_owner(self):
+        return self.request.user.pk
+
+    def get_cache_key(self):
+        prefix = f'list:{type(self).__name__}'
+        return versioned_key(prefix, self.cache_scopes, self.get_cache_owner(), self.request.get_full_path())
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_cache_key()
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+
+class IdempotentReplay(Exception):
+    def __init__(self, stored):
+        self.stored = stored
+
+
+class IdempotencyConflict(APIException):
+    status_code = 409
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_conflict'
+
+
+class IdempotencyMixin:
+    """
+    Supports the Idempotency-Key header on POST requests.
+    The first response (except 5xx) is stored per user, view and key for idempotency_timeout;
+    a retry with the same key and body gets it back without running the handler.
+    The same key with a different body is rejected, a concurrent duplicate waits
+    up to idempotency_wait seconds for the first request and then gets 409.
+    """
+    idempotency_header = 'Idempotency-Key'
+    idempotency_timeout = 60 * 60 * 24
+    idempotency_lock_timeout = 30
+    idempotency_wait = 5
+    idempotency_poll_interval = 0.1
+
+    def dispatch(self, request, *args, **kwargs):
+        self.idempotency_key = None
+        self.idempotency_lock = None
+        self.idempotency_runs = False
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.idempotency_lock:
+                idempotency.release_lock(self.idempotency_key)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        header = request.headers.get(self.idempotency_header)
+        if request.method != 'POST' or not header:
+            return
+
+        self.idempotency_key = f'{type(self).__name__}:{request.user.pk}:{header[:128]}'
+        self.idempotency_hash = idempotency.request_hash(request)
+        stored = idempotency.get_stored(self.idempotency_key)
+        if stored is None:
+            self.idempotency_lock = idempotency.acquire_lock(self.idempotency_key, self.idempotency_lock_timeout)
+            if self.idempotency_lock is False:
+                stored = self.wait_for_stored()
+            else:
+                # The first request may have stored its response and released the lock
+                # between get_stored() and acquire_lock(), so check again under the lock
+                stored = idempotency.get_stored(self.idempotency_key)
+        if stored is None:
+            # Without the cache (lock is None) the request runs unlocked, the response is still stored in the DB
+            self.idempotency_runs = True
+            return
+
+        if stored['hash'] != self.idempotency_hash:
+            raise ValidationError({'idempotency_key': 'Key was already used with a different request.'})
+        raise IdempotentReplay(stored)
+
+    def wait_for_stored(self):
+        deadline = self.idempotency_wait
+        while deadline > 0:
+            sleep(self.idempotency_poll_interval)
+            deadline -= self.idempotency_poll_interval
+            stored = idempotency.get_stored(self.idempotency_key)
+            if stored is not None:
+                return stored
+        raise IdempotencyConflict()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentReplay):
+            return Response(exc.stored['data'], status=exc.stored['status'], headers={'Idempotent-Replayed': 'true'})
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.idempotency_runs and response.status_code < 500 and hasattr(response, 'data'):
+            idempotency.store(
+                self.idempotency_key, self.idempotency_hash, response.status_code,
+                response.data, self.idempotency_timeout
+            )
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    Loads only the relations needed by the fields left after ?fields= / ?expand=
+    (see toolkit.utils.serializers.BaseModelSerializer). The view queryset should not
+    select or prefetch serialized relations itself.
+    """
+
+    def get_related_lookups(self):
+        # Views are instantiated per request, so the lookups are computed once per request
+        if not hasattr(self, '_related_lookups'):
+            self._related_lookups = related_lookups(self.get_serializer_class()(context=self.get_serializer_context()))
+        return self._related_lookups
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        select, prefetch = self.get_related_lookups()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
 class RetrieveMixin(RetrieveModelMixin):
     check_retrieve_permission = True
 
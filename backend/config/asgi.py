@@ -3,6 +3,12 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serves async views such as the customer telemetry SSE stream
+(core.views.stream), so a single uvicorn process can hold thousands of
+open streams:
+
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8000
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -13,6 +13,8 @@ import os
 import sys
 from pathlib import Path
 
+from celery.schedules import crontab
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -115,6 +117,40 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# CACHE
+# Redis-кэш ответов клиентских дашбордов (см. toolkit.views.CachedListMixin)
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://localhost:6379/1'),
+        'KEY_PREFIX': 'freshair',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 1,
+            'SOCKET_TIMEOUT': 1,
+        },
+    }
+}
+# Недоступный Redis не должен ронять API - запросы просто идут мимо кэша
+DJANGO_REDIS_IGNORE_EXCEPTIONS = True
+
+if TESTING:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Redis pub/sub для живой телеметрии (SSE, см. core.utils.telemetry)
+TELEMETRY_REDIS_URL = os.environ.get('TELEMETRY_REDIS_URL', 'redis://localhost:6379/2')
+
+# Платёжный шлюз (core.utils.payment_gateway): 'stub' - без сети, 'http' - HTTP API процессора
+PAYMENT_GATEWAY = {
+    'BACKEND': os.environ.get('PAYMENT_GATEWAY_BACKEND', 'stub'),
+    'URL': os.environ.get('PAYMENT_GATEWAY_URL', 'http://localhost:8090'),
+    'API_KEY': os.environ.get('PAYMENT_GATEWAY_API_KEY', ''),
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'RETRIES': 2,
+    'POOL_SIZE': 10,
+}
+
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 CELERY_ACCEPT_CONTENT = ['json']
@@ -123,6 +159,42 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Samarkand'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_IMPORTS = []
+# В тестах задачи выполняются синхронно, без брокера
+CELERY_TASK_ALWAYS_EAGER = TESTING
+CELERY_BEAT_SCHEDULE = {
+    'compute-investment-snapshots': {
+        'task': 'core.tasks.compute_investment_snapshots',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'expire-pending-investments': {
+        'task': 'core.tasks.expire_pending_investments',
+        'schedule': crontab(minute=15),
+    },
+    'rollup-device-daily-stats': {
+        'task': 'core.tasks.rollup_device_daily_stats',
+        'schedule': crontab(minute=5),
+    },
+    'bill-due-subscriptions': {
+        'task': 'core.tasks.bill_due_subscriptions',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'retry-subscription-payments': {
+        'task': 'core.tasks.retry_subscription_payments',
+        'schedule': crontab(minute=45),
+    },
+    'reconcile-order-payments': {
+        'task': 'core.tasks.reconcile_order_payments',
+        'schedule': crontab(minute='*/5'),
+    },
+    'relay-outbox': {
+        'task': 'core.tasks.relay_outbox',
+        'schedule': crontab(),
+    },
+    'purge-idempotency-keys': {
+        'task': 'toolkit.tasks.purge_idempotency_keys',
+        'schedule': crontab(hour=4, minute=30),
+    },
+}
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/